@@ -0,0 +1,59 @@
+"""
+IP geolocation: lookups in a compiled database of synthetic ranges.
+
+    cd url_shortener && python benchmarks/bench_geoip.py [ranges]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "url_shortener.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from shortcode.geoip import GeoIPDatabase, compile_database  # noqa: E402
+
+LOOKUPS = 200000
+COUNTRIES = ["MX", "US", "CA", "BR", "AR", "CO", "ES", "DE", "FR", "JP"]
+
+
+def synthetic_ranges(count, seed=0):
+    rng = random.Random(seed)
+    starts = sorted(rng.sample(range(1 << 32), count))
+    for start, end in zip(starts, starts[1:] + [1 << 32]):
+        country = rng.choice(COUNTRIES)
+        yield start, end - 1, country, f"Region {rng.randrange(32)}"
+
+
+def main(count):
+    rng = random.Random(1)
+    ips = [".".join(str(rng.randrange(256)) for _ in range(4)) for _ in range(LOOKUPS)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "geoip.db")
+        start = time.perf_counter()
+        compile_database(synthetic_ranges(count), path)
+        compiled = time.perf_counter() - start
+        database = GeoIPDatabase(path)
+        print(
+            f"{count} ranges compiled in {compiled:.2f}s, "
+            f"{os.path.getsize(path) // 1024} KB shared by all workers"
+        )
+        keys = iter(ips * 4)
+        seconds = min(
+            timeit.repeat(lambda: database.lookup(next(keys)), number=LOOKUPS, repeat=3)
+        )
+        print(
+            f"lookup: {seconds / LOOKUPS * 1e6:.2f} us, "
+            f"{LOOKUPS / seconds:,.0f} lookups/s per process"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000000)
@@ -0,0 +1,89 @@
+"""
+CPU cost per response of the JSON layer of the shortcode API: DRF defaults
+against shortcode.renderers.
+
+    cd url_shortener && python benchmarks/bench_json.py
+"""
+import os
+import sys
+import timeit
+from datetime import date
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "url_shortener.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.negotiation import DefaultContentNegotiation  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from shortcode import renderers  # noqa: E402
+
+TARGET = "https://shop.example.com/products/item/42?utm_campaign=spring&utm_source=mail"
+RESOLVE = {"url": TARGET}
+CREATE = {
+    "url": {
+        "description": "Spring campaign",
+        "shortcode": "Q7KZ2M",
+        "fullname": TARGET,
+        "name": TARGET.partition("?")[0],
+        "query_params": TARGET.partition("?")[2],
+        "expiration": date(2022, 3, 20),
+        "id": 1234567,
+    },
+    "is_new": True,
+}
+CREATE_BODY = b'{"description": "Spring campaign", "url": "' + TARGET.encode() + b'"}'
+
+
+def measure(name, function, number=100000):
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    print(f"{name:<48}{seconds / number * 1e6:>8.2f} us")
+
+
+def main():
+    print(f"orjson: {'yes' if renderers.orjson else 'no (stdlib json)'}")
+    drf_renderer, fast_renderer = JSONRenderer(), renderers.FastJSONRenderer()
+
+    print("\nresolve response")
+    measure("JSONRenderer", lambda: drf_renderer.render(RESOLVE))
+    measure("FastJSONRenderer", lambda: fast_renderer.render(RESOLVE))
+    measure(
+        "pre-encoded template",
+        lambda: renderers.RESOLVE_TEMPLATE % renderers.dumps(TARGET),
+    )
+
+    print("\ncreate response")
+    measure("JSONRenderer", lambda: drf_renderer.render(CREATE))
+    measure("FastJSONRenderer", lambda: fast_renderer.render(CREATE))
+
+    print("\ncreate body")
+    drf_parser, fast_parser = JSONParser(), renderers.FastJSONParser()
+    measure("JSONParser", lambda: drf_parser.parse(BytesIO(CREATE_BODY)))
+    measure("FastJSONParser", lambda: fast_parser.parse(BytesIO(CREATE_BODY)))
+
+    print("\nnegotiation (Accept: */*)")
+    request = Request(APIRequestFactory().get("/Q7KZ2M", HTTP_ACCEPT="*/*"))
+    choices = [JSONRenderer(), BrowsableAPIRenderer()]
+    fast_choices = [fast_renderer, BrowsableAPIRenderer()]
+    drf_negotiation = DefaultContentNegotiation()
+    fast_negotiation = renderers.FastJSONNegotiation()
+    measure(
+        "DefaultContentNegotiation",
+        lambda: drf_negotiation.select_renderer(request, choices),
+    )
+    measure(
+        "FastJSONNegotiation",
+        lambda: fast_negotiation.select_renderer(request, fast_choices),
+    )
+
+
+if __name__ == "__main__":
+    main()
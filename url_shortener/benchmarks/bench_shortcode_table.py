@@ -0,0 +1,98 @@
+"""
+Shortcode lookups: shared shortcode table against a per-process dict cache
+and the database (a throwaway SQLite database with generated URLs).
+
+    cd url_shortener && python benchmarks/bench_shortcode_table.py [urls]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "url_shortener.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from shortcode.dataset import DatasetGenerator, batches  # noqa: E402
+from shortcode.models import URL  # noqa: E402
+from shortcode.shortcode_table import ShortcodeTable, write_table  # noqa: E402
+
+LOOKUPS = 20000
+
+
+def measure(name, function, keys, number=LOOKUPS):
+    keys = iter(keys)
+    seconds = min(timeit.repeat(lambda: function(next(keys)), number=number, repeat=3))
+    print(f"{name:<40}{seconds / number * 1e6:>10.2f} us")
+
+
+def main(count):
+    connection.creation.create_test_db(verbosity=0)
+    generator = DatasetGenerator(expired_ratio=0)
+    for batch in batches(generator.urls(count), 5000):
+        URL.objects.bulk_create(batch)
+    shortcodes = list(URL.objects.values_list("shortcode", flat=True))
+    keys = [random.choice(shortcodes) for _ in range(LOOKUPS * 4)]
+    urls = URL.objects.resolvable(timezone.now().date()).select_related("host")
+
+    def warm_cache():
+        return {
+            url.shortcode: (url.pk, url.fullname, url.expiration)
+            for url in urls.iterator(chunk_size=2000)
+        }
+
+    start = time.perf_counter()
+    cache = warm_cache()
+    warmed = time.perf_counter() - start
+    tracemalloc.start()
+    measured = warm_cache()
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+    print(f"{count} URLs")
+    print(
+        f"dict cache: warmed in {warmed:.2f}s by every worker, "
+        f"{dict_bytes // 1024} KB in every worker"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "shortcodes.table")
+        start = time.perf_counter()
+        write_table(
+            path,
+            (
+                (url.pk, url.shortcode, url.fullname, url.expiration)
+                for url in urls.iterator(chunk_size=2000)
+            ),
+        )
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        table = ShortcodeTable(path)
+        print(
+            f"shortcode table: loaded once in {loaded:.2f}s, mapped in "
+            f"{(time.perf_counter() - start) * 1e3:.2f}ms, "
+            f"{os.path.getsize(path) // 1024} KB shared by all workers\n"
+        )
+
+        measure("shortcode table", table.get, keys)
+        measure("dict cache", cache.get, keys)
+        measure(
+            "database",
+            lambda shortcode: URL.objects.get(shortcode=shortcode),
+            keys,
+            number=LOOKUPS // 10,
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
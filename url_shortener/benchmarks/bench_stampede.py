@@ -0,0 +1,94 @@
+"""
+Stampede of lookups of one shortcode: concurrent threads resolving it with
+and without single flight, against a throwaway SQLite
+database whose queries take `latency` ms (a loaded database).
+
+    cd url_shortener && python benchmarks/bench_stampede.py [clients] [latency]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "url_shortener.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from shortcode.dataset import DatasetGenerator  # noqa: E402
+from shortcode.models import URL  # noqa: E402
+from shortcode.serializers import RecoverURLSerializer  # noqa: E402
+
+
+class SlowDatabase:
+    """
+    Execute wrapper counting the queries and delaying them `latency` seconds
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries += 1
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+
+def lookup(shortcode):
+    serializer = RecoverURLSerializer(data={"shortcode": shortcode})
+    serializer.is_valid(raise_exception=True)
+    return serializer
+
+
+def threads_stampede(shortcode, clients, database):
+    barrier = threading.Barrier(clients)
+
+    def client():
+        serializer = lookup(shortcode)
+        with connection.execute_wrapper(database):
+            barrier.wait()
+            serializer.get_url()
+        connection.close()
+
+    workers = [threading.Thread(target=client) for _ in range(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def measure(name, stampede, shortcode, clients, latency):
+    for enabled in (False, True):
+        database = SlowDatabase(latency)
+        with override_settings(SINGLE_FLIGHT={"ENABLED": enabled, "TIMEOUT": 2}):
+            start = time.perf_counter()
+            stampede(shortcode, clients, database)
+            seconds = time.perf_counter() - start
+        label = f"{name}, {'single flight' if enabled else 'no coalescing'}"
+        print(f"{label:<36}{database.queries:>6} queries{seconds * 1e3:>10.1f} ms")
+
+
+def main(clients, latency):
+    connection.creation.create_test_db(verbosity=0)
+    URL.objects.bulk_create(DatasetGenerator(expired_ratio=0).urls(1))
+    shortcode = URL.objects.get().shortcode
+    print(
+        f"{clients} clients resolving one shortcode, {latency * 1e3:.0f} ms per query"
+    )
+    measure("threads", threads_stampede, shortcode, clients, latency)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        float(sys.argv[2]) / 1e3 if len(sys.argv) > 2 else 0.02,
+    )
@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+"""Kinds of requests, resolves have priority over creates"""
+RESOLVE = "resolve"
+CREATE = "create"
+
+
+class Saturated(APIException):
+    """
+    Too many requests in flight: 503 with Retry-After
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service saturated, try again later."
+    default_code = "saturated"
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second with bursts up to `burst`.
+    The lock only guards a few arithmetic operations.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Takes a token. Returns 0 if it was taken, else the seconds until there is one
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class ClientBuckets:
+    """
+    A token bucket per client, bounded to `max_clients` (the oldest are dropped).
+    The lock guards the dict, buckets have their own.
+    """
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, client):
+        with self.lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                if len(self.buckets) >= self.max_clients:
+                    self.evict()
+                bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+        return bucket.take()
+
+    def evict(self):
+        """
+        Drops the oldest half of the clients (dicts keep insertion order), the
+        lock must be held
+        """
+        for client in list(self.buckets)[: self.max_clients // 2]:
+            self.buckets.pop(client, None)
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the requests doing DB work at the same time. When every slot is
+    taken requests wait in a bounded queue, resolves first; creates can't
+    use the last `reserved` slots, which are kept for resolves.
+    """
+
+    def __init__(self, max_in_flight, max_queue, reserved):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.reserved = reserved
+        self.in_flight = 0
+        self.waiting = Counter()
+        self.condition = threading.Condition()
+
+    def can_enter(self, kind):
+        if kind == CREATE:
+            if self.waiting[RESOLVE]:
+                return False
+            return self.in_flight < self.max_in_flight - self.reserved
+        return self.in_flight < self.max_in_flight
+
+    def acquire(self, kind, timeout):
+        """
+        Takes a slot. Returns None if it was taken, else why it wasn't (queue_full or timeout)
+        """
+        with self.condition:
+            if self.can_enter(kind):
+                self.in_flight += 1
+                return None
+            if sum(self.waiting.values()) >= self.max_queue:
+                return "queue_full"
+            self.waiting[kind] += 1
+            try:
+                if not self.condition.wait_for(lambda: self.can_enter(kind), timeout):
+                    return "timeout"
+                self.in_flight += 1
+                return None
+            finally:
+                self.waiting[kind] -= 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            if self.waiting[RESOLVE] or self.waiting[CREATE]:
+                self.condition.notify_all()
+
+
+class AdmissionController:
+    """
+    Per-client and global token buckets by kind of request and the concurrency
+    limiter shared by all of them, configured by ADMISSION_CONTROL
+    """
+
+    def __init__(self, config):
+        self.enabled = config["ENABLED"]
+        self.queue_timeout = config["QUEUE_TIMEOUT"]
+        self.client_buckets = {}
+        self.global_buckets = {}
+        for kind in (RESOLVE, CREATE):
+            limits = config[kind.upper()]
+            self.client_buckets[kind] = ClientBuckets(
+                limits["CLIENT_RATE"], limits["CLIENT_BURST"], config["MAX_CLIENTS"]
+            )
+            self.global_buckets[kind] = TokenBucket(
+                limits["GLOBAL_RATE"], limits["GLOBAL_BURST"]
+            )
+        self.limiter = ConcurrencyLimiter(
+            config["MAX_IN_FLIGHT"],
+            config["MAX_QUEUE"],
+            config["RESERVED_FOR_RESOLVES"],
+        )
+        self.counters = Counter()
+
+    def count(self, kind, outcome):
+        """
+        Counters are approximate under contention, they aren't locked
+        """
+        self.counters[f"{kind}.{outcome}"] += 1
+
+    def stats(self):
+        return {
+            "in_flight": self.limiter.in_flight,
+            "waiting": sum(self.limiter.waiting.values()),
+            "counters": dict(self.counters),
+        }
+
+
+_controller = None
+
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(settings.ADMISSION_CONTROL)
+    return _controller
+
+
+def reset_controller(setting, **kwargs):
+    """
+    Rebuilds the controller when ADMISSION_CONTROL changes (tests)
+    """
+    global _controller
+    if setting == "ADMISSION_CONTROL":
+        _controller = None
+
+
+setting_changed.connect(reset_controller)
+
+
+class AdmissionThrottle(BaseThrottle):
+    """
+    Token buckets of the client and of all clients for the kind of request of a
+    view (429 when one is empty). The global bucket is only used by clients
+    within their own rate, so a bot can't drain it for everyone else.
+    Clients are keyed by REMOTE_ADDR: X-Forwarded-For is set by the client
+    unless a proxy rewrites it, so it would give a bot a fresh bucket per request
+    """
+
+    def get_client(self, request):
+        return request.META.get("REMOTE_ADDR")
+
+    def allow_request(self, request, view):
+        controller = get_controller()
+        if not controller.enabled:
+            return True
+        kind = view.admission_kind
+        self.wait_time = controller.client_buckets[kind].take(self.get_client(request))
+        if self.wait_time:
+            controller.count(kind, "shed_client")
+            return False
+        self.wait_time = controller.global_buckets[kind].take()
+        if self.wait_time:
+            controller.count(kind, "shed_global")
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class AdmissionControlMixin:
+    """
+    APIView mixin: rate limits by client and globally, then waits for a slot of
+    the concurrency limiter before running the handler (503 if there isn't one)
+    """
+
+    admission_kind = RESOLVE
+    throttle_classes = [AdmissionThrottle]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        controller = get_controller()
+        if not controller.enabled:
+            return
+        refused = controller.limiter.acquire(
+            self.admission_kind, controller.queue_timeout
+        )
+        if refused:
+            controller.count(self.admission_kind, f"shed_{refused}")
+            raise Saturated(wait=1)
+        self.admission_controller = controller
+        controller.count(self.admission_kind, "admitted")
+
+    def dispatch(self, request, *args, **kwargs):
+        self.admission_controller = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.admission_controller is not None:
+                self.admission_controller.limiter.release()
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def create_tracking_partitions(sender, using, **kwargs):
+    """
+    Creates the Tracking partitions ahead of time after every migrate
+    """
+    from shortcode.partitions import ensure_partitions
+
+    ensure_partitions(using=using)
 
 
 class ShortcodeConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'shortcode'
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "shortcode"
+
+    def ready(self):
+        from shortcode.invalidation import url_changed
+        from shortcode.models import url_deleted
+
+        post_migrate.connect(create_tracking_partitions, sender=self)
+        URL = self.get_model("URL")
+        post_save.connect(url_changed, sender=URL)
+        post_delete.connect(url_changed, sender=URL)
+        post_delete.connect(url_deleted, sender=URL)
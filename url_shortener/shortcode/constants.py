@@ -2,3 +2,7 @@
 URL_REGEX = "^https?:\/\/(.*){1,}"
 """Regex to separate queryparams (name)=(abc) """
 QUERY_PARAMS_REGEX = "(.*)=(.*)"
+"""Regex to get the scheme and host of an URL (https://test.com)"""
+HOST_REGEX = "^https?:\/\/[^\/?#]+"
+"""Regex of the characters an URL can't have (control characters)"""
+URL_FORBIDDEN_REGEX = "[\\x00-\\x1f\\x7f]"
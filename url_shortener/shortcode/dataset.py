@@ -0,0 +1,207 @@
+import random
+import string
+from datetime import date, datetime, time, timedelta, timezone
+
+from shortcode.models import URL, Tracking
+
+"""Characters and length of the generated shortcodes (same as the random ones of /create)"""
+SHORTCODE_CHARS = string.ascii_uppercase + string.digits
+SHORTCODE_LENGTH = 6
+SHORTCODE_SPACE = len(SHORTCODE_CHARS) ** SHORTCODE_LENGTH
+"""Odd and not multiple of 3, so it's coprime with SHORTCODE_SPACE (2^12 * 3^12)"""
+SHORTCODE_MULTIPLIER = 1_000_000_007
+"""Prime bigger than any number of URLs, used to scatter the popular ones"""
+RANK_MULTIPLIER = 2_147_483_647
+"""Bits of the URL index in the seed of its random generators"""
+INDEX_BITS = 40
+"""Random streams of an URL, so its expiration doesn't repeat its fullname choices"""
+FULLNAME_STREAM = 0
+EXPIRATION_STREAM = 1
+
+HOST_WORDS = ("shop", "news", "blog", "docs", "media", "travel", "bank", "cdn")
+HOST_TLDS = (".com", ".com", ".com", ".net", ".org", ".io", ".mx", ".co.uk")
+PATH_WORDS = (
+    "products",
+    "article",
+    "2022",
+    "category",
+    "item",
+    "search",
+    "user",
+    "images",
+    "view",
+    "landing",
+)
+PARAM_NAMES = (
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "ref",
+    "id",
+    "page",
+    "q",
+    "lang",
+    "session",
+    "token",
+)
+
+
+def zipf_rank(rng, n, skew):
+    """
+    Returns a rank in [0, n) following a Zipf law of exponent `skew`, sampled
+    from its continuous approximation so nothing is kept per rank
+    """
+    u = rng.random()
+    if abs(skew - 1) < 1e-9:
+        rank = n**u
+    else:
+        exponent = 1 - skew
+        rank = ((n**exponent - 1) * u + 1) ** (1 / exponent)
+    return min(int(rank) - 1, n - 1)
+
+
+class DatasetGenerator:
+    """
+    Generates URL and Tracking rows deterministically from a seed. Every URL
+    depends only on the seed and its index, so rows are streamed (and a
+    duplicate rebuilds the URL it repeats) without keeping anything in memory.
+
+    hosts: number of distinct hosts, chosen with a Zipf law of exponent host_skew
+    params_ratio: share of URLs with queryparams (1 to max_params)
+    long_query_ratio: share of URLs with queryparams long enough to be compressed
+    duplicate_ratio: share of URLs repeating the fullname of a previous one
+    expired_ratio: share of URLs already expired, the rest expire within expiration_days
+    """
+
+    def __init__(
+        self,
+        seed=0,
+        hosts=1000,
+        host_skew=1.1,
+        params_ratio=0.5,
+        max_params=6,
+        long_query_ratio=0.01,
+        duplicate_ratio=0.05,
+        expired_ratio=0.1,
+        expiration_days=365,
+        today=None,
+    ):
+        self.seed = seed
+        self.hosts = hosts
+        self.host_skew = host_skew
+        self.params_ratio = params_ratio
+        self.max_params = max_params
+        self.long_query_ratio = long_query_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.expired_ratio = expired_ratio
+        self.expiration_days = expiration_days
+        self.today = today or date.today()
+        self.host_names = {}
+
+    def random(self, index, stream=FULLNAME_STREAM):
+        return random.Random((((self.seed << 1) | stream) << INDEX_BITS) | index)
+
+    def host(self, number):
+        """
+        Returns the name of the host `number`, kept since there are few of them
+        """
+        name = self.host_names.get(number)
+        if name is None:
+            rng = random.Random(f"{self.seed}:host:{number}")
+            scheme = "http" if rng.random() < 0.1 else "https"
+            subdomain = "www." if rng.random() < 0.5 else ""
+            word = rng.choice(HOST_WORDS)
+            name = f"{scheme}://{subdomain}{word}{number}{rng.choice(HOST_TLDS)}"
+            self.host_names[number] = name
+        return name
+
+    def fullname(self, index):
+        """
+        Returns the fullname of the URL `index`, with its queryparams sorted
+        like /create does
+        """
+        rng = self.random(index)
+        while index and rng.random() < self.duplicate_ratio:
+            index = rng.randrange(index)
+            rng = self.random(index)
+
+        host = self.host(zipf_rank(rng, self.hosts, self.host_skew))
+        path = "/".join(rng.choices(PATH_WORDS, k=rng.randint(0, 4)))
+        fullname = f"{host}/{path}/{index:x}" if path else f"{host}/{index:x}"
+
+        params = {}
+        if rng.random() < self.long_query_ratio:
+            params = {
+                name: f"{rng.getrandbits(512):0128x}" for name in PARAM_NAMES[-4:]
+            }
+        elif rng.random() < self.params_ratio:
+            names = rng.sample(PARAM_NAMES, k=rng.randint(1, self.max_params))
+            params = {name: rng.randint(1, 10**6) for name in names}
+        if params:
+            query = "&".join(f"{name}={params[name]}" for name in sorted(params))
+            fullname = f"{fullname}?{query}"
+        return fullname
+
+    def shortcode(self, number):
+        """
+        Returns a unique shortcode for every number in [0, SHORTCODE_SPACE),
+        scattered with a permutation so they don't look sequential
+        """
+        number = (number * SHORTCODE_MULTIPLIER + self.seed) % SHORTCODE_SPACE
+        chars = []
+        for _ in range(SHORTCODE_LENGTH):
+            number, char = divmod(number, len(SHORTCODE_CHARS))
+            chars.append(SHORTCODE_CHARS[char])
+        return "".join(chars)
+
+    def expiration(self, rng):
+        if rng.random() < self.expired_ratio:
+            return self.today - timedelta(days=rng.randint(1, self.expiration_days))
+        return self.today + timedelta(days=rng.randint(0, self.expiration_days))
+
+    def urls(self, count, first_id=1):
+        """
+        Yields `count` unsaved URLs with ids from `first_id`
+        """
+        for index in range(count):
+            rng = self.random(index, EXPIRATION_STREAM)
+            url = URL(
+                id=first_id + index,
+                description=f"Generated URL {index}",
+                shortcode=self.shortcode(first_id + index),
+                expiration=self.expiration(rng),
+            )
+            url.fullname = self.fullname(index)
+            yield url
+
+    def trackings(self, total, urls, first_id=1, skew=1.0, days=30, visitors=100000):
+        """
+        Yields `total` unsaved Trackings of the URLs [first_id, first_id + urls):
+        requests per URL follow a Zipf law of exponent `skew`, spread over the
+        last `days` (until the end of today) by `visitors` distinct clients
+        """
+        rng = random.Random(f"{self.seed}:tracking")
+        end = datetime.combine(self.today + timedelta(days=1), time(), timezone.utc)
+        seconds = days * 86400
+        for _ in range(total):
+            rank = zipf_rank(rng, urls, skew)
+            visitor = rng.randrange(visitors)
+            yield Tracking(
+                url_id=first_id + (rank * RANK_MULTIPLIER) % urls,
+                requested=end - timedelta(seconds=rng.random() * seconds),
+                fingerprint=(visitor * 0x9E3779B97F4A7C15) & (2**63 - 1),
+            )
+
+
+def batches(iterable, size):
+    """
+    Yields lists of up to `size` items of an iterable
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
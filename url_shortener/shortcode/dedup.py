@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+
+from shortcode.invalidation import bus_is_healthy
+
+logger = logging.getLogger(__name__)
+
+"""Prefix of the keys in the shared cache"""
+KEY_PREFIX = "shortcode:dedup:"
+
+
+class LRUCache:
+    """
+    Dict bounded to `max_size` entries, the least recently used are dropped
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DedupCache:
+    """
+    Hash of a canonical URL (URL.fullname_hash) -> (shortcode, expiration) of
+    the URL saved with it, in the process and optionally in a shared cache.
+    Callers check the expiration, an expired URL is treated as new.
+    Changed URLs are evicted by shortcode.invalidation.
+    Errors of the shared cache are logged and handled as a miss, so callers
+    fall back to the database.
+    """
+
+    def __init__(self, config):
+        self.enabled = config["ENABLED"]
+        self.local = LRUCache(config["MAX_SIZE"])
+        self.shared = caches[config["SHARED_CACHE"]] if config["SHARED_CACHE"] else None
+        self.timeout = config["TIMEOUT"]
+        self.fallback_ttl = settings.INVALIDATION_BUS["FALLBACK_TTL"]
+        self.max_ttl = settings.INVALIDATION_BUS["MAX_TTL"]
+
+    def get(self, digest):
+        """
+        Returns (shortcode, expiration) or None. Local entries are evicted by
+        the invalidation bus and live MAX_TTL seconds at most (an event may be
+        lost), without the bus they live FALLBACK_TTL seconds
+        """
+        if not self.enabled:
+            return None
+        entry = self.local.get(digest)
+        if entry is not None:
+            shortcode, expiration, stored = entry
+            ttl = self.max_ttl if bus_is_healthy() else self.fallback_ttl
+            if time.monotonic() - stored < ttl:
+                return shortcode, expiration
+            self.local.delete(digest)
+        if self.shared is None:
+            return None
+        entry = self.call_shared("get", KEY_PREFIX + digest)
+        if entry is not None:
+            self.local.set(digest, (*entry, time.monotonic()))
+        return entry
+
+    def set(self, digest, shortcode, expiration):
+        """
+        Saves an entry once the current transaction commits, so a rolled back
+        URL is never cached
+        """
+        if not self.enabled:
+            return
+
+        def save():
+            self.local.set(digest, (shortcode, expiration, time.monotonic()))
+            if self.shared is not None:
+                self.call_shared(
+                    "set", KEY_PREFIX + digest, (shortcode, expiration), self.timeout
+                )
+
+        transaction.on_commit(save)
+
+    def delete(self, digest):
+        self.local.delete(digest)
+        if self.shared is not None:
+            self.call_shared("delete", KEY_PREFIX + digest)
+
+    def call_shared(self, method, key, *args):
+        """
+        Runs a method of the shared cache, None if its backend fails (the
+        exceptions depend on the backend: memcached, redis, database...)
+        """
+        try:
+            return getattr(self.shared, method)(key, *args)
+        except Exception:
+            logger.exception("Shared dedup cache %s of %s failed", method, key)
+            return None
+
+    def clear(self):
+        """
+        Only clears the local entries, the shared ones expire by TIMEOUT
+        """
+        self.local.clear()
+
+
+_dedup_cache = None
+
+
+def get_dedup_cache():
+    global _dedup_cache
+    if _dedup_cache is None:
+        _dedup_cache = DedupCache(settings.DEDUP_CACHE)
+    return _dedup_cache
+
+
+def reset_dedup_cache(setting, **kwargs):
+    """
+    Rebuilds the cache when DEDUP_CACHE or INVALIDATION_BUS change (tests)
+    """
+    global _dedup_cache
+    if setting in ("DEDUP_CACHE", "INVALIDATION_BUS"):
+        _dedup_cache = None
+
+
+setting_changed.connect(reset_dedup_cache)
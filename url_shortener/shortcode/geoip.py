@@ -0,0 +1,209 @@
+import csv
+import ipaddress
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from shortcode.redirect_map import AtomicFile
+
+"""Modes of GEOIP_ENRICHMENT"""
+OFF = "off"
+INLINE = "inline"
+BATCH = "batch"
+MODES = (OFF, INLINE, BATCH)
+
+"""Compiled database header: magic, version, number of ranges and of locations"""
+HEADER = struct.Struct("<4sHHII")
+MAGIC = b"SCGI"
+VERSION = 1
+"""Location: country (ISO 3166 alpha-2) and region, a NUL between them"""
+SEPARATOR = b"\0"
+"""Longest region kept, Tracking.region max_length"""
+REGION_MAX_LENGTH = 128
+
+"""
+CSV layouts of compile_geoip --format: columns of the country and of the region
+(None: no region), the first two are always the first and last IP
+    ranges: first_ip,last_ip,country[,region]
+    dbip-country: DB-IP IP to Country Lite, first_ip,last_ip,country
+    dbip-city: DB-IP IP to City Lite, first_ip,last_ip,continent,country,region,...
+    ip2location: IP2Location LITE DB1/DB3, ip_from,ip_to,country,country_name[,region,...]
+"""
+FORMATS = {
+    "ranges": (2, 3),
+    "dbip-country": (2, None),
+    "dbip-city": (3, 4),
+    "ip2location": (2, 4),
+}
+DEFAULT_FORMAT = "ranges"
+
+
+def parse_ip(value):
+    """
+    Returns an IPv4 (dotted or integer, IPv4-mapped IPv6 too) as an integer,
+    None for anything else
+    """
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return number if number < 2**32 else None
+    octets = value.split(".")
+    if len(octets) == 4 and all(
+        octet.isdigit() and len(octet) <= 3 for octet in octets
+    ):
+        a, b, c, d = map(int, octets)
+        if max(a, b, c, d) < 256:
+            return a << 24 | b << 16 | c << 8 | d
+        return None
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    if address.version == 6:
+        address = address.ipv4_mapped
+        if address is None:
+            return None
+    return int(address)
+
+
+def read_ranges(csv_file, layout=DEFAULT_FORMAT):
+    """
+    Yields (first ip, last ip, country, region) of a CSV of IP ranges in one of
+    the FORMATS, with dotted or integer IPs. IPv6 ranges, the header and rows
+    without an ISO 3166 alpha-2 country are skipped, regions are cut to
+    REGION_MAX_LENGTH
+    """
+    country_column, region_column = FORMATS[layout]
+    for row in csv.reader(csv_file):
+        if len(row) <= country_column:
+            continue
+        first, last = parse_ip(row[0]), parse_ip(row[1])
+        if first is None or last is None:
+            continue
+        country = row[country_column].strip().upper()
+        if len(country) != 2 or not country.isascii() or not country.isalpha():
+            continue
+        if country == "ZZ":
+            continue
+        region = ""
+        if region_column is not None and len(row) > region_column:
+            region = row[region_column].strip()
+            region = "" if region == "-" else region[:REGION_MAX_LENGTH]
+        yield first, last, country, region
+
+
+def compile_database(ranges, path):
+    """
+    Writes ranges (first ip, last ip, country, region) as the sorted arrays of
+    a compiled database: header, first and last IP of every range, index of
+    its location, offsets of the locations and the locations. Overlapping
+    ranges are cut so the first one wins. Returns the number of ranges
+    """
+    firsts, lasts, location_ids = array("I"), array("I"), array("I")
+    locations = {}
+    for first, last, country, region in sorted(ranges):
+        if lasts and first <= lasts[-1]:
+            first = lasts[-1] + 1
+            if first > last:
+                continue
+        location = f"{country}\0{region}".encode()
+        firsts.append(first)
+        lasts.append(last)
+        location_ids.append(locations.setdefault(location, len(locations)))
+
+    offsets, position = array("I"), 0
+    for location in locations:
+        offsets.append(position)
+        position += len(location)
+    offsets.append(position)
+
+    with AtomicFile(path) as database_file:
+        database_file.write(HEADER.pack(MAGIC, VERSION, 0, len(firsts), len(locations)))
+        for values in (firsts, lasts, location_ids, offsets):
+            database_file.write(values.tobytes())
+        database_file.write(b"".join(locations))
+    return len(firsts)
+
+
+class GeoIPDatabase:
+    """
+    Memory-mapped compiled database, an IP is looked up with a binary search
+    over the first IP of the ranges. Nothing is loaded in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as database_file:
+            self._mmap = mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, locations = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"GeoIP database: {path} has an unknown format")
+        arrays = memoryview(self._mmap)[HEADER.size :]
+        size = 4 * self.count
+        self._firsts = arrays[:size].cast("I")
+        self._lasts = arrays[size : 2 * size].cast("I")
+        self._location_ids = arrays[2 * size : 3 * size].cast("I")
+        self._offsets = arrays[3 * size : 3 * size + 4 * (locations + 1)].cast("I")
+        self._locations_start = HEADER.size + 3 * size + 4 * (locations + 1)
+        self._cache = {}
+
+    def __len__(self):
+        return self.count
+
+    def lookup_number(self, number):
+        """
+        Returns (country, region) of an IP as an integer, None if it isn't in a range
+        """
+        position = bisect_right(self._firsts, number) - 1
+        if position < 0 or number > self._lasts[position]:
+            return None
+        return self.location(self._location_ids[position])
+
+    def lookup(self, ip):
+        """
+        Returns (country, region) of an IP address, None if it's unknown
+        """
+        number = parse_ip(ip) if ip else None
+        return self.lookup_number(number) if number is not None else None
+
+    def location(self, location_id):
+        """
+        Locations are few and repeated, they are decoded once
+        """
+        location = self._cache.get(location_id)
+        if location is None:
+            start = self._locations_start + self._offsets[location_id]
+            end = self._locations_start + self._offsets[location_id + 1]
+            country, _, region = self._mmap[start:end].partition(SEPARATOR)
+            location = self._cache[location_id] = (country.decode(), region.decode())
+        return location
+
+
+_database = None
+
+
+def get_geoip_database():
+    """
+    Returns the GEOIP_DATABASE of this process, None if it isn't set
+    """
+    global _database
+    if _database is None and settings.GEOIP_DATABASE:
+        _database = GeoIPDatabase(settings.GEOIP_DATABASE)
+    return _database
+
+
+def reset_geoip_database(setting, **kwargs):
+    """
+    Drops the database when GEOIP_DATABASE changes (tests)
+    """
+    global _database
+    if setting == "GEOIP_DATABASE":
+        _database = None
+
+
+setting_changed.connect(reset_geoip_database)
@@ -0,0 +1,58 @@
+import math
+
+"""Bits of the hashes added to a sketch (client fingerprints are 63 bits)"""
+HASH_BITS = 63
+"""Default precision: 2^12 one-byte registers (4 KB, ~1.6% standard error)"""
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch to count distinct hashes in fixed memory.
+    Registers are kept as bytes so a sketch can be saved as a blob.
+    """
+
+    def __init__(self, registers=None, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        else:
+            if len(registers) != self.size:
+                raise ValueError(f"Registers: expected {self.size} bytes")
+            self.registers = bytearray(registers)
+
+    def add(self, value):
+        """
+        Adds a hash to the sketch. Returns True if a register changed
+        """
+        remaining_bits = HASH_BITS - self.precision
+        index = value >> remaining_bits
+        rest = value & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, registers):
+        """
+        Merges the registers of another sketch (bytes) into this one
+        """
+        if len(registers) != self.size:
+            raise ValueError(f"Registers: expected {self.size} bytes")
+        self.registers = bytearray(map(max, self.registers, registers))
+
+    def count(self):
+        """
+        Returns the estimated number of distinct hashes added
+        """
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size**2 / math.fsum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        return bytes(self.registers)
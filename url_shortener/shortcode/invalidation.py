@@ -0,0 +1,367 @@
+import atexit
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+"""Datagram header: magic, publish time (ns) of its oldest event, number of events,
+sender (pid) and sequence number of the datagram for that sender"""
+HEADER = struct.Struct("<4sQHIQ")
+MAGIC = b"SCIW"
+"""Event: shortcode length, then the shortcode and the 16 bytes of URL.fullname_hash
+(zeros for an URL without hash)"""
+EVENT = struct.Struct("<H")
+HASH_SIZE = 16
+
+
+def encode_hash(fullname_hash):
+    if not fullname_hash:
+        return bytes(HASH_SIZE)
+    digest = bytes.fromhex(fullname_hash)
+    if len(digest) != HASH_SIZE:
+        raise ValueError(f"Hash: {fullname_hash} isn't {HASH_SIZE} bytes long")
+    return digest
+
+
+def decode_hash(digest):
+    return digest.hex() if any(digest) else ""
+
+
+def encode_events(events, published, sender=0, sequence=1):
+    """
+    Returns the datagrams of events (shortcode, fullname_hash), each of up to
+    max_datagram bytes and numbered from `sequence`
+    """
+    max_datagram = settings.INVALIDATION_BUS["MAX_DATAGRAM"]
+    datagrams, body, count = [], [], 0
+    size = HEADER.size
+
+    def pack():
+        header = HEADER.pack(MAGIC, published, count, sender, sequence + len(datagrams))
+        datagrams.append(header + b"".join(body))
+
+    for shortcode, fullname_hash in events:
+        shortcode = shortcode.encode()
+        event = EVENT.pack(len(shortcode)) + shortcode + encode_hash(fullname_hash)
+        if count and (size + len(event) > max_datagram or count == 0xFFFF):
+            pack()
+            body, count, size = [], 0, HEADER.size
+        body.append(event)
+        count += 1
+        size += len(event)
+    if count:
+        pack()
+    return datagrams
+
+
+def datagram_sender(datagram):
+    """
+    Returns (sender, sequence number) of a datagram
+    """
+    _, _, _, sender, sequence = HEADER.unpack_from(datagram)
+    return sender, sequence
+
+
+def decode_events(datagram):
+    """
+    Returns (publish time, [(shortcode, fullname_hash)]) of a datagram
+    """
+    magic, published, count, _, _ = HEADER.unpack_from(datagram)
+    if magic != MAGIC:
+        raise ValueError("Unknown invalidation datagram")
+    events, position = [], HEADER.size
+    for _ in range(count):
+        (length,) = EVENT.unpack_from(datagram, position)
+        position += EVENT.size
+        shortcode = datagram[position : position + length].decode()
+        position += length
+        fullname_hash = decode_hash(datagram[position : position + HASH_SIZE])
+        position += HASH_SIZE
+        events.append((shortcode, fullname_hash))
+    return published, events
+
+
+def evict(events, published=None, shared=False):
+    """
+    Drops the URLs of the events from the caches of this process, and from the
+    shared dedup cache if `shared` (only the process that changed them does it)
+    """
+    from shortcode.dedup import get_dedup_cache
+    from shortcode.shortcode_table import get_table_reader
+
+    dedup_cache, reader = get_dedup_cache(), get_table_reader()
+    published = published or time.time_ns()
+    for shortcode, fullname_hash in events:
+        if shared:
+            dedup_cache.delete(fullname_hash)
+        else:
+            dedup_cache.local.delete(fullname_hash)
+        if reader is not None:
+            reader.invalidate(shortcode, published)
+
+
+def evict_all():
+    """
+    Drops every URL from the caches of this process, when events were lost
+    """
+    from shortcode.dedup import get_dedup_cache
+    from shortcode.shortcode_table import get_table_reader
+
+    get_dedup_cache().local.clear()
+    reader = get_table_reader()
+    if reader is not None:
+        reader.invalidate_all(time.time_ns())
+
+
+class InvalidationBus:
+    """
+    Every process binds a Unix datagram socket in `directory` and evicts the
+    URLs of the events it receives. Published events are sent to the sockets
+    of the other processes by a sender thread every `flush_interval` seconds,
+    coalesced by URL. Sockets of dead processes are removed when a send fails.
+    Datagrams are numbered by sender: a receiver that finds a gap (a peer's
+    socket was full) drops all its cached URLs, since it can't tell which
+    ones changed. Entries still expire after MAX_TTL, in case the lost
+    datagram was the last one.
+    """
+
+    def __init__(self, directory, flush_interval=0.005, name=None):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f"{name or self.pid}.sock")
+        self.pending = queue.Queue()
+        self.sequence = 1
+        self.sequences = {}
+        self.running = False
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            "published": 0,
+            "sent": 0,
+            "received": 0,
+            "dropped": 0,
+            "lost": 0,
+            "errors": 0,
+            "last_lag_ms": None,
+            "max_lag_ms": 0.0,
+        }
+
+    def start(self):
+        """
+        Binds the socket and starts the threads. Returns False if it can't,
+        then the caches fall back to their TTL
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.receiver.bind(self.path)
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            # a peer that doesn't read its socket can't stall the others
+            self.sender.setblocking(False)
+        except OSError:
+            logger.exception("Invalidation bus couldn't start at %s", self.directory)
+            return False
+        self.running = True
+        atexit.register(self.stop)
+        for target in (self.receive, self.send):
+            threading.Thread(target=target, daemon=True).start()
+        return True
+
+    @property
+    def healthy(self):
+        return self.running and self.pid == os.getpid()
+
+    def publish(self, events):
+        """
+        Queues events (shortcode, fullname_hash) for the other processes
+        """
+        published = time.time_ns()
+        for event in events:
+            self.pending.put((event, published))
+
+    def send(self):
+        while self.running:
+            event, published = self.pending.get()
+            time.sleep(self.flush_interval)
+            events = {event: published}
+            while True:
+                try:
+                    event, event_published = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                events.setdefault(event, event_published)
+            self.send_events(list(events), min(events.values()))
+
+    def send_events(self, events, published):
+        datagrams = encode_events(events, published, self.pid, self.sequence)
+        self.sequence += len(datagrams)
+        for peer in self.peers():
+            for datagram in datagrams:
+                try:
+                    self.sender.sendto(datagram, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    self.remove_peer(peer)
+                    break
+                except BlockingIOError:
+                    self.count("dropped")
+                    logger.warning("Invalidation events dropped, %s is full", peer)
+                    break
+                except OSError:
+                    self.count("errors")
+                    logger.exception("Invalidation event not sent to %s", peer)
+                    break
+        self.count("published", len(events))
+        self.count("sent", len(datagrams))
+
+    def peers(self):
+        with os.scandir(self.directory) as entries:
+            return [
+                entry.path
+                for entry in entries
+                if entry.name.endswith(".sock") and entry.path != self.path
+            ]
+
+    def remove_peer(self, peer):
+        try:
+            os.remove(peer)
+        except FileNotFoundError:
+            pass
+
+    def receive(self):
+        while self.running:
+            try:
+                datagram = self.receiver.recv(1 << 16)
+                published, events = decode_events(datagram)
+                self.check_sequence(*datagram_sender(datagram))
+                evict(events, published)
+            except Exception:
+                if not self.running:
+                    break
+                self.count("errors")
+                logger.exception("Invalidation datagram dropped")
+                continue
+            lag_ms = (time.time_ns() - published) / 1e6
+            with self.stats_lock:
+                self.counters["received"] += len(events)
+                self.counters["last_lag_ms"] = lag_ms
+                self.counters["max_lag_ms"] = max(self.counters["max_lag_ms"], lag_ms)
+
+    def check_sequence(self, sender, sequence):
+        """
+        Evicts every cached URL when datagrams of a sender were lost. A lower
+        sequence is a new process with the pid of a dead one
+        """
+        last = self.sequences.get(sender)
+        self.sequences[sender] = sequence
+        if last is not None and sequence > last + 1:
+            self.count("lost", sequence - last - 1)
+            logger.warning(
+                "%s invalidation datagrams of %s lost, cached URLs dropped",
+                sequence - last - 1,
+                sender,
+            )
+            evict_all()
+
+    def count(self, counter, value=1):
+        with self.stats_lock:
+            self.counters[counter] += value
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "healthy": self.healthy,
+                "pending": self.pending.qsize(),
+                **self.counters,
+            }
+
+    def stop(self):
+        if not self.healthy:
+            return
+        self.running = False
+        try:
+            # wakes the receiver thread up, close alone leaves it blocked
+            self.receiver.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.receiver.close()
+        self.remove_peer(self.path)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    """
+    Returns the started bus of this process (a forked worker starts its own),
+    None if INVALIDATION_BUS is disabled
+    """
+    global _bus
+    config = settings.INVALIDATION_BUS
+    if not config["ENABLED"]:
+        return None
+    if _bus is None or _bus.pid != os.getpid():
+        with _bus_lock:
+            if _bus is None or _bus.pid != os.getpid():
+                bus = InvalidationBus(config["DIRECTORY"], config["FLUSH_INTERVAL"])
+                bus.start()
+                _bus = bus
+    return _bus
+
+
+def bus_is_healthy():
+    """
+    False when caches can't rely on the bus and must expire entries by FALLBACK_TTL
+    """
+    bus = get_bus()
+    return bus is not None and bus.healthy
+
+
+def reset_bus(setting, **kwargs):
+    """
+    Stops the bus when INVALIDATION_BUS changes (tests)
+    """
+    global _bus
+    if setting == "INVALIDATION_BUS" and _bus is not None:
+        _bus.stop()
+        _bus = None
+
+
+setting_changed.connect(reset_bus)
+
+
+def invalidate(events):
+    """
+    Evicts URLs (shortcode, fullname_hash) from the caches of this process and,
+    once the transaction commits, of every other process
+    """
+    events = list(events)
+    if not events:
+        return
+    evict(events, shared=True)
+
+    def publish():
+        evict(events, shared=True)
+        bus = get_bus()
+        if bus is not None:
+            bus.publish(events)
+
+    transaction.on_commit(publish)
+
+
+def url_changed(sender, instance, **kwargs):
+    """
+    post_save and post_delete of URL
+    """
+    invalidate([(instance.shortcode, instance.fullname_hash)])
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shortcode.segments import compact
+
+
+class Command(BaseCommand):
+    help = "Folds the sealed tracking segments into Tracking and deletes them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=None)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep compacting every --interval seconds",
+        )
+        parser.add_argument("--interval", type=float, default=30)
+
+    def handle(self, *args, **options):
+        directory = options["directory"] or settings.TRACKING_SEGMENT_DIR
+        while True:
+            segments, records = compact(directory, options["batch_size"])
+            self.stdout.write(f"{segments} segments, {records} records compacted")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
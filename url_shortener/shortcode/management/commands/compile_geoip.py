@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from shortcode.geoip import DEFAULT_FORMAT, FORMATS, compile_database, read_ranges
+
+
+class Command(BaseCommand):
+    help = (
+        "Compiles a CSV of IP ranges (first_ip,last_ip,country[,region] or a "
+        "DB-IP/IP2Location lite layout, --format) into the memory-mapped "
+        "database used by GEOIP_DATABASE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv", help="Path of the CSV of IP ranges")
+        parser.add_argument("output", help="Path of the compiled database")
+        parser.add_argument(
+            "--format",
+            choices=sorted(FORMATS),
+            default=DEFAULT_FORMAT,
+            help="Columns of the CSV (see shortcode.geoip.FORMATS)",
+        )
+
+    def handle(self, *args, **options):
+        with open(options["csv"], newline="", encoding="utf-8") as csv_file:
+            ranges = read_ranges(csv_file, options["format"])
+            count = compile_database(ranges, options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(f"{count} ranges compiled to {options['output']}")
+        )
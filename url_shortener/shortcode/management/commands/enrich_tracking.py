@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from shortcode.geoip import get_geoip_database
+from shortcode.models import Tracking
+
+
+class Command(BaseCommand):
+    help = (
+        "Locates the IP of the Tracking saved by GEOIP_ENRICHMENT batch and "
+        "clears it, a transaction per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep locating new Tracking every --interval seconds",
+        )
+        parser.add_argument("--interval", type=float, default=30)
+
+    def handle(self, *args, **options):
+        database = get_geoip_database()
+        if database is None:
+            raise CommandError("GEOIP_DATABASE is not set")
+        while True:
+            located, total = self.enrich(database, options["batch_size"])
+            self.stdout.write(f"{located} of {total} Tracking located")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def enrich(self, database, batch_size):
+        """
+        Returns (located, processed). Unknown IPs are cleared too
+        """
+        located = total = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Tracking.objects.filter(ip__isnull=False, id__gt=last_id)
+                    .order_by("id")
+                    .only("id", "ip", "requested")[:batch_size]
+                )
+                if not batch:
+                    return located, total
+                for tracking in batch:
+                    location = database.lookup(tracking.ip)
+                    if location is not None:
+                        tracking.country, tracking.region = location
+                        located += 1
+                    tracking.ip = None
+                Tracking.objects.bulk_update(batch, ["country", "region", "ip"])
+            total += len(batch)
+            last_id = batch[-1].id
@@ -0,0 +1,130 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models.functions import Collate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from shortcode.models import URL, DeletedURL
+from shortcode.redirect_map import (
+    FORMATS,
+    NGINX,
+    read_map,
+    read_state,
+    write_map,
+    write_state,
+)
+
+"""Fields needed to build an entry (shortcode, fullname, expiration)"""
+URL_FIELDS = ("shortcode", "host__name", "location", "query_compressed", "expiration")
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the active and unexpired URLs as a redirect map (nginx map "
+        "or binary) swapped atomically, so a proxy can serve them without Python."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Path of the map")
+        parser.add_argument("--format", choices=FORMATS, default=NGINX)
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only apply the URLs updated since the last export",
+        )
+        parser.add_argument(
+            "--top", type=int, default=None, help="Only export the N most requested"
+        )
+        parser.add_argument(
+            "--top-days",
+            type=int,
+            default=1,
+            help="Days of Tracking used to rank the most requested",
+        )
+        parser.add_argument(
+            "--deleted-days",
+            type=int,
+            default=7,
+            help="Days deleted URLs are remembered for --incremental, an older "
+            "map is exported again in full",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options["incremental"] and options["top"]:
+            raise CommandError("--incremental can't be used with --top")
+
+        output = options["output"]
+        started = timezone.now()
+        today = started.date()
+        state = read_state(output) if options["incremental"] else None
+        deleted_since = started - timedelta(days=options["deleted_days"])
+
+        entries = None
+        if state is not None and os.path.exists(output):
+            try:
+                exported = parse_datetime(state["exported"])
+                if exported < deleted_since:
+                    raise ValueError(f"The map exported at {exported} is too old")
+                entries = self.get_incremental_entries(
+                    output, options["format"], exported, today, options["chunk_size"]
+                )
+            except ValueError as exc:
+                self.stderr.write(f"{exc}, exporting every URL")
+        if entries is None:
+            urls = self.get_urls(today, options["top"], options["top_days"])
+            entries = (
+                (url.shortcode, url.fullname, url.expiration)
+                for url in urls.iterator(chunk_size=options["chunk_size"])
+            )
+
+        count = write_map(output, entries, options["format"])
+        write_state(output, {"exported": started.isoformat()})
+        DeletedURL.objects.filter(deleted__lt=deleted_since).delete()
+        self.stdout.write(self.style.SUCCESS(f"{count} entries exported to {output}"))
+
+    def get_urls(self, today, top=None, top_days=1):
+        """
+        Returns a queryset of the URLs to export sorted by shortcode
+        """
+        urls = URL.objects.resolvable(today)
+        if top:
+            urls = urls.most_requested(top, top_days)
+        # binary maps are searched comparing bytes, so the database must sort them the same way
+        collation = "C" if connection.vendor == "postgresql" else "BINARY"
+        return (
+            urls.select_related("host")
+            .order_by(Collate("shortcode", collation))
+            .only(*URL_FIELDS)
+        )
+
+    def get_incremental_entries(self, output, format, exported, today, chunk_size):
+        """
+        Returns the entries of the previous map (without the expired ones)
+        without the URLs deleted and updated with the URLs changed since it
+        was exported. Only those URLs are read. Raises ValueError if the
+        previous map can't be read
+        """
+        entries = {
+            shortcode: (target, expiration)
+            for shortcode, target, expiration in read_map(output, format)
+            if expiration >= today
+        }
+        deleted = DeletedURL.objects.filter(deleted__gte=exported)
+        for shortcode in deleted.values_list("shortcode", flat=True):
+            entries.pop(shortcode, None)
+        # after the deletions, a shortcode may be deleted and then used again
+        changed = (
+            URL.objects.filter(updated__gte=exported)
+            .select_related("host")
+            .only("active", *URL_FIELDS)
+        )
+        for url in changed.iterator(chunk_size=chunk_size):
+            if url.active and url.expiration >= today:
+                entries[url.shortcode] = (url.fullname, url.expiration)
+            else:
+                entries.pop(url.shortcode, None)
+        return ((shortcode, *entries[shortcode]) for shortcode in sorted(entries))
@@ -0,0 +1,181 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from shortcode.dataset import SHORTCODE_SPACE, DatasetGenerator, batches
+from shortcode.models import URL, Tracking
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates realistic URL and Tracking rows with bulk inserts to test "
+        "at production scale. The same seed (and --today) generates the same rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--urls", type=int, default=100000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--hosts", type=int, default=1000)
+        parser.add_argument(
+            "--host-skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of the hosts, higher is more URLs on the top hosts",
+        )
+        parser.add_argument(
+            "--params-ratio",
+            type=float,
+            default=0.5,
+            help="Share of URLs with queryparams",
+        )
+        parser.add_argument("--max-params", type=int, default=6)
+        parser.add_argument(
+            "--long-query-ratio",
+            type=float,
+            default=0.01,
+            help="Share of URLs with queryparams long enough to be compressed",
+        )
+        parser.add_argument(
+            "--duplicate-ratio",
+            type=float,
+            default=0.05,
+            help="Share of URLs repeating the fullname of a previous one",
+        )
+        parser.add_argument(
+            "--expired-ratio",
+            type=float,
+            default=0.1,
+            help="Share of URLs already expired",
+        )
+        parser.add_argument(
+            "--expiration-days",
+            type=int,
+            default=365,
+            help="Expirations are spread up to these days before or after today",
+        )
+        parser.add_argument(
+            "--tracking", type=int, default=0, help="Tracking rows to generate"
+        )
+        parser.add_argument(
+            "--tracking-skew",
+            type=float,
+            default=1.0,
+            help="Zipf exponent of the requests per URL",
+        )
+        parser.add_argument(
+            "--days", type=int, default=30, help="Days of Tracking until today"
+        )
+        parser.add_argument(
+            "--visitors", type=int, default=100000, help="Distinct clients"
+        )
+        parser.add_argument(
+            "--today",
+            type=date.fromisoformat,
+            default=None,
+            help="Reference date (YYYY-MM-DD), today by default",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        if options["tracking"] and not options["urls"]:
+            raise CommandError("--tracking needs --urls to be generated with them")
+
+        self.verbosity = options["verbosity"]
+        database = options["database"]
+        last_id = URL.objects.using(database).aggregate(last=Max("id"))["last"]
+        first_id = (last_id or 0) + 1
+        if first_id + options["urls"] > SHORTCODE_SPACE:
+            raise CommandError(f"Only {SHORTCODE_SPACE} shortcodes can be generated")
+
+        generator = DatasetGenerator(
+            seed=options["seed"],
+            hosts=options["hosts"],
+            host_skew=options["host_skew"],
+            params_ratio=options["params_ratio"],
+            max_params=options["max_params"],
+            long_query_ratio=options["long_query_ratio"],
+            duplicate_ratio=options["duplicate_ratio"],
+            expired_ratio=options["expired_ratio"],
+            expiration_days=options["expiration_days"],
+            today=options["today"],
+        )
+
+        urls = self.replace_taken_shortcodes(
+            generator,
+            generator.urls(options["urls"], first_id),
+            options["batch_size"],
+            database,
+        )
+        self.insert(URL, urls, options["batch_size"], database)
+        self.reset_sequence(URL, database)
+        self.insert(
+            Tracking,
+            generator.trackings(
+                options["tracking"],
+                options["urls"],
+                first_id,
+                skew=options["tracking_skew"],
+                days=options["days"],
+                visitors=options["visitors"],
+            ),
+            options["batch_size"],
+            database,
+        )
+
+    def replace_taken_shortcodes(self, generator, urls, batch_size, database):
+        """
+        Yields the URLs by batches. Generated shortcodes are unique among them,
+        but /create (random or custom) may have taken one: that URL gets a
+        free shortcode from the end of the space, so the batch doesn't fail
+        """
+        spare = SHORTCODE_SPACE
+        for batch in batches(urls, batch_size):
+            pending = batch
+            while pending:
+                taken = set(
+                    URL.objects.using(database)
+                    .filter(shortcode__in=[url.shortcode for url in pending])
+                    .values_list("shortcode", flat=True)
+                )
+                pending = [url for url in pending if url.shortcode in taken]
+                for url in pending:
+                    spare -= 1
+                    url.shortcode = generator.shortcode(spare)
+            yield from batch
+
+    def insert(self, model, rows, batch_size, database):
+        """
+        Inserts the rows streamed by batches, a transaction per batch
+        """
+        name = model._meta.verbose_name_plural
+        start = time.perf_counter()
+        count = 0
+        for batch in batches(rows, batch_size):
+            with transaction.atomic(using=database):
+                model.objects.using(database).bulk_create(batch)
+            count += len(batch)
+            if self.verbosity > 1:
+                self.stdout.write(f"{count} {name}")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{count} {name} generated in {elapsed:.1f}s "
+                f"({count / max(elapsed, 1e-9):.0f} rows/s)"
+            )
+        )
+
+    def reset_sequence(self, model, database):
+        """
+        URLs are inserted with explicit ids, the sequence must continue after them
+        """
+        connection = connections[database]
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
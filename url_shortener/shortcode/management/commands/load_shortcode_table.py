@@ -0,0 +1,79 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shortcode.models import URL
+from shortcode.shortcode_table import ShortcodeTable, write_table
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the active and unexpired URLs to the shortcode table shared by "
+        "the workers (SHORTCODE_TABLE), swapping the previous generation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=None, help="SHORTCODE_TABLE by default")
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=None,
+            help="Only load the N most requested, bounding the table size",
+        )
+        parser.add_argument(
+            "--top-days",
+            type=int,
+            default=1,
+            help="Days of Tracking used to rank the most requested",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Load a new generation every --interval seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Half of INVALIDATION_FALLBACK_TTL by default: without the "
+            "invalidation bus workers stop using a generation older than it",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or settings.SHORTCODE_TABLE
+        if not path:
+            raise CommandError("Set SHORTCODE_TABLE or --path")
+        interval = options["interval"]
+        if interval is None:
+            interval = settings.INVALIDATION_BUS["FALLBACK_TTL"] / 2
+        while True:
+            self.load(path, options["top"], options["top_days"], options["chunk_size"])
+            if not options["loop"]:
+                break
+            time.sleep(interval)
+
+    def load(self, path, top, top_days, chunk_size):
+        # URLs changed while they are read are newer than the generation
+        generation = time.time_ns()
+        urls = URL.objects.resolvable(timezone.now().date())
+        if top:
+            urls = urls.most_requested(top, top_days)
+        urls = urls.select_related("host").only(
+            "shortcode", "host__name", "location", "query_compressed", "expiration"
+        )
+        entries = (
+            (url.pk, url.shortcode, url.fullname, url.expiration)
+            for url in urls.iterator(chunk_size=chunk_size)
+        )
+        count = write_table(path, entries, generation)
+        table = ShortcodeTable(path)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{count} entries loaded to {path} (generation {table.generation}, "
+                f"{table.capacity} slots, {os.path.getsize(path) // 1024} KB)"
+            )
+        )
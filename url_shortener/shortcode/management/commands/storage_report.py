@@ -0,0 +1,71 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the rows, table size and index size of every shortcode table, "
+        "to compare the storage before and after a change."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor == "postgresql":
+            get_sizes = self.get_postgresql_sizes
+        elif connection.vendor == "sqlite":
+            get_sizes = self.get_sqlite_sizes
+        else:
+            raise CommandError(f"Database: {connection.vendor} is not supported")
+
+        self.stdout.write(
+            f"{'table':<28}{'rows':>12}{'table KB':>12}{'indexes KB':>12}"
+        )
+        tables = connection.introspection.table_names()
+        with connection.cursor() as cursor:
+            for model in apps.get_app_config("shortcode").get_models():
+                table = model._meta.db_table
+                if table not in tables:
+                    continue
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}"
+                )
+                (rows,) = cursor.fetchone()
+                table_size, indexes_size = get_sizes(cursor, table)
+                self.stdout.write(
+                    f"{table:<28}{rows:>12}{table_size // 1024:>12}{indexes_size // 1024:>12}"
+                )
+
+    def get_postgresql_sizes(self, cursor, table):
+        """
+        Returns (table bytes, indexes bytes), partitions included
+        """
+        cursor.execute(
+            """
+            SELECT
+                COALESCE(SUM(pg_table_size(relid)), 0),
+                COALESCE(SUM(pg_indexes_size(relid)), 0)
+            FROM pg_partition_tree(%s::regclass)
+            """,
+            [table],
+        )
+        return cursor.fetchone()
+
+    def get_sqlite_sizes(self, cursor, table):
+        """
+        Returns (table bytes, indexes bytes) from the dbstat virtual table
+        """
+        cursor.execute(
+            """
+            SELECT
+                COALESCE(SUM(CASE WHEN m.type = 'table' THEN s.pgsize END), 0),
+                COALESCE(SUM(CASE WHEN m.type = 'index' THEN s.pgsize END), 0)
+            FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+            WHERE m.tbl_name = %s
+            """,
+            [table],
+        )
+        return cursor.fetchone()
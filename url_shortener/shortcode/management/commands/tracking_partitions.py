@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from shortcode.partitions import drop_expired_partitions, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the Tracking partitions ahead of time and drops the ones "
+        "older than the retention. Meant to be run periodically (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=None,
+            help="Periods to create after the current one (TRACKING_PARTITIONS_AHEAD)",
+        )
+        parser.add_argument(
+            "--retention",
+            type=int,
+            default=None,
+            help="Periods to keep, counting the current one (TRACKING_PARTITION_RETENTION)",
+        )
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        created = ensure_partitions(ahead=options["ahead"], using=options["database"])
+        dropped = drop_expired_partitions(
+            retention=options["retention"], using=options["database"]
+        )
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        for name in dropped:
+            self.stdout.write(f"Dropped {name}")
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(created)} created, {len(dropped)} dropped")
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-19 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0003_alter_url_shortcode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tracking',
+            name='requested',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+import datetime
+
+from django.db import migrations
+
+
+def partition_tracking(apps, schema_editor):
+    """
+    Postgres only: turns shortcode_tracking into a table partitioned by range
+    of `requested`. Rows older than the current month are kept in a legacy
+    partition and the newer ones are copied to the default partition, from
+    where ensure_partitions (post_migrate) moves them to their own partition.
+    The DDL is inlined so later changes of shortcode.partitions or the
+    settings don't change this migration.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    first_bound = datetime.datetime.now(datetime.timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    statements = [
+        "ALTER TABLE shortcode_tracking RENAME TO shortcode_tracking_legacy",
+        "ALTER TABLE shortcode_tracking_legacy "
+        "RENAME CONSTRAINT shortcode_tracking_pkey TO shortcode_tracking_legacy_pkey",
+        "CREATE TABLE shortcode_tracking "
+        "(LIKE shortcode_tracking_legacy INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (requested)",
+        "ALTER SEQUENCE shortcode_tracking_id_seq OWNED BY shortcode_tracking.id",
+        "ALTER TABLE shortcode_tracking ADD PRIMARY KEY (id, requested)",
+        "ALTER TABLE shortcode_tracking ADD CONSTRAINT shortcode_tracking_url_id_fk "
+        "FOREIGN KEY (url_id) REFERENCES shortcode_url (id) DEFERRABLE INITIALLY DEFERRED",
+        "CREATE INDEX shortcode_tracking_url_id_idx ON shortcode_tracking (url_id)",
+        "CREATE INDEX shortcode_tracking_requested_idx ON shortcode_tracking (requested)",
+        "CREATE TABLE shortcode_tracking_default "
+        "PARTITION OF shortcode_tracking DEFAULT",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+    schema_editor.execute(
+        "INSERT INTO shortcode_tracking "
+        "SELECT * FROM shortcode_tracking_legacy WHERE requested >= %s",
+        [first_bound],
+    )
+    schema_editor.execute(
+        "DELETE FROM shortcode_tracking_legacy WHERE requested >= %s", [first_bound]
+    )
+    # a partition can't keep its own primary key, it needs the one of the parent
+    schema_editor.execute(
+        "ALTER TABLE shortcode_tracking_legacy "
+        "DROP CONSTRAINT shortcode_tracking_legacy_pkey, "
+        "ADD CONSTRAINT shortcode_tracking_legacy_pkey PRIMARY KEY (id, requested)"
+    )
+    schema_editor.execute(
+        "ALTER TABLE shortcode_tracking ATTACH PARTITION shortcode_tracking_legacy "
+        "FOR VALUES FROM (MINVALUE) TO (%s)",
+        [first_bound],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0004_tracking_requested_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tracking, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.3 on 2026-10-19 12:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0005_partition_tracking'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tracking',
+            name='requested',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.3 on 2026-10-19 12:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0006_tracking_requested_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tracking',
+            name='fingerprint',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('url', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='shortcode.url')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='visitorsketch',
+            constraint=models.UniqueConstraint(fields=('url', 'day'), name='unique_url_day_sketch'),
+        ),
+    ]
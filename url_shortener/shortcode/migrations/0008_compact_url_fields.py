@@ -0,0 +1,50 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0007_visitor_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Host',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=512, unique=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='url',
+            name='fullname',
+            field=models.CharField(max_length=2048, null=True),
+        ),
+        migrations.AlterField(
+            model_name='url',
+            name='name',
+            field=models.CharField(max_length=512, null=True),
+        ),
+        migrations.AddField(
+            model_name='url',
+            name='host',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='shortcode.host'),
+        ),
+        migrations.AddField(
+            model_name='url',
+            name='location',
+            field=models.CharField(default='', max_length=2048),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='url',
+            name='query_compressed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='url',
+            name='fullname_hash',
+            field=models.CharField(max_length=32, null=True),
+        ),
+    ]
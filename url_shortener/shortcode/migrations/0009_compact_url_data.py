@@ -0,0 +1,123 @@
+import hashlib
+import re
+import zlib
+
+from django.db import connections, migrations, transaction
+
+# rows converted per transaction
+BATCH_SIZE = 2000
+HOST_REGEX = '^https?:\\/\\/[^\\/?#]+'
+# defaults of URL_COMPRESS_QUERY_MIN_LENGTH and URL_INTERN_HOSTS when this migration
+# was written, inlined so replaying it always converts the rows the same way
+COMPRESS_QUERY_MIN_LENGTH = 256
+INTERN_HOSTS = True
+
+
+def batches(URL, using):
+    """
+    Yields the URLs in batches by primary key, so big tables aren't loaded at once
+    """
+    last_pk = 0
+    while True:
+        batch = list(
+            URL.objects.using(using)
+            .select_related('host')
+            .filter(pk__gt=last_pk)
+            .order_by('pk')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def update(using, sql, rows):
+    """
+    Updates a batch in its own transaction with a single executemany
+    """
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def get_host(Host, using, hosts, name):
+    if name not in hosts:
+        hosts[name], _ = Host.objects.using(using).get_or_create(name=name)
+    return hosts[name]
+
+
+def compact_urls(apps, schema_editor):
+    """
+    Saves the canonical URL once: interned host, location and compressed queryparams
+    """
+    URL = apps.get_model('shortcode', 'URL')
+    Host = apps.get_model('shortcode', 'Host')
+    using = schema_editor.connection.alias
+    hosts = {}
+
+    for batch in batches(URL, using):
+        rows = []
+        for url in batch:
+            fullname = url.fullname
+            fullname_hash = hashlib.blake2b(fullname.encode(), digest_size=16).hexdigest()
+            location = fullname
+            query_compressed = None
+            host_id = None
+
+            name, _, query = fullname.partition('?')
+            if len(query) >= COMPRESS_QUERY_MIN_LENGTH:
+                location = name
+                query_compressed = zlib.compress(query.encode(), 9)
+
+            match = re.match(HOST_REGEX, location)
+            if INTERN_HOSTS and match:
+                host_id = get_host(Host, using, hosts, match.group(0)).pk
+                location = location[len(match.group(0)):]
+            rows.append((fullname_hash, location, query_compressed, host_id, url.pk))
+
+        update(
+            using,
+            'UPDATE shortcode_url SET fullname_hash = %s, location = %s, '
+            'query_compressed = %s, host_id = %s WHERE id = %s',
+            rows,
+        )
+
+
+def expand_urls(apps, schema_editor):
+    """
+    Saves fullname, name and queryparams again from the compact columns
+    """
+    URL = apps.get_model('shortcode', 'URL')
+    using = schema_editor.connection.alias
+
+    for batch in batches(URL, using):
+        rows = []
+        for url in batch:
+            fullname = url.location
+            if url.query_compressed is not None:
+                query = zlib.decompress(url.query_compressed).decode()
+                fullname = f'{fullname}?{query}'
+            if url.host is not None:
+                fullname = f'{url.host.name}{fullname}'
+            name, separator, query = fullname.partition('?')
+            rows.append((fullname, name, query if separator else None, url.pk))
+
+        update(
+            using,
+            'UPDATE shortcode_url SET fullname = %s, name = %s, query_params = %s '
+            'WHERE id = %s',
+            rows,
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('shortcode', '0008_compact_url_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_urls, expand_urls),
+    ]
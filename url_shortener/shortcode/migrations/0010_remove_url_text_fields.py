@@ -0,0 +1,38 @@
+# Generated by Django 4.0.3 on 2026-10-19 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0009_compact_url_data'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='url',
+            name='shortcode_u_fullnam_c438b1_idx',
+        ),
+        migrations.RemoveField(
+            model_name='url',
+            name='fullname',
+        ),
+        migrations.RemoveField(
+            model_name='url',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='url',
+            name='query_params',
+        ),
+        migrations.AlterField(
+            model_name='url',
+            name='fullname_hash',
+            field=models.CharField(max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(fields=['fullname_hash'], name='shortcode_u_fullnam_e93934_idx'),
+        ),
+    ]
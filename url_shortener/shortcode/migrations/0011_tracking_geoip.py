@@ -0,0 +1,32 @@
+# Generated by Django 4.0.3 on 2026-10-19 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0010_remove_url_text_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tracking',
+            name='country',
+            field=models.CharField(max_length=2, null=True),
+        ),
+        migrations.AddField(
+            model_name='tracking',
+            name='ip',
+            field=models.GenericIPAddressField(null=True),
+        ),
+        migrations.AddField(
+            model_name='tracking',
+            name='region',
+            field=models.CharField(max_length=128, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='tracking',
+            index=models.Index(condition=models.Q(('ip__isnull', False)), fields=['id'], name='tracking_pending_geoip'),
+        ),
+    ]
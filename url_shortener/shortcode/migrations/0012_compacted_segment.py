@@ -0,0 +1,20 @@
+# Generated by Django 4.0.3 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0011_tracking_geoip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompactedSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+            ],
+        ),
+    ]
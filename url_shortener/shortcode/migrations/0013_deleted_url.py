@@ -0,0 +1,21 @@
+# Generated by Django 4.0.3 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortcode', '0012_compacted_segment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedURL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shortcode', models.CharField(max_length=64)),
+                ('deleted', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
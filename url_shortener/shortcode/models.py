@@ -1,15 +1,120 @@
-from django.db import models
-import datetime
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+import datetime, hashlib, re, warnings, zlib
+
+from shortcode.constants import HOST_REGEX
+from shortcode.invalidation import invalidate
+
+
+class Host(models.Model):
+    """Host Model
+    name: scheme and host of an URL (https://test.com), shared by the URLs that use it
+    """
+
+    name = models.CharField(max_length=512, null=False, unique=True)
+
+
+class URLQuerySet(models.QuerySet):
+    """
+    Bulk operations don't send post_save, so they publish the URLs they change
+    to the invalidation bus themselves
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Interns the hosts of all the URLs with a query per batch before inserting them.
+        New URLs aren't in any cache, nothing is published
+        """
+        objs = list(objs)
+        URL.intern_hosts(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        """
+        Sets `updated` like save() does (auto_now), incremental exports read it
+        """
+        objs = list(objs)
+        if "updated" not in fields:
+            now = timezone.now()
+            for url in objs:
+                url.updated = now
+            fields = [*fields, "updated"]
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        invalidate((url.shortcode, url.fullname_hash) for url in objs)
+        return updated
+
+    def update(self, **kwargs):
+        """
+        Updates by batches of ids (INVALIDATION_BUS UPDATE_BATCH_SIZE), each one
+        locked and read in the transaction that updates it, to publish the
+        shortcode and hash the URLs had. `updated` is set like save() does
+        """
+        kwargs.setdefault("updated", timezone.now())
+        batch_size = settings.INVALIDATION_BUS["UPDATE_BATCH_SIZE"]
+        queryset = self.order_by("pk")
+        updated = 0
+        while True:
+            with transaction.atomic(using=self.db):
+                changed = list(
+                    queryset.select_for_update().values_list(
+                        "pk", "shortcode", "fullname_hash"
+                    )[:batch_size]
+                )
+                ids = [pk for pk, _, _ in changed]
+                if ids:
+                    batch = super(URLQuerySet, self.filter(pk__in=ids))
+                    updated += batch.update(**kwargs)
+                invalidate((shortcode, digest) for _, shortcode, digest in changed)
+            if len(changed) < batch_size:
+                return updated
+            queryset = queryset.filter(pk__gt=ids[-1])
+
+    def resolvable(self, today):
+        """
+        URLs that /:shortcode resolves: active and unexpired
+        """
+        return self.filter(active=True, expiration__gte=today)
+
+    def most_requested(self, top, days=1):
+        """
+        The `top` URLs with more Tracking in the last `days`
+        """
+        since = timezone.now() - datetime.timedelta(days=days)
+        top_ids = (
+            Tracking.objects.filter(requested__gte=since)
+            .values("url")
+            .annotate(requests=models.Count("id"))
+            .order_by("-requests")
+            .values_list("url", flat=True)[:top]
+        )
+        return self.filter(id__in=list(top_ids))
+
+
+URLManager = models.Manager.from_queryset(URLQuerySet)
 
 
 class URL(models.Model):
     """URL Model
     description: Description for an URL.
     shortcode: ID referenced with an URL
+    expiration: date to know if an URL is valid or not (default is 10 days after is inserted)
+
+    The canonical URL is saved once:
+    host: interned scheme and host (if URL_INTERN_HOSTS)
+    location: rest of the URL (all of it if the host isn't interned), without the
+        queryparams if they are compressed
+    query_compressed: queryparams compressed with zlib when they are longer than
+        URL_COMPRESS_QUERY_MIN_LENGTH
+    fullname_hash: hash of the fullname, indexed to find duplicated URLs
+
+    Accessors (built from the columns above, assigning them updates the columns):
     fullname: Complete URL link with queryparams (if apply)
     name: Host of an URL without params
     query_params: queryparams for an URL if it has.
-    expiration: date to know if an URL is valid or not (default is 10 days after is inserted)
+    Querysets reading them should select_related("host").
+    As keyword arguments name and query_params only build the fullname when it
+    isn't given, whatever their order: the fullname is the target of the URL
     """
 
     expiration_default_date = datetime.date.today() + datetime.timedelta(days=10)
@@ -17,20 +122,214 @@ class URL(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["shortcode"]),
-            models.Index(fields=["fullname"]),
+            models.Index(fields=["fullname_hash"]),
         ]
 
+    objects = URLManager()
+
     description = models.CharField(max_length=256, null=False)
     shortcode = models.CharField(max_length=64, null=False, unique=True)
-    fullname = models.CharField(max_length=2048, null=False)
-    name = models.CharField(max_length=512, null=False)
-    query_params = models.CharField(max_length=1536, null=True)
+    host = models.ForeignKey(Host, on_delete=models.PROTECT, null=True)
+    location = models.CharField(max_length=2048, null=False)
+    query_compressed = models.BinaryField(null=True)
+    fullname_hash = models.CharField(max_length=32, null=False)
     expiration = models.DateField(default=expiration_default_date, null=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     active = models.BooleanField(default=True)
 
+    def __init__(self, *args, **kwargs):
+        name = kwargs.pop("name", None)
+        query_params = kwargs.pop("query_params", None)
+        super().__init__(*args, **kwargs)
+        if "fullname" in kwargs:
+            ignored = (name is not None and name != self.name) or (
+                query_params is not None and query_params != self.query_params
+            )
+            if ignored:
+                warnings.warn(
+                    "URL name and query_params don't match the fullname, "
+                    "they are ignored",
+                    DeprecationWarning,
+                    stacklevel=2,
+                )
+        elif name is not None:
+            self.fullname = name if query_params is None else f"{name}?{query_params}"
+        elif query_params is not None:
+            self.query_params = query_params
+
+    @staticmethod
+    def hash_fullname(fullname):
+        """
+        Returns the hash used to find an URL by its fullname
+        """
+        return hashlib.blake2b(fullname.encode(), digest_size=16).hexdigest()
+
+    @property
+    def fullname(self):
+        location = self.location
+        if self.query_compressed is not None:
+            query = zlib.decompress(self.query_compressed).decode()
+            location = f"{location}?{query}"
+        if self.host_id is not None:
+            return f"{self.host.name}{location}"
+        return location
+
+    @fullname.setter
+    def fullname(self, fullname):
+        """
+        Splits a fullname in its columns. The host is interned on save
+        """
+        self.host = None
+        self.fullname_hash = self.hash_fullname(fullname)
+        self.query_compressed = None
+        self.location = fullname
+
+        min_length = settings.URL_COMPRESS_QUERY_MIN_LENGTH
+        name, separator, query = fullname.partition("?")
+        if min_length and len(query) >= min_length:
+            self.location = name
+            self.query_compressed = zlib.compress(query.encode(), 9)
+
+    @property
+    def name(self):
+        return self.fullname.partition("?")[0]
+
+    @name.setter
+    def name(self, name):
+        """
+        Replaces the URL without params, keeping the queryparams
+        """
+        query_params = self.query_params
+        self.fullname = name if query_params is None else f"{name}?{query_params}"
+
+    @property
+    def query_params(self):
+        name, separator, query = self.fullname.partition("?")
+        return query if separator else None
+
+    @query_params.setter
+    def query_params(self, query_params):
+        """
+        Replaces the queryparams (None removes them)
+        """
+        name = self.name
+        self.fullname = name if query_params is None else f"{name}?{query_params}"
+
+    def get_host_name(self):
+        """
+        Returns the scheme and host of a location that isn't interned yet
+        """
+        if self.host_id is not None or not settings.URL_INTERN_HOSTS:
+            return None
+        match = re.match(HOST_REGEX, self.location)
+        return match.group(0) if match else None
+
+    @classmethod
+    def intern_hosts(cls, urls):
+        """
+        Moves the host of every URL to the Host table, creating the missing ones
+        """
+        pending = [(url, url.get_host_name()) for url in urls]
+        pending = [(url, name) for url, name in pending if name]
+        if not pending:
+            return
+        names = {name for _, name in pending}
+        hosts = Host.objects.in_bulk(names, field_name="name")
+        missing = names - hosts.keys()
+        if missing:
+            Host.objects.bulk_create(
+                [Host(name=name) for name in missing], ignore_conflicts=True
+            )
+            hosts.update(Host.objects.in_bulk(missing, field_name="name"))
+        for url, name in pending:
+            url.set_host(hosts[name])
+
+    def set_host(self, host):
+        """
+        Sets an interned host, removing it from the location
+        """
+        self.host = host
+        self.location = self.location[len(host.name) :]
+
+    def save(self, *args, **kwargs):
+        name = self.get_host_name()
+        if name:
+            host, _ = Host.objects.get_or_create(name=name)
+            self.set_host(host)
+        super().save(*args, **kwargs)
+
 
 class Tracking(models.Model):
+    """Tracking Model
+    url: URL requested
+    requested: date and time of the request (now by default, segments keep their own).
+        On Postgres the table is partitioned by range of this field (see shortcode.partitions)
+    fingerprint: hash of the client IP and user agent (63 bits), never the raw values
+    country, region: location of the client IP (see shortcode.geoip)
+    ip: client IP waiting to be located by enrich_tracking (GEOIP_ENRICHMENT batch),
+        cleared once it's located
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(ip__isnull=False),
+                name="tracking_pending_geoip",
+            ),
+        ]
+
+    url = models.ForeignKey(URL, on_delete=models.DO_NOTHING)
+    requested = models.DateTimeField(default=timezone.now, db_index=True)
+    fingerprint = models.BigIntegerField(null=True)
+    country = models.CharField(max_length=2, null=True)
+    region = models.CharField(max_length=128, null=True)
+    ip = models.GenericIPAddressField(null=True)
+
+
+class VisitorSketch(models.Model):
+    """VisitorSketch Model
+    url: URL requested
+    day: day of the requests
+    registers: HyperLogLog registers of the client fingerprints (see shortcode.hll)
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["url", "day"], name="unique_url_day_sketch"
+            ),
+        ]
+
     url = models.ForeignKey(URL, on_delete=models.DO_NOTHING)
-    requested = models.DateTimeField(auto_now_add=True)
+    day = models.DateField(null=False)
+    registers = models.BinaryField(null=False)
+
+
+class CompactedSegment(models.Model):
+    """CompactedSegment Model
+    name: tracking segment folded into Tracking (see shortcode.segments), saved in
+        the same transaction as its rows so a segment is never folded twice. Removed
+        once the segment file is deleted
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+
+
+class DeletedURL(models.Model):
+    """DeletedURL Model
+    shortcode: shortcode of a deleted URL, so `export_redirect_map --incremental`
+        drops it from the previous map without checking every entry
+    deleted: date and time of the deletion, kept `--deleted-days`
+    """
+
+    shortcode = models.CharField(max_length=64, null=False)
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+def url_deleted(sender, instance, **kwargs):
+    """
+    post_delete of URL
+    """
+    DeletedURL.objects.create(shortcode=instance.shortcode)
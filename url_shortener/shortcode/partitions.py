@@ -0,0 +1,278 @@
+import datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from shortcode.models import Tracking
+
+"""Granularities allowed for Tracking partitions"""
+DAY = "day"
+MONTH = "month"
+GRANULARITIES = (DAY, MONTH)
+"""Suffixes of the partitions that aren't a period: rows before partitioning
+(up to the month it was migrated) and rows without a partition of their period"""
+LEGACY = "legacy"
+DEFAULT = "default"
+
+
+def supports_native_partitioning(connection):
+    """
+    True if the database can partition Tracking natively (Postgres)
+    """
+    return connection.vendor == "postgresql"
+
+
+def is_partitioned(connection):
+    """
+    True once the Tracking table is partitioned (migration 0005 applied)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table " "WHERE partrelid = to_regclass(%s)",
+            [Tracking._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_granularity():
+    """
+    Returns the configured granularity (day or month)
+    """
+    granularity = settings.TRACKING_PARTITION_GRANULARITY
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularity: {granularity} is not valid")
+    return granularity
+
+
+def period_start(date, granularity):
+    """
+    Returns the first day of the period that contains a date
+    """
+    if granularity == MONTH:
+        return date.replace(day=1)
+    return date
+
+
+def next_period(start, granularity):
+    """
+    Returns the first day of the period after the one started at `start`
+    """
+    if granularity == MONTH:
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1, day=1)
+        return start.replace(month=start.month + 1, day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def previous_period(start, granularity):
+    """
+    Returns the first day of the period before the one started at `start`
+    """
+    if granularity == MONTH:
+        if start.month == 1:
+            return start.replace(year=start.year - 1, month=12, day=1)
+        return start.replace(month=start.month - 1, day=1)
+    return start - datetime.timedelta(days=1)
+
+
+def partition_name(start, granularity):
+    """
+    Returns the table name of a partition:
+        month: shortcode_tracking_p202203
+        day: shortcode_tracking_p20220305
+    """
+    suffix = (
+        start.strftime("%Y%m") if granularity == MONTH else start.strftime("%Y%m%d")
+    )
+    return f"{Tracking._meta.db_table}_p{suffix}"
+
+
+def parse_partition_name(name):
+    """
+    Given a partition table name, returns its (start, granularity) or None
+    if the table wasn't created by this module
+    """
+    prefix = f"{Tracking._meta.db_table}_p"
+    if not name.startswith(prefix):
+        return None
+    suffix = name[len(prefix) :]
+    try:
+        if len(suffix) == 6:
+            return datetime.datetime.strptime(suffix, "%Y%m").date(), MONTH
+        if len(suffix) == 8:
+            return datetime.datetime.strptime(suffix, "%Y%m%d").date(), DAY
+    except ValueError:
+        pass
+    return None
+
+
+def as_datetime(date):
+    """
+    Returns the midnight (UTC) of a date, used as a partition bound
+    """
+    return datetime.datetime.combine(
+        date, datetime.time.min, tzinfo=datetime.timezone.utc
+    )
+
+
+def list_partitions(using="default"):
+    """
+    Returns a sorted list of (start, name) of Tracking partitions
+    """
+    connection = connections[using]
+    if not supports_native_partitioning(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [Tracking._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        parsed = parse_partition_name(name)
+        if parsed is not None:
+            partitions.append((parsed[0], name))
+    return sorted(partitions)
+
+
+def ensure_default_partition(using="default"):
+    """
+    Creates the DEFAULT partition, so inserts don't fail when the partition
+    of their period is missing (e.g. tracking_partitions didn't run)
+    """
+    connection = connections[using]
+    table = Tracking._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS "
+            f"{connection.ops.quote_name(f'{table}_{DEFAULT}')} "
+            f"PARTITION OF {connection.ops.quote_name(table)} DEFAULT"
+        )
+
+
+def create_partition(cursor, connection, name, start, end):
+    """
+    Creates the partition `name` of [start, end), moving to it the rows of
+    that range that were saved in the default partition meanwhile
+    """
+    table = connection.ops.quote_name(Tracking._meta.db_table)
+    default = connection.ops.quote_name(f"{Tracking._meta.db_table}_{DEFAULT}")
+    name = connection.ops.quote_name(name)
+    bounds = [as_datetime(start), as_datetime(end)]
+    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {default} "
+        f"WHERE requested >= %s AND requested < %s RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved",
+        bounds,
+    )
+    cursor.execute(
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+
+
+def ensure_partitions(ahead=None, today=None, using="default"):
+    """
+    Creates the default partition, the partition of the current period and
+    `ahead` periods after it. Returns the names of the created partitions,
+    none before the table is partitioned (migrate to an older migration)
+    """
+    connection = connections[using]
+    if not supports_native_partitioning(connection) or not is_partitioned(connection):
+        return []
+
+    granularity = get_granularity()
+    ahead = settings.TRACKING_PARTITIONS_AHEAD if ahead is None else ahead
+    today = today or timezone.now().date()
+    ensure_default_partition(using)
+    existing = {name for _, name in list_partitions(using)}
+
+    created = []
+    start = period_start(today, granularity)
+    for _ in range(ahead + 1):
+        end = next_period(start, granularity)
+        name = partition_name(start, granularity)
+        if name not in existing:
+            with transaction.atomic(using), connection.cursor() as cursor:
+                create_partition(cursor, connection, name, start, end)
+            created.append(name)
+        start = end
+    return created
+
+
+def retention_cutoff(retention=None, today=None):
+    """
+    Returns the first day that must be kept given a retention in periods,
+    or None if the tracking is kept forever
+    """
+    retention = (
+        settings.TRACKING_PARTITION_RETENTION if retention is None else retention
+    )
+    if not retention:
+        return None
+    granularity = get_granularity()
+    cutoff = period_start(today or timezone.now().date(), granularity)
+    for _ in range(retention - 1):
+        cutoff = previous_period(cutoff, granularity)
+    return cutoff
+
+
+def drop_expired_partitions(retention=None, today=None, using="default"):
+    """
+    Drops whole partitions older than the retention (number of periods,
+    counting the current one) and returns their names. The legacy partition
+    is dropped once all its rows are older, until then its old rows are
+    deleted like the ones of the default partition.
+    Databases without native partitioning fall back to a ranged delete over
+    the `requested` index
+    """
+    cutoff = retention_cutoff(retention, today)
+    if cutoff is None:
+        return []
+
+    connection = connections[using]
+    if not supports_native_partitioning(connection):
+        Tracking.objects.using(using).filter(requested__lt=as_datetime(cutoff)).delete()
+        return []
+
+    table = Tracking._meta.db_table
+    legacy = connection.ops.quote_name(f"{table}_{LEGACY}")
+    default = connection.ops.quote_name(f"{table}_{DEFAULT}")
+    dropped = []
+    with connection.cursor() as cursor:
+        for start, name in list_partitions(using):
+            end = next_period(start, parse_partition_name(name)[1])
+            if end <= cutoff:
+                cursor.execute(
+                    f"DROP TABLE IF EXISTS {connection.ops.quote_name(name)}"
+                )
+                dropped.append(name)
+
+        cursor.execute("SELECT to_regclass(%s)", [f"{table}_{LEGACY}"])
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(f"SELECT max(requested) FROM {legacy}")
+            newest = cursor.fetchone()[0]
+            if newest is None or newest < as_datetime(cutoff):
+                cursor.execute(f"DROP TABLE {legacy}")
+                dropped.append(f"{table}_{LEGACY}")
+            else:
+                cursor.execute(
+                    f"DELETE FROM {legacy} WHERE requested < %s", [as_datetime(cutoff)]
+                )
+
+        cursor.execute("SELECT to_regclass(%s)", [f"{table}_{DEFAULT}"])
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(
+                f"DELETE FROM {default} WHERE requested < %s", [as_datetime(cutoff)]
+            )
+    return dropped
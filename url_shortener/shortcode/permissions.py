@@ -0,0 +1,13 @@
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class IsStaffOrDebug(BasePermission):
+    """
+    Operational endpoints (stats, queries): staff users, or anyone with DEBUG
+    """
+
+    def has_permission(self, request, view):
+        if settings.DEBUG:
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,200 @@
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+"""Statements of transactions, they aren't counted in a budget (SQLite runs BEGIN as a query)"""
+TRANSACTION_REGEX = r"^\s*(BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b"
+"""Literals and placeholders replaced when a query is normalized"""
+LITERALS_REGEX = r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?"
+IN_LIST_REGEX = r"\bIN \((?:\?, )*\?\)"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    A view ran more queries (or spent more time in them) than its budget
+    """
+
+
+def normalize_sql(sql):
+    """
+    Returns the shape of a query: literals and placeholders as ?, IN lists collapsed
+    """
+    sql = re.sub(LITERALS_REGEX, "?", " ".join(sql.split()))
+    return re.sub(IN_LIST_REGEX, "IN (...)", sql)
+
+
+class QueryShapes:
+    """
+    Aggregates count and time of the queries by shape, bounded to `max_shapes`
+    """
+
+    def __init__(self, max_shapes=1000):
+        self.max_shapes = max_shapes
+        self.shapes = {}
+        self.lock = threading.Lock()
+
+    def add(self, sql, duration, plan=None):
+        shape = normalize_sql(sql)
+        with self.lock:
+            stats = self.shapes.get(shape)
+            if stats is None:
+                if len(self.shapes) >= self.max_shapes:
+                    return
+                stats = self.shapes[shape] = {
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "plan": None,
+                }
+            stats["count"] += 1
+            stats["total_ms"] += duration * 1000
+            stats["max_ms"] = max(stats["max_ms"], duration * 1000)
+            if plan is not None:
+                stats["plan"] = plan
+
+    def slowest(self, length=10):
+        """
+        Returns the shapes with more total time: [(sql, stats)]
+        """
+        with self.lock:
+            shapes = [(sql, dict(stats)) for sql, stats in self.shapes.items()]
+        return sorted(shapes, key=lambda shape: -shape[1]["total_ms"])[:length]
+
+    def clear(self):
+        with self.lock:
+            self.shapes.clear()
+
+
+query_shapes = QueryShapes()
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper that counts and times the queries, logs the
+    slow ones (SLOW_QUERY_MS) with their EXPLAIN and aggregates them by shape.
+    The other queries are only normalized if the request exceeds its budget
+    (aggregate()). With a `budget` (strict mode) a query over it raises
+    QueryBudgetExceeded instead of running
+    """
+
+    def __init__(self, slow_ms=None, budget=None):
+        self.slow_ms = settings.SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self.budget = budget
+        self.queries = []
+        self.explaining = False
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, duration in self.queries) * 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining or re.match(TRANSACTION_REGEX, sql):
+            return execute(sql, params, many, context)
+        if self.budget is not None and self.count >= self.budget:
+            raise QueryBudgetExceeded(
+                f"Query over the budget of {self.budget} queries: {sql}\n"
+                + "\n".join(sql for sql, _ in self.queries)
+            )
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+
+        self.queries.append((sql, duration))
+        if duration * 1000 >= self.slow_ms:
+            plan = self.explain(context["connection"], sql, params, many)
+            logger.warning(
+                "Slow query (%.1f ms): %s\nPlan:\n%s", duration * 1000, sql, plan
+            )
+            query_shapes.add(sql, duration, plan)
+        return result
+
+    def aggregate(self):
+        """
+        Adds the queries that weren't slow to query_shapes (the slow ones were
+        added when they ran)
+        """
+        for sql, duration in self.queries:
+            if duration * 1000 < self.slow_ms:
+                query_shapes.add(sql, duration)
+
+    def explain(self, db_connection, sql, params, many):
+        """
+        Returns the plan of a SELECT (other statements aren't explained)
+        """
+        if many or not sql.lstrip().upper().startswith("SELECT"):
+            return None
+        self.explaining = True
+        try:
+            with db_connection.cursor() as cursor:
+                cursor.execute(
+                    f"{db_connection.ops.explain_query_prefix()} {sql}", params
+                )
+                return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+        except Exception as exc:
+            return f"EXPLAIN failed: {exc}"
+        finally:
+            self.explaining = False
+
+
+def check_budget(name, recorder, strict=None):
+    """
+    Compares the queries recorded with the budget of `name` (QUERY_BUDGETS).
+    Raises QueryBudgetExceeded if the queries exceed it and strict
+    (QUERY_BUDGET_STRICT), else logs a warning and aggregates the queries by
+    shape. The time only logs a warning, it depends on the machine
+    """
+    budget = settings.QUERY_BUDGETS.get(name)
+    if budget is None:
+        return
+    strict = settings.QUERY_BUDGET_STRICT if strict is None else strict
+    errors = []
+    too_many = recorder.count > budget["QUERIES"]
+    if too_many:
+        errors.append(f"{recorder.count} queries (budget {budget['QUERIES']})")
+    if recorder.total_ms > budget["TIME_MS"]:
+        errors.append(f"{recorder.total_ms:.1f} ms (budget {budget['TIME_MS']} ms)")
+    if not errors:
+        return
+    message = f"{name} exceeded its query budget: {', '.join(errors)}\n" + "\n".join(
+        sql for sql, _ in recorder.queries
+    )
+    if strict and too_many:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    recorder.aggregate()
+
+
+class QueryBudgetMixin:
+    """
+    APIView mixin: records the queries of a request and checks them against the
+    budget of the view (QUERY_BUDGETS by view name). In strict mode
+    (QUERY_BUDGET_STRICT) the first query over the budget fails the request
+    before it runs, the response is never built. The queries that already ran
+    stay committed (there's no ATOMIC_REQUESTS)
+    """
+
+    def get_budget(self):
+        """
+        Returns the queries of the view's budget in strict mode, else None
+        """
+        budget = settings.QUERY_BUDGETS.get(type(self).__name__)
+        if budget is None or not settings.QUERY_BUDGET_STRICT:
+            return None
+        return budget["QUERIES"]
+
+    def dispatch(self, request, *args, **kwargs):
+        recorder = QueryRecorder(budget=self.get_budget())
+        with connection.execute_wrapper(recorder):
+            response = super().dispatch(request, *args, **kwargs)
+        check_budget(type(self).__name__, recorder)
+        return response
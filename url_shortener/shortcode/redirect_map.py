@@ -0,0 +1,229 @@
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+from datetime import date
+
+"""Formats of a redirect map"""
+NGINX = "nginx"
+BINARY = "binary"
+FORMATS = (NGINX, BINARY)
+
+"""Binary map header: magic, version and number of entries"""
+HEADER = struct.Struct("<4sII")
+MAGIC = b"SCRM"
+VERSION = 1
+"""Binary map entry: shortcode length, target length and expiration (date ordinal)"""
+ENTRY = struct.Struct("<BHI")
+OFFSET = struct.Struct("<I")
+
+"""Characters percent-encoded in nginx values (equivalent in an URL): quotes,
+backslashes, variables and control characters, which could end the entry"""
+NGINX_ESCAPE_REGEX = re.compile(r'["\\$\x00-\x1f\x7f]')
+NGINX_UNESCAPE_REGEX = re.compile(r"%(22|5C|24|[01][0-9A-F]|7F)")
+"""Line of an nginx map: /shortcode "target";  # expiration"""
+NGINX_LINE_REGEX = re.compile(r'^/(\S+) "([^"]*)";  # (\d{4}-\d{2}-\d{2})$')
+
+
+def state_path(path):
+    """
+    Returns the path of the state file of a map (last export time)
+    """
+    return f"{path}.state"
+
+
+def read_state(path):
+    """
+    Returns the state saved by the last export of a map or None
+    """
+    try:
+        with open(state_path(path)) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def write_state(path, state):
+    with AtomicFile(state_path(path), "w") as state_file:
+        json.dump(state, state_file)
+
+
+class AtomicFile:
+    """
+    Writes a temporary file next to `path` and swaps it in place on success,
+    so readers see either the old file or the new one
+    """
+
+    def __init__(self, path, mode="wb"):
+        self.path = str(path)
+        self.mode = mode
+        directory, name = os.path.split(os.path.abspath(self.path))
+        self.tmp_path = os.path.join(directory, f".{name}.tmp-{os.getpid()}")
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, self.mode)
+        return self.file
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.file.close()
+            os.remove(self.tmp_path)
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def escape_nginx(target):
+    return NGINX_ESCAPE_REGEX.sub(lambda match: f"%{ord(match[0]):02X}", target)
+
+
+def unescape_nginx(target):
+    return NGINX_UNESCAPE_REGEX.sub(lambda match: chr(int(match[1], 16)), target)
+
+
+def write_nginx(path, entries):
+    """
+    Writes entries (shortcode, target, expiration) sorted by shortcode as the
+    body of an nginx map:
+        map $uri $shortcode_target { include <path>; }
+    Returns the number of entries written
+    """
+    count = 0
+    with AtomicFile(path, "w") as map_file:
+        for shortcode, target, expiration in entries:
+            map_file.write(
+                f'/{shortcode} "{escape_nginx(target)}";  # {expiration.isoformat()}\n'
+            )
+            count += 1
+    return count
+
+
+def read_nginx(path):
+    """
+    Yields the entries (shortcode, target, expiration) of an nginx map.
+    Raises ValueError on a line that write_nginx wouldn't write
+    """
+    with open(path) as map_file:
+        for number, line in enumerate(map_file, 1):
+            match = NGINX_LINE_REGEX.match(line.rstrip("\n"))
+            if match is None:
+                raise ValueError(f"Map: {path} has an invalid line {number}")
+            shortcode, target, expiration = match.groups()
+            yield shortcode, unescape_nginx(target), date.fromisoformat(expiration)
+
+
+def write_binary(path, entries):
+    """
+    Writes entries (shortcode, target, expiration) sorted by shortcode as a
+    binary map: header, offsets of every entry and the entries. Entries are
+    streamed to a scratch file, only the offsets are kept in memory.
+    Returns the number of entries written
+    """
+    offsets = array("I")
+    scratch_path = f"{path}.entries-{os.getpid()}"
+    try:
+        with open(scratch_path, "wb") as scratch:
+            position = 0
+            for shortcode, target, expiration in entries:
+                shortcode, target = shortcode.encode(), target.encode()
+                offsets.append(position)
+                record = ENTRY.pack(len(shortcode), len(target), expiration.toordinal())
+                scratch.write(record + shortcode + target)
+                position += len(record) + len(shortcode) + len(target)
+
+        data_start = HEADER.size + OFFSET.size * len(offsets)
+        with AtomicFile(path) as map_file, open(scratch_path, "rb") as scratch:
+            map_file.write(HEADER.pack(MAGIC, VERSION, len(offsets)))
+            map_file.write(array("I", (data_start + o for o in offsets)).tobytes())
+            while chunk := scratch.read(1 << 20):
+                map_file.write(chunk)
+    finally:
+        os.remove(scratch_path)
+    return len(offsets)
+
+
+class RedirectMap:
+    """
+    Memory-mapped binary map, looked up by binary search over its offsets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as map_file:
+            self._mmap = mmap.mmap(map_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Map: {path} has an unknown format")
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """
+        Yields the entries (shortcode, target, expiration) in order
+        """
+        for position in range(self._count):
+            yield self._entry(position)
+
+    def _entry(self, position):
+        (offset,) = OFFSET.unpack_from(self._mmap, HEADER.size + OFFSET.size * position)
+        shortcode_length, target_length, expiration = ENTRY.unpack_from(
+            self._mmap, offset
+        )
+        start = offset + ENTRY.size
+        shortcode = self._mmap[start : start + shortcode_length]
+        start += shortcode_length
+        target = self._mmap[start : start + target_length]
+        return shortcode.decode(), target.decode(), date.fromordinal(expiration)
+
+    def _shortcode(self, position):
+        (offset,) = OFFSET.unpack_from(self._mmap, HEADER.size + OFFSET.size * position)
+        start = offset + ENTRY.size
+        return self._mmap[start : start + self._mmap[offset]]
+
+    def get(self, shortcode, today=None):
+        """
+        Returns the target of a shortcode, None if it isn't found or is expired
+        """
+        key = shortcode.encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._shortcode(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count or self._shortcode(low) != key:
+            return None
+        _, target, expiration = self._entry(low)
+        if expiration < (today or date.today()):
+            return None
+        return target
+
+    def close(self):
+        self._mmap.close()
+
+
+def read_binary(path):
+    redirect_map = RedirectMap(path)
+    try:
+        yield from redirect_map
+    finally:
+        redirect_map.close()
+
+
+def write_map(path, entries, format):
+    if format == BINARY:
+        return write_binary(path, entries)
+    return write_nginx(path, entries)
+
+
+def read_map(path, format):
+    if format == BINARY:
+        return read_binary(path)
+    return read_nginx(path)
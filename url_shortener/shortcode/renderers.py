@@ -0,0 +1,114 @@
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib json is used without it
+    orjson = None
+
+"""Accept headers answered with JSON without parsing them"""
+JSON_ACCEPTS = ("", "*/*", "application/json")
+"""Body of a resolve (/:shortcode) response, the JSON string of the URL goes in"""
+RESOLVE_TEMPLATE = b'{"url":%s}'
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """
+    Returns the JSON bytes of `data`, the same JSONRenderer renders (compact,
+    UTF-8, U+2028 and U+2029 escaped) with orjson when it's installed
+    """
+    if orjson is None:
+        encoded = json.dumps(
+            data,
+            cls=JSONEncoder,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode()
+    else:
+        encoded = orjson.dumps(
+            data,
+            default=_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+    return encoded.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+        b"\xe2\x80\xa9", b"\\u2029"
+    )
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson. It falls back to JSONRenderer for indented
+    responses (Accept: application/json; indent=N) and when UNICODE_JSON or
+    COMPACT_JSON are disabled
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser backed by orjson (UTF-8 bodies), other encodings use the stdlib
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+class FastJSONNegotiation(DefaultContentNegotiation):
+    """
+    Picks the JSON renderer right away when the client accepts anything or
+    JSON (no ?format), the usual API request. Others are negotiated by DRF.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        accept = request.META.get("HTTP_ACCEPT", "")
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        if (
+            accept in JSON_ACCEPTS
+            and not format_suffix
+            and format_query_param not in request.query_params
+        ):
+            for renderer in renderers:
+                if renderer.media_type == "application/json":
+                    return renderer, renderer.media_type
+        return super().select_renderer(request, renderers, format_suffix)
+
+
+def resolve_response(request, target):
+    """
+    Returns the response of a resolved URL: the pre-encoded body when JSON was
+    negotiated, else a Response rendered by the accepted renderer
+    """
+    if isinstance(getattr(request, "accepted_renderer", None), FastJSONRenderer):
+        return HttpResponse(
+            RESOLVE_TEMPLATE % dumps(target),
+            content_type="application/json",
+            status=status.HTTP_200_OK,
+        )
+    return Response(data={"url": target}, status=status.HTTP_200_OK)
@@ -0,0 +1,370 @@
+import atexit
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from shortcode.models import URL, CompactedSegment, Tracking
+from shortcode.visitors import add_visits
+
+logger = logging.getLogger(__name__)
+
+"""Segment header: magic, format version and record size"""
+HEADER = struct.Struct("<4sHH")
+MAGIC = b"SCTR"
+VERSION = 1
+"""Segment record: url id, requested (microseconds since epoch) and client fingerprint (0 if unknown)"""
+RECORD = struct.Struct("<QqQ")
+
+"""
+Extension of a segment being created, of the segment being written (locked
+by its writer) and of the sealed ones (ready to compact)
+"""
+NEW_SUFFIX = ".new"
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".seg"
+
+
+def to_timestamp(requested):
+    """
+    Returns a datetime as microseconds since epoch
+    """
+    return int(requested.timestamp() * 1_000_000)
+
+
+def from_timestamp(timestamp):
+    """
+    Returns microseconds since epoch as an aware datetime (UTC)
+    """
+    return datetime.fromtimestamp(timestamp / 1_000_000, tz=timezone.utc)
+
+
+"""Writers of this process, sealed at exit and reset in forked children"""
+_writers = weakref.WeakSet()
+
+
+def lock(segment_file):
+    """
+    Takes the exclusive flock of an open segment without waiting. True if it
+    was free: its writer is gone (the kernel releases the lock of a process
+    that exits, whatever its PID namespace)
+    """
+    try:
+        fcntl.flock(segment_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class SegmentWriter:
+    """
+    Appends tracking records to rotating segment files in `directory`.
+    A segment is sealed (renamed to .seg) when it reaches `max_records`,
+    when it is older than `max_age` seconds or when the process exits, only
+    sealed segments are read by the compactor.
+    """
+
+    def __init__(self, directory, max_records=65536, max_age=60, buffer_size=65536):
+        self.directory = str(directory)
+        self.max_records = max_records
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._pid = None
+        self._opened = 0
+        self._records = 0
+        self._sequence = 0
+        self._timer = None
+        os.makedirs(self.directory, exist_ok=True)
+        _writers.add(self)
+
+    def append(self, url_id, requested, client=0):
+        """
+        Appends a record to the current segment
+        """
+        record = RECORD.pack(url_id, to_timestamp(requested), client or 0)
+        with self._lock:
+            if self._file is None or self._pid != os.getpid():
+                self._open()
+            self._file.write(record)
+            self._records += 1
+            if self._records >= self.max_records:
+                self._seal()
+
+    def seal(self):
+        """
+        Seals the current segment (if any) so it can be compacted
+        """
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._seal()
+
+    def _open(self):
+        """
+        Opens a new segment. A forked process never reuses the parent's file.
+        The segment is locked before it's renamed to .open, the compactor never
+        sees an open segment without its lock
+        """
+        self._pid = os.getpid()
+        self._sequence += 1
+        name = f"{time.time_ns()}-{self._pid}-{self._sequence}"
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path + NEW_SUFFIX, "xb", buffering=self.buffer_size)
+        lock(self._file)
+        os.rename(self._path + NEW_SUFFIX, self._path + OPEN_SUFFIX)
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._opened = time.monotonic()
+        self._records = 0
+        self._schedule()
+
+    def _seal(self):
+        """
+        Flushes, renames and then unlocks the segment (closing it). If it was
+        already sealed by the compactor (its lock was lost) it's left as it is
+        """
+        path, segment_file = self._path, self._file
+        self._file = None
+        self._path = None
+        try:
+            segment_file.flush()
+            os.rename(path + OPEN_SUFFIX, path + SEALED_SUFFIX)
+        except FileNotFoundError:
+            logger.warning("Segment %s was sealed by another process", path)
+        finally:
+            segment_file.close()
+
+    def _schedule(self):
+        """
+        Seals idle segments so their records don't wait for the next append
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.max_age, self._seal_if_old)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _seal_if_old(self):
+        with self._lock:
+            if self._file is None or self._pid != os.getpid():
+                return
+            if time.monotonic() - self._opened >= self.max_age:
+                self._seal()
+            else:
+                self._schedule()
+
+    def _before_fork(self):
+        """
+        Flushes the buffer, so the child doesn't write the parent's records again
+        """
+        self._lock.acquire()
+        if self._file is not None:
+            self._file.flush()
+
+    def _after_fork_in_parent(self):
+        self._lock.release()
+
+    def _after_fork_in_child(self):
+        """
+        Closes the inherited segment (its buffer is empty), the child opens its own.
+        The parent keeps the lock, it belongs to its open file
+        """
+        self._lock = threading.Lock()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._path = None
+        self._timer = None
+
+
+def _seal_writers():
+    for writer in list(_writers):
+        writer.seal()
+
+
+def _before_fork():
+    for writer in list(_writers):
+        writer._before_fork()
+
+
+def _after_fork_in_parent():
+    for writer in list(_writers):
+        writer._after_fork_in_parent()
+
+
+def _after_fork_in_child():
+    for writer in list(_writers):
+        writer._after_fork_in_child()
+
+
+atexit.register(_seal_writers)
+os.register_at_fork(
+    before=_before_fork,
+    after_in_parent=_after_fork_in_parent,
+    after_in_child=_after_fork_in_child,
+)
+
+
+class SegmentReader:
+    """
+    Memory-maps a segment to scan its records without loading them.
+    Use it as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = None
+        self._records = memoryview(b"")
+        if size > HEADER.size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, record_size = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                self.close()
+                raise ValueError(f"Segment: {path} has an unknown format")
+            end = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+            self._records = memoryview(self._mmap)[HEADER.size : end]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._records) // RECORD.size
+
+    def __iter__(self):
+        """
+        Yields (url_id, requested timestamp, client) lazily
+        """
+        return RECORD.iter_unpack(self._records)
+
+    def count_by_url(self):
+        """
+        Returns a Counter of requests by url id
+        """
+        return Counter(record[0] for record in self)
+
+    def scan(self, url_id):
+        """
+        Yields the requested timestamps of an url id
+        """
+        for record_url_id, requested, _ in self:
+            if record_url_id == url_id:
+                yield requested
+
+    def close(self):
+        self._records.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+def adopt_stale_segments(directory):
+    """
+    Seals the open segments that no writer has locked (their process crashed
+    or was killed before sealing). Returns their paths
+    """
+    adopted = []
+    for name in os.listdir(directory):
+        if not name.endswith(OPEN_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        sealed = path[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX
+        try:
+            with open(path, "rb") as segment_file:
+                if not lock(segment_file):
+                    continue
+                os.rename(path, sealed)
+        except FileNotFoundError:
+            continue
+        adopted.append(sealed)
+    return adopted
+
+
+def sealed_segments(directory):
+    """
+    Returns the paths of the sealed segments, oldest first. Open segments
+    of dead processes are sealed first
+    """
+    if not os.path.isdir(directory):
+        return []
+    adopt_stale_segments(directory)
+    names = sorted(
+        name for name in os.listdir(directory) if name.endswith(SEALED_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def compact_segment(path, batch_size=5000):
+    """
+    Folds a sealed segment into Tracking and the visitor sketches, then deletes
+    it. The segment's CompactedSegment is saved in the same transaction: a crash
+    between the commit and the delete doesn't fold it again. Records of URLs
+    that no longer exist are skipped. Returns the number of records folded
+    """
+    name = os.path.basename(path)[: -len(SEALED_SUFFIX)]
+    if CompactedSegment.objects.filter(name=name).exists():
+        os.remove(path)
+        CompactedSegment.objects.filter(name=name).delete()
+        return 0
+    folded = 0
+    visits = defaultdict(list)
+    with SegmentReader(path) as reader, transaction.atomic():
+        counts = reader.count_by_url()
+        url_ids = set(URL.objects.filter(pk__in=counts).values_list("pk", flat=True))
+        skipped = sum(
+            count for url_id, count in counts.items() if url_id not in url_ids
+        )
+        if skipped:
+            logger.warning(
+                "Segment %s: %s records of deleted URLs skipped", name, skipped
+            )
+        batch = []
+        for url_id, timestamp, fingerprint in reader:
+            if url_id not in url_ids:
+                continue
+            requested = from_timestamp(timestamp)
+            batch.append(
+                Tracking(
+                    url_id=url_id, requested=requested, fingerprint=fingerprint or None
+                )
+            )
+            if fingerprint:
+                visits[(url_id, requested.date())].append(fingerprint)
+            if len(batch) >= batch_size:
+                Tracking.objects.bulk_create(batch)
+                folded += len(batch)
+                batch = []
+        Tracking.objects.bulk_create(batch)
+        folded += len(batch)
+        for (url_id, day), fingerprints in visits.items():
+            add_visits(url_id, day, fingerprints)
+        CompactedSegment.objects.create(name=name)
+    os.remove(path)
+    CompactedSegment.objects.filter(name=name).delete()
+    return folded
+
+
+def compact(directory, batch_size=5000):
+    """
+    Folds every sealed segment of a directory. Returns (segments, records)
+    """
+    segments = 0
+    records = 0
+    for path in sealed_segments(directory):
+        records += compact_segment(path, batch_size)
+        segments += 1
+    return segments, records
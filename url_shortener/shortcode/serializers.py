@@ -2,11 +2,16 @@ import re, string, random
 from datetime import datetime, timedelta
 
 from rest_framework import serializers
-from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from shortcode.constants import URL_REGEX, QUERY_PARAMS_REGEX
-from shortcode.models import URL, Tracking
+from shortcode.constants import URL_FORBIDDEN_REGEX, URL_REGEX, QUERY_PARAMS_REGEX
+from shortcode.dedup import get_dedup_cache
+from shortcode.models import URL
+from shortcode.shortcode_table import get_table_reader
+from shortcode.singleflight import get_single_flight
+from shortcode.tracking import record_request
+from shortcode.visitors import unique_visitors
 
 
 class CreateURLSerializer(serializers.Serializer):
@@ -27,7 +32,10 @@ class CreateURLSerializer(serializers.Serializer):
         """
         Verify if a string starts with https://
         """
-        url_is_invalid = re.search(URL_REGEX, url) is None
+        url_is_invalid = (
+            re.search(URL_REGEX, url) is None
+            or re.search(URL_FORBIDDEN_REGEX, url) is not None
+        )
         if url_is_invalid:
             raise serializers.ValidationError(
                 f"URL: {url} is not a valid URL. Must be started with http or https"
@@ -38,11 +46,9 @@ class CreateURLSerializer(serializers.Serializer):
         """
         Verify if a shortcode is already used
         """
-        try:
-            URL.objects.get(shortcode=shortcode)
+        if URL.objects.filter(shortcode=shortcode).exists():
             raise serializers.ValidationError(f"Shortcode: {shortcode} is already used")
-        except URL.DoesNotExist:
-            return shortcode
+        return shortcode
 
     def validate_expiration(self, expiration):
         """
@@ -82,8 +88,15 @@ class CreateURLSerializer(serializers.Serializer):
         Create and return a new `URL` instance, given the validated data.
         """
         if is_new:
-            url = URL.objects.create(**url_to_insert)
+            # name and query_params are parts of the fullname, not columns
+            url = URL.objects.create(
+                description=url_to_insert["description"],
+                shortcode=url_to_insert["shortcode"],
+                fullname=url_to_insert["fullname"],
+                expiration=url_to_insert["expiration"],
+            )
             url_to_insert["id"] = url.pk
+            get_dedup_cache().set(url.fullname_hash, url.shortcode, url.expiration)
         return url_to_insert
 
     def __get_name_and_query_params(self, fullname):
@@ -129,21 +142,35 @@ class CreateURLSerializer(serializers.Serializer):
     def __get_shortcode(self, fullname):
         """
         Returns a shortcode by two conditions:
-        - If the URL was already inserted, returns its shortcode
+        - If the URL was already inserted (and is active), returns its shortcode
         - Else return a shortcode if this is custom or a random 6 length string
+        The URL is looked up in the dedup cache before the database
         """
         shortcode_generated = self.validated_data.get(
             "shortcode",
             self.__get_random_string(6),
         )
-        try:
-            duplicated_url = URL.objects.get(fullname=fullname)
-            is_new = duplicated_url.expiration < datetime.today().date()
-            shortcode = shortcode_generated if is_new else duplicated_url.shortcode
-            return shortcode, is_new
-        except URL.DoesNotExist:
-            is_new = True
-            return shortcode_generated, is_new
+        digest = URL.hash_fullname(fullname)
+        dedup_cache = get_dedup_cache()
+        duplicated = dedup_cache.get(digest)
+        if duplicated is None:
+            # the latest active one, an URL created again after expiring or being
+            # deactivated shares its hash
+            duplicated_url = (
+                URL.objects.filter(fullname_hash=digest, active=True)
+                .order_by("-expiration")
+                .first()
+            )
+            if duplicated_url is None:
+                is_new = True
+                return shortcode_generated, is_new
+            duplicated = duplicated_url.shortcode, duplicated_url.expiration
+            dedup_cache.set(digest, *duplicated)
+
+        shortcode, expiration = duplicated
+        is_new = expiration < datetime.today().date()
+        shortcode = shortcode_generated if is_new else shortcode
+        return shortcode, is_new
 
     def __get_expiration(self):
         """
@@ -171,18 +198,85 @@ class RecoverURLSerializer(serializers.Serializer):
 
     def get_url(self):
         """
-        Return an URL instance if its found by a shortcode, else returns 404
+        Return an URL instance if its found by a shortcode, else returns 404.
+        The shortcode table (SHORTCODE_TABLE) is checked before the database,
+        concurrent database lookups of a shortcode share one query (SINGLE_FLIGHT)
         """
         shortcode = self.validated_data.get("shortcode")
-        url = get_object_or_404(URL, shortcode=shortcode)
-        is_expired = url.expiration < datetime.today().date()
-        if is_expired:
-            raise Http404
-        return url
+        url = self.__get_url_from_table(shortcode)
+        if url is not None:
+            return url
+        single_flight = get_single_flight()
+        if single_flight is None:
+            return self.__get_url_from_database(shortcode)
+        return single_flight.do(
+            shortcode, lambda: self.__get_url_from_database(shortcode)
+        )
+
+    def __get_url_from_database(self, shortcode):
+        """
+        Only active and unexpired URLs resolve, like the entries of the shortcode table
+        """
+        urls = URL.objects.resolvable(datetime.today().date()).select_related("host")
+        return get_object_or_404(urls, shortcode=shortcode)
+
+    def __get_url_from_table(self, shortcode):
+        """
+        Returns an unsaved URL with the id and target of an unexpired entry of
+        the shortcode table, else None (the database is checked). The table only
+        has active URLs, deactivated ones are invalidated
+        """
+        reader = get_table_reader()
+        entry = reader.get(shortcode) if reader is not None else None
+        if entry is None:
+            return None
+        url_id, target, expiration = entry
+        if expiration < datetime.today().date():
+            return None
+        return URL(
+            id=url_id, shortcode=shortcode, location=target, expiration=expiration
+        )
+
+    def create_tracking(self, url, fingerprint=None, ip=None):
+        """
+        Save a row of requested url (see TRACKING_SINK and GEOIP_ENRICHMENT)
+        """
+        record_request(url, fingerprint, ip)
+
+
+class VisitorsSerializer(serializers.Serializer):
+    """
+    /:shortcode/visitors serializer
+    """
+
+    shortcode = serializers.CharField(
+        required=True, allow_blank=False, min_length=6, max_length=256
+    )
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        """
+        Verify that start is not after end
+        """
+        start, end = data.get("start"), data.get("end")
+        if start and end and start > end:
+            raise serializers.ValidationError(f"Start: {start} is after end: {end}")
+        return data
 
-    def create_tracking(self, url):
+    def get_unique_visitors(self):
         """
-        Save a row of requested url
+        Returns the approximate unique visitors of an URL by a shortcode in a date
+        range (by default since the URL was created until today), else returns 404
         """
-        tracking = Tracking(url=url)
-        tracking.save()
+        shortcode = self.validated_data.get("shortcode")
+        url = get_object_or_404(URL, shortcode=shortcode)
+        start = self.validated_data.get("start", url.created.date())
+        # same day as the sketches, which are bucketed by the request's UTC date
+        end = self.validated_data.get("end", timezone.now().date())
+        return {
+            "shortcode": shortcode,
+            "start": start,
+            "end": end,
+            "unique_visitors": unique_visitors(url, start, end),
+        }
@@ -0,0 +1,277 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import date
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from shortcode.invalidation import bus_is_healthy
+from shortcode.redirect_map import AtomicFile
+
+"""Table header: magic, version, capacity (slots), entries and generation"""
+HEADER = struct.Struct("<4sHHIIQ")
+MAGIC = b"SCST"
+VERSION = 1
+"""Table entry: url id, shortcode length, target length and expiration (date ordinal)"""
+ENTRY = struct.Struct("<QBHI")
+"""Slots are filled up to this ratio, so probes stay short"""
+LOAD_FACTOR = 0.6
+
+
+def hash_shortcode(shortcode):
+    """
+    Returns the 64 bits hash of a shortcode (bytes), never 0 (an empty slot).
+    hash() can't be used, it changes between processes
+    """
+    digest = hashlib.blake2b(shortcode, digest_size=8).digest()
+    return int.from_bytes(digest, "little") | 1
+
+
+def table_capacity(count):
+    """
+    Returns the slots of a table of `count` entries: a power of 2 filled up to LOAD_FACTOR
+    """
+    capacity = 8
+    while capacity * LOAD_FACTOR < count:
+        capacity *= 2
+    return capacity
+
+
+def write_table(path, entries, generation=None):
+    """
+    Writes entries (url id, shortcode, target, expiration) as an open addressing
+    hash table of linear probing: header, hash of every slot (0 is empty),
+    offset of the entry of every slot and the entries. The file is immutable,
+    a refresh writes a new one and swaps it in place.
+    Returns the number of entries written
+    """
+    hashes, offsets = array("Q"), array("Q")
+    scratch_path = f"{path}.entries-{os.getpid()}"
+    try:
+        with open(scratch_path, "wb") as scratch:
+            position = 0
+            for url_id, shortcode, target, expiration in entries:
+                shortcode, target = shortcode.encode(), target.encode()
+                hashes.append(hash_shortcode(shortcode))
+                offsets.append(position)
+                record = ENTRY.pack(
+                    url_id, len(shortcode), len(target), expiration.toordinal()
+                )
+                scratch.write(record + shortcode + target)
+                position += len(record) + len(shortcode) + len(target)
+
+        count = len(hashes)
+        capacity = table_capacity(count)
+        data_start = HEADER.size + 16 * capacity
+        slot_hashes = array("Q", bytes(8 * capacity))
+        slot_offsets = array("Q", bytes(8 * capacity))
+        for entry_hash, offset in zip(hashes, offsets):
+            slot = entry_hash & (capacity - 1)
+            while slot_hashes[slot]:
+                slot = (slot + 1) & (capacity - 1)
+            slot_hashes[slot] = entry_hash
+            slot_offsets[slot] = data_start + offset
+        del hashes, offsets
+
+        generation = time.time_ns() if generation is None else generation
+        with AtomicFile(path) as table_file, open(scratch_path, "rb") as scratch:
+            table_file.write(
+                HEADER.pack(MAGIC, VERSION, 0, capacity, count, generation)
+            )
+            table_file.write(slot_hashes.tobytes())
+            table_file.write(slot_offsets.tobytes())
+            while chunk := scratch.read(1 << 20):
+                table_file.write(chunk)
+    finally:
+        os.remove(scratch_path)
+    return count
+
+
+class ShortcodeTable:
+    """
+    Memory-mapped table written by write_table. The pages are shared by every
+    process that maps the file and lookups take no locks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as table_file:
+            self._mmap = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.inode = os.fstat(table_file.fileno()).st_ino
+        header = HEADER.unpack_from(self._mmap)
+        magic, version, _, self.capacity, self.count, self.generation = header
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"Table: {path} has an unknown format")
+        slots = memoryview(self._mmap)[HEADER.size : HEADER.size + 16 * self.capacity]
+        self._hashes = slots[: 8 * self.capacity].cast("Q")
+        self._offsets = slots[8 * self.capacity :].cast("Q")
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """
+        Yields the entries (url id, shortcode, target, expiration) in slot order
+        """
+        for slot in range(self.capacity):
+            if self._hashes[slot]:
+                yield self._entry(self._offsets[slot])
+
+    def _entry(self, offset):
+        url_id, shortcode_length, target_length, expiration = ENTRY.unpack_from(
+            self._mmap, offset
+        )
+        start = offset + ENTRY.size
+        shortcode = self._mmap[start : start + shortcode_length]
+        start += shortcode_length
+        target = self._mmap[start : start + target_length]
+        return url_id, shortcode.decode(), target.decode(), date.fromordinal(expiration)
+
+    def get(self, shortcode):
+        """
+        Returns (url id, target, expiration) of a shortcode or None
+        """
+        key = shortcode.encode()
+        key_hash = hash_shortcode(key)
+        mask = self.capacity - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash = self._hashes[slot]
+            if not slot_hash:
+                return None
+            if slot_hash == key_hash:
+                offset = self._offsets[slot]
+                start = offset + ENTRY.size
+                if self._mmap[start : start + self._mmap[offset + 8]] == key:
+                    url_id, _, target, expiration = self._entry(offset)
+                    return url_id, target, expiration
+            slot = (slot + 1) & mask
+
+
+class TableReader:
+    """
+    Reads the table at `path` and maps the new generation when a loader swaps
+    it, checking at most every `check_interval` seconds. The previous mapping
+    is released once no lookup uses it.
+
+    Shortcodes changed after the generation was loaded are invalidated (by
+    shortcode.invalidation) and skipped. A generation is used `max_ttl`
+    seconds after it was loaded at most (an event may be lost), only
+    `fallback_ttl` seconds without the invalidation bus.
+    At most `max_invalidated` shortcodes are kept (the loader may have
+    stopped): past that the table isn't used until a generation loaded after
+    the last of them.
+    """
+
+    def __init__(
+        self,
+        path,
+        check_interval=1,
+        fallback_ttl=60,
+        max_invalidated=10000,
+        max_ttl=3600,
+    ):
+        self.path = path
+        self.check_interval = check_interval
+        self.fallback_ttl = fallback_ttl
+        self.max_ttl = max_ttl
+        self.max_invalidated = max_invalidated
+        self.table = None
+        self.checked = 0
+        self.invalidated = {}
+        self.stale_until = 0
+        self.lock = threading.Lock()
+
+    def invalidate(self, shortcode, changed):
+        """
+        Skips a shortcode changed at `changed` (ns) until a newer generation
+        """
+        with self.lock:
+            if changed <= self.stale_until:
+                return
+            self.invalidated[shortcode] = max(
+                changed, self.invalidated.get(shortcode, 0)
+            )
+            if len(self.invalidated) > self.max_invalidated:
+                self.stale_until = max(self.invalidated.values())
+                self.invalidated = {}
+
+    def invalidate_all(self, changed):
+        """
+        Skips every shortcode until a generation loaded after `changed` (ns)
+        """
+        with self.lock:
+            self.stale_until = max(changed, self.stale_until)
+            self.invalidated = {}
+
+    def current(self):
+        now = time.monotonic()
+        if now - self.checked >= self.check_interval and self.lock.acquire(False):
+            try:
+                self.checked = now
+                self.refresh()
+            finally:
+                self.lock.release()
+        return self.table
+
+    def refresh(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self.table = None
+            return
+        if self.table is None or self.table.inode != inode:
+            self.table = ShortcodeTable(self.path)
+            generation = self.table.generation
+            self.invalidated = {
+                shortcode: changed
+                for shortcode, changed in list(self.invalidated.items())
+                if changed >= generation
+            }
+
+    def get(self, shortcode):
+        table = self.current()
+        if table is None or shortcode in self.invalidated:
+            return None
+        if table.generation <= self.stale_until:
+            return None
+        ttl = self.max_ttl if bus_is_healthy() else self.fallback_ttl
+        if time.time_ns() - table.generation > ttl * 1e9:
+            return None
+        return table.get(shortcode)
+
+
+_reader = None
+
+
+def get_table_reader():
+    """
+    Returns the reader of SHORTCODE_TABLE of this process, None if it isn't set
+    """
+    global _reader
+    if _reader is None and settings.SHORTCODE_TABLE:
+        _reader = TableReader(
+            settings.SHORTCODE_TABLE,
+            settings.SHORTCODE_TABLE_CHECK_INTERVAL,
+            settings.INVALIDATION_BUS["FALLBACK_TTL"],
+            max_ttl=settings.INVALIDATION_BUS["MAX_TTL"],
+        )
+    return _reader
+
+
+def reset_table_reader(setting, **kwargs):
+    """
+    Drops the reader when SHORTCODE_TABLE changes (tests)
+    """
+    global _reader
+    if setting in ("SHORTCODE_TABLE", "SHORTCODE_TABLE_CHECK_INTERVAL"):
+        _reader = None
+
+
+setting_changed.connect(reset_table_reader)
@@ -0,0 +1,129 @@
+import copy
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+
+class LeaderFailed(RuntimeError):
+    """
+    Raised to the followers when the exception of the leader can't be copied,
+    or when the leader was interrupted (KeyboardInterrupt, SystemExit...)
+    """
+
+
+def follower_exception(exception):
+    """
+    Returns a copy of the exception of the leader for a follower. Raising the
+    same instance in several threads or tasks would mix their tracebacks,
+    callers raise it `from` the leader's one
+    """
+    try:
+        return copy.copy(exception)
+    except Exception:
+        return LeaderFailed(f"The call of the leader failed: {exception!r}")
+
+
+class Call:
+    """
+    A call in flight: its followers wait for `done` and share its result or exception.
+    `returned` tells a None result from a leader that never returned
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.returned = False
+        self.exception = None
+
+    def get(self):
+        """
+        Returns a shallow copy of the result, a follower changing its URL doesn't
+        change the leader's one (nor the other followers')
+        """
+        if self.exception is not None:
+            raise follower_exception(self.exception) from self.exception
+        if not self.returned:
+            raise LeaderFailed("The call of the leader was interrupted")
+        return copy.copy(self.result)
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key, in threads of this process, wait for
+    the first one (the leader) and share a copy of its result or exception.
+    A follower that waits more than `timeout` seconds runs the call itself,
+    so a slow leader can't block it.
+    """
+
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.counters = {"leaders": 0, "followers": 0, "timeouts": 0}
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self.lock:
+            return {"in_flight": len(self.calls), **self.counters}
+
+    def do(self, key, function):
+        """
+        Returns function() or the result of the call with the same key in flight
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.counters["leaders"] += 1
+            else:
+                self.counters["followers"] += 1
+        if not leader:
+            if call.done.wait(self.timeout):
+                return call.get()
+            self.count("timeouts")
+            return function()
+
+        try:
+            call.result = function()
+            call.returned = True
+        except Exception as exception:
+            call.exception = exception
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+_single_flight = None
+
+
+def get_single_flight():
+    """
+    Returns the SingleFlight of this process, None if SINGLE_FLIGHT is disabled
+    """
+    global _single_flight
+    config = settings.SINGLE_FLIGHT
+    if not config["ENABLED"]:
+        return None
+    if _single_flight is None:
+        _single_flight = SingleFlight(config["TIMEOUT"])
+    return _single_flight
+
+
+def reset_single_flight(setting, **kwargs):
+    """
+    Drops the SingleFlight when SINGLE_FLIGHT changes (tests)
+    """
+    global _single_flight
+    if setting == "SINGLE_FLIGHT":
+        _single_flight = None
+
+
+setting_changed.connect(reset_single_flight)
@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+from shortcode.querylog import QueryRecorder, check_budget
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin to assert the query budgets of QUERY_BUDGETS
+    """
+
+    @contextmanager
+    def assertWithinQueryBudget(self, name):
+        """
+        Fails if the queries run in the block exceed the budget of `name`
+        """
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            yield recorder
+        check_budget(name, recorder, strict=True)
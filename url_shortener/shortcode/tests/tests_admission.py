@@ -0,0 +1,132 @@
+import copy
+import threading
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from shortcode.admission import (
+    CREATE,
+    RESOLVE,
+    ClientBuckets,
+    ConcurrencyLimiter,
+    TokenBucket,
+    get_controller,
+)
+from shortcode.models import URL
+
+
+def admission_control(**changes):
+    config = copy.deepcopy(settings.ADMISSION_CONTROL)
+    for key, value in changes.items():
+        if isinstance(value, dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return override_settings(ADMISSION_CONTROL=config)
+
+
+class TokenBucketTestCase(TestCase):
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=1, burst=2)
+
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0.9)
+
+
+class ClientBucketsTestCase(TestCase):
+    def test_evicts_oldest_clients(self):
+        buckets = ClientBuckets(rate=1, burst=1, max_clients=2)
+        for client in ("a", "b", "c"):
+            buckets.take(client)
+
+        self.assertEqual(list(buckets.buckets), ["b", "c"])
+
+
+class ConcurrencyLimiterTestCase(TestCase):
+    def test_creates_leave_reserved_slots(self):
+        limiter = ConcurrencyLimiter(max_in_flight=2, max_queue=0, reserved=1)
+
+        self.assertIsNone(limiter.acquire(CREATE, timeout=0))
+        self.assertEqual(limiter.acquire(CREATE, timeout=0), "queue_full")
+        self.assertIsNone(limiter.acquire(RESOLVE, timeout=0))
+
+    def test_queue_timeout(self):
+        limiter = ConcurrencyLimiter(max_in_flight=1, max_queue=1, reserved=0)
+        limiter.acquire(RESOLVE, timeout=0)
+
+        self.assertEqual(limiter.acquire(RESOLVE, timeout=0.01), "timeout")
+
+    def test_waiting_resolve_enters_before_creates(self):
+        limiter = ConcurrencyLimiter(max_in_flight=1, max_queue=2, reserved=0)
+        limiter.acquire(RESOLVE, timeout=0)
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(limiter.acquire(RESOLVE, timeout=5))
+        )
+        waiter.start()
+        while not limiter.waiting[RESOLVE]:
+            pass
+
+        limiter.release()
+        self.assertEqual(limiter.acquire(CREATE, timeout=0.01), "timeout")
+        waiter.join()
+        self.assertEqual(results, [None])
+
+
+class AdmissionViewTestCase(TestCase):
+    def setUp(self):
+        URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+        )
+
+    def test_disabled_by_default(self):
+        statuses = {self.client.get("/shortcode").status_code for _ in range(300)}
+
+        self.assertEqual(statuses, {200})
+        self.assertEqual(get_controller().stats()["counters"], {})
+
+    def test_client_rate_limited(self):
+        with admission_control(
+            ENABLED=True, RESOLVE={"CLIENT_RATE": 0.1, "CLIENT_BURST": 2}
+        ):
+            statuses = [self.client.get("/shortcode").status_code for _ in range(3)]
+            other_client = self.client.get("/shortcode", REMOTE_ADDR="10.0.0.1")
+            resp = self.client.get("/shortcode")
+            counters = get_controller().stats()["counters"]
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(other_client.status_code, 200)
+        self.assertEqual(resp["Retry-After"], "10")
+        self.assertEqual(counters["resolve.shed_client"], 2)
+        self.assertEqual(counters["resolve.admitted"], 3)
+
+    def test_forwarded_for_ignored(self):
+        with admission_control(
+            ENABLED=True, RESOLVE={"CLIENT_RATE": 0.1, "CLIENT_BURST": 1}
+        ):
+            statuses = [
+                self.client.get(
+                    "/shortcode", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}"
+                ).status_code
+                for i in range(3)
+            ]
+
+        self.assertEqual(statuses, [200, 429, 429])
+
+    def test_saturated(self):
+        with admission_control(ENABLED=True, MAX_IN_FLIGHT=1, MAX_QUEUE=0):
+            get_controller().limiter.acquire(RESOLVE, timeout=0)
+            resp = self.client.get("/shortcode")
+            forbidden = self.client.get(reverse("admission-stats"))
+            with override_settings(DEBUG=True):
+                stats = self.client.get(reverse("admission-stats")).json()
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "1")
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertEqual(stats["in_flight"], 1)
+        self.assertEqual(stats["counters"], {"resolve.shed_queue_full": 1})
@@ -0,0 +1,92 @@
+from collections import Counter
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from shortcode.dataset import SHORTCODE_SPACE, DatasetGenerator, zipf_rank
+from shortcode.models import URL, Tracking
+
+
+class DatasetTestCase(TestCase):
+    def test_deterministic(self):
+        first = DatasetGenerator(seed=3, today=date(2022, 3, 10))
+        second = DatasetGenerator(seed=3, today=date(2022, 3, 10))
+        other = DatasetGenerator(seed=4, today=date(2022, 3, 10))
+
+        rows = [(u.shortcode, u.fullname, u.expiration) for u in first.urls(50)]
+        self.assertEqual(
+            rows, [(u.shortcode, u.fullname, u.expiration) for u in second.urls(50)]
+        )
+        self.assertNotEqual(
+            rows, [(u.shortcode, u.fullname, u.expiration) for u in other.urls(50)]
+        )
+
+    def test_duplicates(self):
+        generator = DatasetGenerator(duplicate_ratio=0.5)
+        fullnames = [generator.fullname(index) for index in range(200)]
+        self.assertLess(len(set(fullnames)), 150)
+        self.assertEqual(len({u.shortcode for u in generator.urls(200)}), 200)
+
+    def test_zipf_skew(self):
+        generator = DatasetGenerator()
+        rng = generator.random(1)
+        ranks = Counter(zipf_rank(rng, 1000, 1.2) for _ in range(10000))
+        self.assertEqual(ranks.most_common(1)[0][0], 0)
+        self.assertGreater(ranks[0], ranks[10] * 5)
+        self.assertLess(max(ranks), 1000)
+
+    def test_command(self):
+        # ids are relative to the existing URL, sequences aren't reset between tests
+        existing = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+            name="http://test.com",
+        )
+        call_command(
+            "generate_dataset",
+            urls=300,
+            tracking=1000,
+            batch_size=100,
+            today=date(2022, 3, 10),
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(URL.objects.count(), 301)
+        self.assertEqual(Tracking.objects.count(), 1000)
+        generated = URL.objects.exclude(shortcode="shortcode")
+        self.assertEqual(
+            set(generated.values_list("id", flat=True)),
+            set(range(existing.pk + 1, existing.pk + 301)),
+        )
+        self.assertFalse(Tracking.objects.exclude(url__in=generated).exists())
+        # the sequence continues after the generated ids
+        url = URL.objects.create(
+            description="d", shortcode="after1", fullname="http://a.com"
+        )
+        self.assertEqual(url.pk, existing.pk + 301)
+
+    def test_command_skips_taken_shortcodes(self):
+        generator = DatasetGenerator(today=date(2022, 3, 10))
+        existing = URL.objects.create(
+            description="description", shortcode="existing", fullname="http://test.com"
+        )
+        # the shortcode of the first generated URL
+        taken = generator.shortcode(existing.pk + 1)
+        URL.objects.filter(pk=existing.pk).update(shortcode=taken)
+        call_command(
+            "generate_dataset",
+            urls=10,
+            batch_size=4,
+            today=date(2022, 3, 10),
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(URL.objects.count(), 11)
+        self.assertEqual(URL.objects.get(shortcode=taken).pk, existing.pk)
+        self.assertEqual(
+            URL.objects.get(pk=existing.pk + 1).shortcode,
+            generator.shortcode(SHORTCODE_SPACE - 1),
+        )
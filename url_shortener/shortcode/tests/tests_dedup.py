@@ -0,0 +1,131 @@
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from shortcode.dedup import LRUCache, get_dedup_cache
+from shortcode.models import URL
+from shortcode.serializers import CreateURLSerializer
+
+
+class DedupCacheTestCase(TestCase):
+    def setUp(self):
+        self.fullname = "http://test.com/campaign?a=1&b=2"
+        self.digest = URL.hash_fullname(self.fullname)
+        self.expiration = (datetime.today() + timedelta(days=10)).date()
+        get_dedup_cache().clear()
+
+    def tearDown(self):
+        get_dedup_cache().clear()
+
+    def create(self, shortcode="shortcode", **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return URL.objects.create(
+                description="description",
+                shortcode=shortcode,
+                fullname=self.fullname,
+                expiration=self.expiration,
+                **kwargs,
+            )
+
+    def get_shortcode(self):
+        serializer = CreateURLSerializer(
+            data={
+                "description": "description",
+                "url": "http://test.com/campaign?b=2&a=1",
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        url_to_insert, is_new = serializer.get_url_to_insert()
+        return url_to_insert["shortcode"], is_new
+
+    def test_lru(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_populated_on_create(self):
+        serializer = CreateURLSerializer(
+            data={
+                "description": "description",
+                "url": self.fullname,
+                "shortcode": "shortcode",
+                "expiration": self.expiration,
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.create(*serializer.get_url_to_insert())
+        self.assertEqual(
+            get_dedup_cache().get(self.digest), ("shortcode", self.expiration)
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_shortcode(), ("shortcode", False))
+
+    def test_populated_on_hit(self):
+        self.create()
+        get_dedup_cache().clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.get_shortcode(), ("shortcode", False))
+        self.assertEqual(
+            get_dedup_cache().get(self.digest), ("shortcode", self.expiration)
+        )
+
+    def test_cached_only_on_commit(self):
+        URL.objects.create(
+            description="description", shortcode="shortcode", fullname=self.fullname
+        )
+        self.assertIsNone(get_dedup_cache().get(self.digest))
+
+    def test_expired_is_new(self):
+        url = self.create()
+        get_dedup_cache().local.set(
+            self.digest,
+            ("shortcode", url.expiration - timedelta(days=20), time.monotonic()),
+        )
+        shortcode, is_new = self.get_shortcode()
+        self.assertTrue(is_new)
+        self.assertNotEqual(shortcode, "shortcode")
+
+    def test_invalidated(self):
+        url = self.create()
+        url.active = False
+        url.save()
+        self.assertIsNone(get_dedup_cache().get(self.digest))
+
+        url = self.create(shortcode="other1")
+        url.delete()
+        self.assertIsNone(get_dedup_cache().get(self.digest))
+
+    def test_latest_of_duplicates(self):
+        self.create(shortcode="expired")
+        URL.objects.filter(shortcode="expired").update(
+            expiration=self.expiration - timedelta(days=20)
+        )
+        self.create(shortcode="current")
+        get_dedup_cache().clear()
+        self.assertEqual(self.get_shortcode(), ("current", False))
+
+    def test_shared_cache_errors(self):
+        self.create()
+        config = {**settings.DEDUP_CACHE, "SHARED_CACHE": "default"}
+        with override_settings(DEDUP_CACHE=config), mock.patch(
+            "django.core.cache.backends.locmem.LocMemCache.get",
+            side_effect=ConnectionError("cache down"),
+        ), mock.patch(
+            "django.core.cache.backends.locmem.LocMemCache.set",
+            side_effect=ConnectionError("cache down"),
+        ), self.assertLogs(
+            "shortcode.dedup", "ERROR"
+        ) as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.get_shortcode(), ("shortcode", False))
+            get_dedup_cache().local.clear()
+            self.assertEqual(self.get_shortcode(), ("shortcode", False))
+
+        self.assertEqual(len(logs.records), 3)
@@ -0,0 +1,92 @@
+import io
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from shortcode.geoip import GeoIPDatabase, compile_database, read_ranges
+from shortcode.models import URL, Tracking
+
+RANGES = """first_ip,last_ip,country,region
+1.0.0.0,1.0.0.255,AU,Queensland
+10.0.0.0,10.255.255.255,MX,Ciudad de Mexico
+167772416,167772671,US,California
+2001:db8::,2001:db8::ffff,DE,Berlin
+"""
+
+
+class GeoIPTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "geoip.db")
+        compile_database(read_ranges(io.StringIO(RANGES)), self.path)
+        self.url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup(self):
+        database = GeoIPDatabase(self.path)
+        # the US range overlaps the MX one and starts after it, MX wins
+        self.assertEqual(len(database), 2)
+        self.assertEqual(database.lookup("1.0.0.7"), ("AU", "Queensland"))
+        self.assertEqual(database.lookup("10.0.1.1"), ("MX", "Ciudad de Mexico"))
+        self.assertEqual(database.lookup("::ffff:1.0.0.1"), ("AU", "Queensland"))
+        self.assertIsNone(database.lookup("1.0.1.0"))
+        self.assertIsNone(database.lookup("0.0.0.1"))
+        self.assertIsNone(database.lookup("2001:db8::1"))
+        self.assertIsNone(database.lookup("not an ip"))
+
+    def test_read_formats(self):
+        dbip_city = "1.0.0.0,1.0.0.255,OC,AU,Queensland,Brisbane,-27.47,153.02\n"
+        ip2location = (
+            '"16777216","16777471","AU","Australia","Queensland","Brisbane"\n'
+            '"16777472","16778239","-","-","-","-"\n'
+        )
+        long_region = f"1.0.0.0,1.0.0.255,au,{'x' * 200}\n"
+
+        self.assertEqual(
+            list(read_ranges(io.StringIO(dbip_city), "dbip-city")),
+            [(16777216, 16777471, "AU", "Queensland")],
+        )
+        self.assertEqual(
+            list(read_ranges(io.StringIO(ip2location), "ip2location")),
+            [(16777216, 16777471, "AU", "Queensland")],
+        )
+        self.assertEqual(
+            list(read_ranges(io.StringIO(long_region))),
+            [(16777216, 16777471, "AU", "x" * 128)],
+        )
+
+    def test_inline(self):
+        with override_settings(GEOIP_DATABASE=self.path, GEOIP_ENRICHMENT="inline"):
+            self.client.get("/shortcode", REMOTE_ADDR="1.0.0.7")
+        tracking = Tracking.objects.get(url=self.url)
+        self.assertEqual((tracking.country, tracking.region), ("AU", "Queensland"))
+        self.assertIsNone(tracking.ip)
+
+    def test_batch(self):
+        with override_settings(GEOIP_DATABASE=self.path, GEOIP_ENRICHMENT="batch"):
+            self.client.get("/shortcode", REMOTE_ADDR="10.0.0.1")
+            self.client.get("/shortcode", REMOTE_ADDR="192.168.0.1")
+            self.assertEqual(Tracking.objects.filter(ip__isnull=False).count(), 2)
+
+            out = StringIO()
+            call_command("enrich_tracking", batch_size=1, stdout=out)
+        self.assertIn("1 of 2 Tracking located", out.getvalue())
+        self.assertFalse(Tracking.objects.filter(ip__isnull=False).exists())
+        self.assertEqual(
+            sorted(Tracking.objects.values_list("country", flat=True), key=str),
+            ["MX", None],
+        )
+
+    def test_off(self):
+        self.client.get("/shortcode", REMOTE_ADDR="1.0.0.7")
+        tracking = Tracking.objects.get(url=self.url)
+        self.assertEqual((tracking.country, tracking.ip), (None, None))
@@ -0,0 +1,184 @@
+import socket
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from shortcode import invalidation
+from shortcode.dedup import get_dedup_cache
+from shortcode.models import URL
+from shortcode.shortcode_table import TableReader, write_table
+
+
+class InvalidationTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.expiration = (datetime.today() + timedelta(days=10)).date()
+        self.url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+            expiration=self.expiration,
+        )
+        get_dedup_cache().clear()
+
+    def tearDown(self):
+        get_dedup_cache().clear()
+        self.directory.cleanup()
+
+    def cache_url(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_dedup_cache().set(self.url.fullname_hash, "shortcode", self.expiration)
+        self.assertIsNotNone(get_dedup_cache().local.get(self.url.fullname_hash))
+
+    def wait_for(self, condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Condition not met in time")
+            time.sleep(0.005)
+
+    def test_encode_decode(self):
+        events = [(f"code{number}", "ab" * 16) for number in range(300)]
+        with override_settings(
+            INVALIDATION_BUS={
+                **invalidation.settings.INVALIDATION_BUS,
+                "MAX_DATAGRAM": 1024,
+            }
+        ):
+            datagrams = invalidation.encode_events(events, 42)
+        self.assertGreater(len(datagrams), 1)
+        decoded = []
+        for datagram in datagrams:
+            self.assertLessEqual(len(datagram), 1024)
+            published, datagram_events = invalidation.decode_events(datagram)
+            self.assertEqual(published, 42)
+            decoded.extend(datagram_events)
+        self.assertEqual(decoded, events)
+
+    def test_encode_empty_hash(self):
+        events = [("first1", ""), ("second", self.url.fullname_hash)]
+        (datagram,) = invalidation.encode_events(events, 42, sender=7, sequence=3)
+
+        self.assertEqual(invalidation.decode_events(datagram), (42, events))
+        self.assertEqual(invalidation.datagram_sender(datagram), (7, 3))
+
+    def test_lost_datagrams_evict_everything(self):
+        bus = invalidation.InvalidationBus(self.directory.name, name="a")
+        self.cache_url()
+        bus.check_sequence(7, 1)
+        bus.check_sequence(7, 2)
+        self.assertIsNotNone(get_dedup_cache().local.get(self.url.fullname_hash))
+
+        with self.assertLogs("shortcode.invalidation", "WARNING"):
+            bus.check_sequence(7, 5)
+        self.assertIsNone(get_dedup_cache().local.get(self.url.fullname_hash))
+        self.assertEqual(bus.stats()["lost"], 2)
+        # a new process with the pid of a dead one starts again
+        bus.check_sequence(7, 1)
+        self.assertEqual(bus.stats()["lost"], 2)
+
+    def test_other_process_evicts(self):
+        publisher = invalidation.InvalidationBus(self.directory.name, name="a")
+        subscriber = invalidation.InvalidationBus(self.directory.name, name="b")
+        self.assertTrue(publisher.start() and subscriber.start())
+        try:
+            self.cache_url()
+            publisher.publish([("shortcode", self.url.fullname_hash)] * 3)
+            self.wait_for(lambda: subscriber.stats()["received"])
+            # the publisher counts after sending to every peer
+            self.wait_for(lambda: publisher.stats()["published"])
+
+            self.assertIsNone(get_dedup_cache().local.get(self.url.fullname_hash))
+            stats = subscriber.stats()
+            self.assertEqual(stats["received"], 1)
+            self.assertLess(stats["last_lag_ms"], 1000)
+            self.assertEqual(publisher.stats()["published"], 1)
+        finally:
+            publisher.stop()
+            subscriber.stop()
+
+    def test_dead_peer_removed(self):
+        publisher = invalidation.InvalidationBus(self.directory.name, name="a")
+        self.assertTrue(publisher.start())
+        # the socket of a process killed without cleaning it up
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead.bind(f"{self.directory.name}/dead.sock")
+        dead.close()
+        try:
+            publisher.send_events([("shortcode", self.url.fullname_hash)], 0)
+            self.assertEqual(publisher.peers(), [])
+        finally:
+            publisher.stop()
+
+    def test_bulk_update_invalidates(self):
+        self.cache_url()
+        URL.objects.filter(pk=self.url.pk).update(active=False)
+        self.assertIsNone(get_dedup_cache().local.get(self.url.fullname_hash))
+
+    @override_settings(
+        INVALIDATION_BUS={
+            **invalidation.settings.INVALIDATION_BUS,
+            "UPDATE_BATCH_SIZE": 2,
+        }
+    )
+    def test_update_by_batches(self):
+        for number in range(5):
+            URL.objects.create(
+                description="d",
+                shortcode=f"code{number}",
+                fullname=f"http://{number}.com",
+            )
+        urls = list(URL.objects.order_by("pk"))
+        with self.captureOnCommitCallbacks(execute=True):
+            for url in urls:
+                get_dedup_cache().set(url.fullname_hash, url.shortcode, self.expiration)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = URL.objects.exclude(pk=urls[1].pk).update(active=False)
+
+        self.assertEqual(updated, 5)
+        self.assertEqual(list(URL.objects.filter(active=True)), [urls[1]])
+        self.assertIsNotNone(get_dedup_cache().local.get(urls[1].fullname_hash))
+        for url in urls[:1] + urls[2:]:
+            self.assertIsNone(get_dedup_cache().local.get(url.fullname_hash))
+
+    def test_bulk_create_not_published(self):
+        with mock.patch.object(invalidation, "evict") as evict:
+            URL.objects.bulk_create(
+                [URL(description="d", shortcode="created", fullname="http://a.com")]
+            )
+        evict.assert_not_called()
+
+    def test_stats_for_staff(self):
+        self.assertEqual(
+            self.client.get(reverse("invalidation-stats")).status_code, 403
+        )
+        with override_settings(DEBUG=True):
+            resp = self.client.get(reverse("invalidation-stats"))
+        self.assertEqual(resp.json(), {"healthy": False})
+
+    def test_fallback_ttl(self):
+        config = {
+            **invalidation.settings.INVALIDATION_BUS,
+            "ENABLED": False,
+            "FALLBACK_TTL": 0,
+        }
+        with override_settings(INVALIDATION_BUS=config):
+            self.cache_url()
+            self.assertIsNone(get_dedup_cache().get(self.url.fullname_hash))
+
+    def test_table_invalidated_until_next_generation(self):
+        path = f"{self.directory.name}/shortcodes.table"
+        write_table(path, [(self.url.pk, "shortcode", "http://a.com", self.expiration)])
+        reader = TableReader(path, check_interval=0)
+        self.assertIsNotNone(reader.get("shortcode"))
+
+        reader.invalidate("shortcode", time.time_ns())
+        self.assertIsNone(reader.get("shortcode"))
+
+        write_table(path, [(self.url.pk, "shortcode", "http://b.com", self.expiration)])
+        self.assertEqual(reader.get("shortcode")[1], "http://b.com")
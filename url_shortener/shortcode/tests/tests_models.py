@@ -1,8 +1,8 @@
 from datetime import datetime, timedelta
 from django.db import IntegrityError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from shortcode.models import URL, Tracking
+from shortcode.models import URL, Host, Tracking
 
 
 class URLModelTestCase(TestCase):
@@ -58,6 +58,92 @@ class URLModelTestCase(TestCase):
             name=name,
         )
 
+    def test_url_accessors(self):
+        fullname = "https://test.com/path?aaa=11212&abc2=123asd"
+
+        URL.objects.create(
+            description="description-test", shortcode="shortcode", fullname=fullname
+        )
+        url = URL.objects.get(shortcode="shortcode")
+
+        self.assertEqual(url.fullname, fullname)
+        self.assertEqual(url.name, "https://test.com/path")
+        self.assertEqual(url.query_params, "aaa=11212&abc2=123asd")
+        self.assertEqual(url.host.name, "https://test.com")
+        self.assertEqual(url.location, "/path?aaa=11212&abc2=123asd")
+        self.assertEqual(
+            url, URL.objects.get(fullname_hash=URL.hash_fullname(fullname))
+        )
+
+    def test_url_accessors_setters(self):
+        url = URL(fullname="https://test.com/path?a=1")
+
+        url.name = "https://test.com/other"
+        self.assertEqual(url.fullname, "https://test.com/other?a=1")
+        url.query_params = "b=2"
+        self.assertEqual(url.fullname, "https://test.com/other?b=2")
+        url.query_params = None
+        self.assertEqual(url.fullname, "https://test.com/other")
+        self.assertEqual(url.fullname_hash, URL.hash_fullname(url.fullname))
+
+    def test_url_legacy_kwargs(self):
+        fullname = "https://test.com?abc2=123asd&aaa=11212"
+        with self.assertWarns(DeprecationWarning):
+            url = URL(fullname=fullname, name="name")
+        self.assertEqual(url.fullname, fullname)
+        self.assertEqual(url.fullname_hash, URL.hash_fullname(fullname))
+
+        for kwargs in (
+            {"query_params": "x=1", "name": "https://a.com"},
+            {"name": "https://a.com", "query_params": "x=1"},
+        ):
+            self.assertEqual(URL(**kwargs).fullname, "https://a.com?x=1")
+        with self.assertWarns(DeprecationWarning):
+            url = URL(query_params="x=1", fullname="https://a.com")
+        self.assertEqual(url.fullname, "https://a.com")
+
+    def test_url_without_params(self):
+        url = URL.objects.create(
+            description="description-test",
+            shortcode="shortcode",
+            fullname="http://test.com",
+        )
+
+        self.assertEqual(url.name, "http://test.com")
+        self.assertEqual(url.query_params, None)
+
+    def test_hosts_are_shared(self):
+        URL.objects.bulk_create(
+            [
+                URL(description="1", shortcode="shortcode1", fullname="http://a.com/1"),
+                URL(description="2", shortcode="shortcode2", fullname="http://a.com/2"),
+                URL(description="3", shortcode="shortcode3", fullname="http://b.com"),
+            ]
+        )
+        URL.objects.create(
+            description="4", shortcode="shortcode4", fullname="http://b.com/4"
+        )
+
+        self.assertEqual(Host.objects.count(), 2)
+        self.assertEqual(
+            [url.fullname for url in URL.objects.order_by("shortcode")],
+            ["http://a.com/1", "http://a.com/2", "http://b.com", "http://b.com/4"],
+        )
+
+    @override_settings(URL_INTERN_HOSTS=False, URL_COMPRESS_QUERY_MIN_LENGTH=10)
+    def test_compressed_query_params(self):
+        fullname = "http://test.com?" + "&".join(f"param{i}=value" for i in range(20))
+
+        URL.objects.create(
+            description="description-test", shortcode="shortcode", fullname=fullname
+        )
+        url = URL.objects.get(shortcode="shortcode")
+
+        self.assertIsNone(url.host)
+        self.assertEqual(url.location, "http://test.com")
+        self.assertIsNotNone(url.query_compressed)
+        self.assertEqual(url.fullname, fullname)
+
 
 class TrackingModelTestCase(TestCase):
     def test_add_tracking(self):
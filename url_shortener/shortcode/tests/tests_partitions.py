@@ -0,0 +1,173 @@
+from datetime import date, datetime, timedelta, timezone
+
+from unittest import skipIf, skipUnless
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from shortcode import partitions
+from shortcode.models import URL, Tracking
+
+
+class PartitionNamesTestCase(TestCase):
+    def test_partition_name_by_month(self):
+        start = partitions.period_start(date(2022, 3, 5), partitions.MONTH)
+        name = partitions.partition_name(start, partitions.MONTH)
+
+        self.assertEqual(name, "shortcode_tracking_p202203")
+        self.assertEqual(
+            partitions.parse_partition_name(name), (date(2022, 3, 1), partitions.MONTH)
+        )
+
+    def test_partition_name_by_day(self):
+        name = partitions.partition_name(date(2022, 3, 5), partitions.DAY)
+
+        self.assertEqual(name, "shortcode_tracking_p20220305")
+        self.assertEqual(
+            partitions.parse_partition_name(name), (date(2022, 3, 5), partitions.DAY)
+        )
+
+    def test_parse_unknown_partition(self):
+        self.assertIsNone(partitions.parse_partition_name("shortcode_tracking_legacy"))
+        self.assertIsNone(partitions.parse_partition_name("shortcode_tracking_default"))
+        self.assertIsNone(
+            partitions.parse_partition_name("shortcode_tracking_p_legacy")
+        )
+
+    def test_next_and_previous_period(self):
+        self.assertEqual(
+            partitions.next_period(date(2022, 12, 1), partitions.MONTH),
+            date(2023, 1, 1),
+        )
+        self.assertEqual(
+            partitions.previous_period(date(2022, 1, 1), partitions.MONTH),
+            date(2021, 12, 1),
+        )
+        self.assertEqual(
+            partitions.next_period(date(2022, 2, 28), partitions.DAY), date(2022, 3, 1)
+        )
+
+
+@override_settings(TRACKING_PARTITION_GRANULARITY="month")
+class PartitionRetentionTestCase(TestCase):
+    def setUp(self):
+        self.url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+            name="http://test.com",
+        )
+
+    def test_retention_cutoff(self):
+        cutoff = partitions.retention_cutoff(retention=3, today=date(2022, 3, 5))
+        self.assertEqual(cutoff, date(2022, 1, 1))
+
+    def test_retention_disabled(self):
+        self.assertIsNone(partitions.retention_cutoff(retention=0))
+
+    @skipIf(connection.vendor == "postgresql", "Postgres partitions natively")
+    def test_ensure_partitions_without_native_partitioning(self):
+        self.assertEqual(partitions.ensure_partitions(), [])
+
+    @skipIf(connection.vendor == "postgresql", "Postgres partitions natively")
+    def test_drop_expired_rows_without_native_partitioning(self):
+        old = Tracking.objects.create(url=self.url)
+        recent = Tracking.objects.create(url=self.url)
+        Tracking.objects.filter(pk=old.pk).update(
+            requested=datetime(2021, 12, 31, tzinfo=timezone.utc)
+        )
+        Tracking.objects.filter(pk=recent.pk).update(
+            requested=datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(hours=1)
+        )
+
+        partitions.drop_expired_partitions(retention=3, today=date(2022, 3, 5))
+
+        self.assertEqual(
+            list(Tracking.objects.values_list("pk", flat=True)), [recent.pk]
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Native partitioning needs Postgres")
+@override_settings(TRACKING_PARTITION_GRANULARITY="month")
+class NativePartitionsTestCase(TestCase):
+    """
+    The test database was migrated by 0005, partitions far in the future
+    don't overlap the legacy one
+    """
+
+    def setUp(self):
+        self.url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+        )
+
+    def query(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def partition_of(self, tracking):
+        return self.query(
+            "SELECT tableoid::regclass::text FROM shortcode_tracking WHERE id = %s",
+            [tracking.pk],
+        )[0][0]
+
+    def track(self, requested):
+        return Tracking.objects.create(url=self.url, requested=requested)
+
+    def test_migrated_table(self):
+        partitioned = self.query(
+            "SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = 'shortcode_tracking'::regclass"
+        )
+        self.assertEqual(partitioned, [(1,)])
+        legacy_key = self.query(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'shortcode_tracking_legacy'::regclass AND contype = 'p'"
+        )
+        self.assertEqual(legacy_key, [("PRIMARY KEY (id, requested)",)])
+
+        old = self.track(datetime(2021, 12, 31, tzinfo=timezone.utc))
+        current = self.track(datetime.now(timezone.utc))
+        self.assertEqual(self.partition_of(old), "shortcode_tracking_legacy")
+        self.assertEqual(
+            self.partition_of(current),
+            partitions.partition_name(
+                partitions.period_start(date.today(), partitions.MONTH),
+                partitions.MONTH,
+            ),
+        )
+
+    def test_rows_moved_from_default(self):
+        tracking = self.track(datetime(2100, 2, 10, tzinfo=timezone.utc))
+        self.assertEqual(self.partition_of(tracking), "shortcode_tracking_default")
+
+        created = partitions.ensure_partitions(ahead=1, today=date(2100, 2, 1))
+
+        self.assertEqual(
+            created, ["shortcode_tracking_p210002", "shortcode_tracking_p210003"]
+        )
+        self.assertEqual(self.partition_of(tracking), "shortcode_tracking_p210002")
+
+    def test_drop_expired_partitions(self):
+        partitions.ensure_partitions(ahead=2, today=date(2100, 1, 1))
+        old = self.track(datetime(2021, 12, 31, tzinfo=timezone.utc))
+        expired = self.track(datetime(2100, 1, 10, tzinfo=timezone.utc))
+        kept = self.track(datetime(2100, 3, 10, tzinfo=timezone.utc))
+        # the rows were inserted in the transaction of the test, a table with
+        # pending foreign key checks can't be dropped
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        dropped = partitions.drop_expired_partitions(
+            retention=1, today=date(2100, 3, 5)
+        )
+
+        self.assertIn("shortcode_tracking_p210001", dropped)
+        self.assertIn("shortcode_tracking_legacy", dropped)
+        self.assertNotIn("shortcode_tracking_p210003", dropped)
+        remaining = set(Tracking.objects.values_list("pk", flat=True))
+        self.assertEqual(remaining, {kept.pk})
+        self.assertNotIn(old.pk, remaining)
+        self.assertNotIn(expired.pk, remaining)
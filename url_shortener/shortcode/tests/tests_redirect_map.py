@@ -0,0 +1,188 @@
+import os
+import tempfile
+from io import StringIO
+from datetime import date, datetime, timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from shortcode.models import URL, DeletedURL, Tracking
+from shortcode.redirect_map import (
+    BINARY,
+    NGINX,
+    RedirectMap,
+    read_map,
+    write_binary,
+    write_nginx,
+)
+
+
+class RedirectMapTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "redirects.map")
+        self.expiration = (datetime.today() + timedelta(days=10)).date()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_url(self, shortcode, **kwargs):
+        return URL.objects.create(
+            description="description",
+            shortcode=shortcode,
+            fullname=f"http://test.com/{shortcode}?a=$1",
+            name=f"http://test.com/{shortcode}",
+            **kwargs,
+        )
+
+    def test_binary_lookup(self):
+        entries = [
+            ("AAAAAA", "http://a.com", date(2022, 3, 10)),
+            ("BBBBBB", "http://b.com", date(2022, 3, 1)),
+            ("CCCCCC", "http://c.com", date(2022, 3, 10)),
+        ]
+        write_binary(self.path, entries)
+
+        redirect_map = RedirectMap(self.path)
+        today = date(2022, 3, 5)
+        self.assertEqual(len(redirect_map), 3)
+        self.assertEqual(redirect_map.get("CCCCCC", today), "http://c.com")
+        self.assertIsNone(redirect_map.get("BBBBBB", today))
+        self.assertIsNone(redirect_map.get("ZZZZZZ", today))
+        self.assertEqual(list(redirect_map), entries)
+        redirect_map.close()
+
+    def test_export_nginx(self):
+        self.create_url("AAAAAA")
+        self.create_url("BBBBBB", active=False)
+        self.create_url("CCCCCC", expiration=date(2022, 3, 3))
+
+        call_command("export_redirect_map", self.path, stdout=StringIO())
+
+        with open(self.path) as map_file:
+            self.assertEqual(
+                map_file.read(),
+                f'/AAAAAA "http://test.com/AAAAAA?a=%241";  # {self.expiration}\n',
+            )
+
+    def test_export_incremental(self):
+        self.create_url("AAAAAA")
+        removed = self.create_url("BBBBBB")
+        call_command(
+            "export_redirect_map",
+            self.path,
+            format=BINARY,
+            stdout=StringIO(),
+        )
+
+        removed.active = False
+        removed.save()
+        self.create_url("CCCCCC")
+        call_command(
+            "export_redirect_map",
+            self.path,
+            format=BINARY,
+            incremental=True,
+            stdout=StringIO(),
+        )
+
+        shortcodes = [entry[0] for entry in read_map(self.path, BINARY)]
+        self.assertEqual(shortcodes, ["AAAAAA", "CCCCCC"])
+
+    def test_export_top(self):
+        first = self.create_url("AAAAAA")
+        second = self.create_url("BBBBBB")
+        Tracking.objects.bulk_create(
+            [Tracking(url=first)] + [Tracking(url=second) for _ in range(3)]
+        )
+
+        call_command("export_redirect_map", self.path, top=1, stdout=StringIO())
+
+        shortcodes = [entry[0] for entry in read_map(self.path, NGINX)]
+        self.assertEqual(shortcodes, ["BBBBBB"])
+
+    def test_nginx_hostile_target(self):
+        target = (
+            'http://a.com/?x=";\n/pwned "http://evil.com";  # 2099-01-01\n/y "z\r$1\\'
+        )
+        write_nginx(self.path, [("AAAAAA", target, self.expiration)])
+
+        with open(self.path) as map_file:
+            lines = map_file.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertNotIn('"http://evil.com"', lines[0])
+        self.assertEqual(
+            list(read_map(self.path, NGINX)), [("AAAAAA", target, self.expiration)]
+        )
+
+    def test_export_incremental_rebuilds_invalid_map(self):
+        self.create_url("AAAAAA")
+        call_command("export_redirect_map", self.path, stdout=StringIO())
+        with open(self.path, "a") as map_file:
+            map_file.write('/pwned "http://evil.com";\n')
+
+        call_command(
+            "export_redirect_map",
+            self.path,
+            incremental=True,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+        shortcodes = [entry[0] for entry in read_map(self.path, NGINX)]
+        self.assertEqual(shortcodes, ["AAAAAA"])
+
+    def test_export_incremental_drops_deleted(self):
+        self.create_url("AAAAAA")
+        deleted = self.create_url("BBBBBB")
+        call_command("export_redirect_map", self.path, stdout=StringIO())
+
+        deleted.delete()
+        call_command(
+            "export_redirect_map", self.path, incremental=True, stdout=StringIO()
+        )
+        shortcodes = [entry[0] for entry in read_map(self.path, NGINX)]
+        self.assertEqual(shortcodes, ["AAAAAA"])
+
+    def test_export_incremental_queryset_update(self):
+        self.create_url("AAAAAA")
+        self.create_url("BBBBBB")
+        call_command("export_redirect_map", self.path, stdout=StringIO())
+
+        URL.objects.filter(shortcode="BBBBBB").update(active=False)
+        call_command(
+            "export_redirect_map", self.path, incremental=True, stdout=StringIO()
+        )
+        shortcodes = [entry[0] for entry in read_map(self.path, NGINX)]
+        self.assertEqual(shortcodes, ["AAAAAA"])
+
+    def test_export_incremental_shortcode_used_again(self):
+        self.create_url("AAAAAA").delete()
+        call_command("export_redirect_map", self.path, stdout=StringIO())
+        self.create_url("BBBBBB").delete()
+        self.create_url("BBBBBB")
+
+        call_command(
+            "export_redirect_map", self.path, incremental=True, stdout=StringIO()
+        )
+        shortcodes = [entry[0] for entry in read_map(self.path, NGINX)]
+        self.assertEqual(shortcodes, ["BBBBBB"])
+
+    def test_export_incremental_after_deleted_days(self):
+        self.create_url("AAAAAA")
+        deleted = self.create_url("BBBBBB")
+        call_command("export_redirect_map", self.path, stdout=StringIO())
+        deleted.delete()
+
+        stderr = StringIO()
+        call_command(
+            "export_redirect_map",
+            self.path,
+            incremental=True,
+            deleted_days=0,
+            stdout=StringIO(),
+            stderr=stderr,
+        )
+        self.assertIn("exporting every URL", stderr.getvalue())
+        shortcodes = [entry[0] for entry in read_map(self.path, NGINX)]
+        self.assertEqual(shortcodes, ["AAAAAA"])
+        self.assertFalse(DeletedURL.objects.exists())
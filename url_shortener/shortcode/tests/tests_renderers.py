@@ -0,0 +1,66 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+
+from django.test import TestCase
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from shortcode.models import URL
+from shortcode.renderers import (
+    FastJSONNegotiation,
+    FastJSONParser,
+    FastJSONRenderer,
+)
+
+
+class RenderersTestCase(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.renderers = [FastJSONRenderer(), BrowsableAPIRenderer()]
+
+    def test_render_same_as_drf(self):
+        data = {
+            "url": "https://test.com/ñ?a=1 ",
+            "is_new": True,
+            "expiration": date(2022, 3, 10),
+            "created": datetime(2022, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            "amount": Decimal("1.50"),
+            "errors": [ErrorDetail("invalid", code="invalid")],
+            1: None,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parse(self):
+        parser = FastJSONParser()
+        self.assertEqual(
+            parser.parse(BytesIO(b'{"url": "http://test.com"}')),
+            {"url": "http://test.com"},
+        )
+        self.assertRaises(ParseError, parser.parse, BytesIO(b'{"url": NaN}'))
+
+    def test_negotiation(self):
+        negotiation = FastJSONNegotiation()
+        for accept in (None, "*/*", "application/json"):
+            headers = {"HTTP_ACCEPT": accept} if accept else {}
+            request = Request(self.factory.get("/shortcode", **headers))
+            renderer, media_type = negotiation.select_renderer(request, self.renderers)
+            self.assertIsInstance(renderer, FastJSONRenderer)
+            self.assertEqual(media_type, "application/json")
+
+        request = Request(self.factory.get("/shortcode", HTTP_ACCEPT="text/html"))
+        renderer, _ = negotiation.select_renderer(request, self.renderers)
+        self.assertIsInstance(renderer, BrowsableAPIRenderer)
+
+    def test_resolve_response(self):
+        url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname='https://test.com/"quoted"?a=1',
+        )
+        resp = self.client.get(f"/{url.shortcode}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        self.assertEqual(resp.content, JSONRenderer().render({"url": url.fullname}))
@@ -0,0 +1,187 @@
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from django.test import TestCase, override_settings
+
+from shortcode import segments, tracking
+from shortcode.models import URL, CompactedSegment, Tracking
+from shortcode.serializers import RecoverURLSerializer
+
+
+class SegmentsTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+            name="http://test.com",
+        )
+        self.requested = datetime(2022, 3, 5, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_rotate_by_records(self):
+        writer = segments.SegmentWriter(self.directory.name, max_records=2)
+        for _ in range(5):
+            writer.append(self.url.pk, self.requested)
+
+        self.assertEqual(len(segments.sealed_segments(self.directory.name)), 2)
+        writer.seal()
+        self.assertEqual(len(segments.sealed_segments(self.directory.name)), 3)
+
+    def test_reader(self):
+        writer = segments.SegmentWriter(self.directory.name)
+        writer.append(self.url.pk, self.requested, client=7)
+        writer.append(self.url.pk + 1, self.requested)
+        writer.append(self.url.pk, self.requested)
+        writer.seal()
+
+        path = segments.sealed_segments(self.directory.name)[0]
+        with segments.SegmentReader(path) as reader:
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(
+                next(iter(reader)),
+                (self.url.pk, segments.to_timestamp(self.requested), 7),
+            )
+            self.assertEqual(reader.count_by_url()[self.url.pk], 2)
+            timestamps = list(reader.scan(self.url.pk + 1))
+        self.assertEqual(
+            [segments.from_timestamp(t) for t in timestamps], [self.requested]
+        )
+
+    def test_compact(self):
+        writer = segments.SegmentWriter(self.directory.name, max_records=2)
+        for _ in range(3):
+            writer.append(self.url.pk, self.requested)
+        writer.seal()
+
+        result = segments.compact(self.directory.name, batch_size=1)
+
+        self.assertEqual(result, (2, 3))
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(
+            list(Tracking.objects.values_list("requested", flat=True).distinct()),
+            [self.requested],
+        )
+
+    def test_compact_once(self):
+        writer = segments.SegmentWriter(self.directory.name)
+        writer.append(self.url.pk, self.requested)
+        writer.seal()
+        path = segments.sealed_segments(self.directory.name)[0]
+        # the compactor crashed after its commit, before deleting the segment
+        name = os.path.basename(path)[: -len(segments.SEALED_SUFFIX)]
+        CompactedSegment.objects.create(name=name)
+
+        self.assertEqual(segments.compact(self.directory.name), (1, 0))
+        self.assertFalse(Tracking.objects.exists())
+        self.assertFalse(CompactedSegment.objects.exists())
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_compact_skips_deleted_urls(self):
+        writer = segments.SegmentWriter(self.directory.name)
+        writer.append(self.url.pk, self.requested, client=7)
+        writer.append(self.url.pk + 1000, self.requested, client=7)
+        writer.seal()
+
+        with self.assertLogs("shortcode.segments", "WARNING"):
+            self.assertEqual(segments.compact(self.directory.name), (1, 1))
+        self.assertEqual(Tracking.objects.get().url_id, self.url.pk)
+
+    def test_create_tracking_with_segments_sink(self):
+        with override_settings(
+            TRACKING_SINK=tracking.SEGMENTS_SINK,
+            TRACKING_SEGMENT_DIR=self.directory.name,
+        ):
+            tracking._segment_writer = None
+            serializer = RecoverURLSerializer(data={"shortcode": "shortcode"})
+            serializer.is_valid()
+            serializer.create_tracking(self.url)
+            tracking.get_segment_writer().seal()
+            tracking._segment_writer = None
+
+        self.assertEqual(Tracking.objects.count(), 0)
+        self.assertEqual(segments.compact(self.directory.name), (1, 1))
+        self.assertEqual(Tracking.objects.get().url_id, self.url.pk)
+
+
+class SegmentLifecycleTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.requested = datetime(2022, 3, 5, 12, 30, 15, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_adopt_segments_of_dead_processes(self):
+        writer = segments.SegmentWriter(self.directory.name)
+        writer.append(1, self.requested)
+        writer._file.flush()
+        dead = os.path.join(self.directory.name, f"1-{2**22 + 1}-1.open")
+        with open(dead, "wb") as segment:
+            segment.write(segments.HEADER.pack(segments.MAGIC, segments.VERSION, 24))
+
+        # the open segment of this process is left alone
+        self.assertEqual(
+            segments.sealed_segments(self.directory.name),
+            [os.path.join(self.directory.name, f"1-{2**22 + 1}-1.seg")],
+        )
+        writer.seal()
+
+    def test_adopt_segments_of_killed_writers(self):
+        ready_read, ready_write = os.pipe()
+        exit_read, exit_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            writer = segments.SegmentWriter(self.directory.name)
+            writer.append(1, self.requested)
+            writer._file.flush()
+            os.write(ready_write, b"1")
+            os.read(exit_read, 1)
+            # killed, the segment is never sealed
+            os._exit(0)
+        os.read(ready_read, 1)
+
+        # a writer in another process (or PID namespace) holds its lock
+        self.assertEqual(segments.sealed_segments(self.directory.name), [])
+        os.write(exit_write, b"1")
+        os.waitpid(pid, 0)
+        for fd in (ready_read, ready_write, exit_read, exit_write):
+            os.close(fd)
+
+        paths = segments.sealed_segments(self.directory.name)
+        self.assertEqual(len(paths), 1)
+        with segments.SegmentReader(paths[0]) as reader:
+            self.assertEqual(len(reader), 1)
+
+    def test_seal_adopted_segment(self):
+        writer = segments.SegmentWriter(self.directory.name)
+        writer.append(1, self.requested)
+        path = writer._path
+        os.rename(path + segments.OPEN_SUFFIX, path + segments.SEALED_SUFFIX)
+
+        with self.assertLogs("shortcode.segments", "WARNING"):
+            writer.seal()
+        writer.append(2, self.requested)
+        writer.seal()
+        self.assertEqual(len(segments.sealed_segments(self.directory.name)), 2)
+
+    def test_fork(self):
+        writer = segments.SegmentWriter(self.directory.name)
+        writer.append(1, self.requested)
+        pid = os.fork()
+        if pid == 0:
+            writer.append(2, self.requested)
+            writer.seal()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        writer.seal()
+
+        records = []
+        for path in segments.sealed_segments(self.directory.name):
+            with segments.SegmentReader(path) as reader:
+                records.append(sorted(record[0] for record in reader))
+        self.assertEqual(sorted(records), [[1], [2]])
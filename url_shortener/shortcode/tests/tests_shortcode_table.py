@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from shortcode.models import URL
+from shortcode.serializers import RecoverURLSerializer
+from shortcode.shortcode_table import ShortcodeTable, TableReader, write_table
+
+
+class ShortcodeTableTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "shortcodes.table")
+        self.expiration = (datetime.today() + timedelta(days=10)).date()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup(self):
+        entries = [
+            (number, f"CODE{number:04}", f"http://test.com/{number}", date(2022, 3, 10))
+            for number in range(1000)
+        ]
+        self.assertEqual(write_table(self.path, entries), 1000)
+
+        table = ShortcodeTable(self.path)
+        self.assertEqual(len(table), 1000)
+        self.assertGreaterEqual(table.capacity, 1000 / 0.6)
+        for url_id, shortcode, target, expiration in entries:
+            self.assertEqual(table.get(shortcode), (url_id, target, expiration))
+        self.assertIsNone(table.get("CODE9999"))
+        self.assertEqual(sorted(table), entries)
+
+    def test_generation_swap(self):
+        write_table(self.path, [(1, "AAAAAA", "http://a.com", self.expiration)])
+        reader = TableReader(self.path, check_interval=0)
+        self.assertEqual(reader.get("AAAAAA")[1], "http://a.com")
+        old_table = reader.table
+
+        write_table(self.path, [(2, "BBBBBB", "http://b.com", self.expiration)])
+        self.assertIsNone(reader.get("AAAAAA"))
+        self.assertEqual(reader.get("BBBBBB")[1], "http://b.com")
+        # lookups that still hold the previous generation keep working
+        self.assertEqual(old_table.get("AAAAAA")[1], "http://a.com")
+
+    def test_invalidated_bounded(self):
+        loaded = time.time_ns()
+        write_table(self.path, [(1, "AAAAAA", "http://a.com", self.expiration)], loaded)
+        reader = TableReader(self.path, check_interval=0, max_invalidated=2)
+        for changed, shortcode in enumerate(["BBBBBB", "CCCCCC", "DDDDDD"], 1):
+            reader.invalidate(shortcode, loaded + changed)
+
+        self.assertEqual(reader.invalidated, {})
+        self.assertIsNone(reader.get("AAAAAA"))
+        # a generation loaded after the last change is used again
+        write_table(
+            self.path, [(1, "AAAAAA", "http://a.com", self.expiration)], loaded + 4
+        )
+        self.assertEqual(reader.get("AAAAAA")[1], "http://a.com")
+
+    def test_recover_from_table(self):
+        url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com?a=1",
+            expiration=self.expiration,
+        )
+        URL.objects.create(
+            description="description",
+            shortcode="inactive",
+            fullname="http://test.com/inactive",
+            active=False,
+        )
+        call_command("load_shortcode_table", path=self.path, stdout=StringIO())
+
+        with override_settings(SHORTCODE_TABLE=self.path):
+            serializer = RecoverURLSerializer(data={"shortcode": "shortcode"})
+            serializer.is_valid(raise_exception=True)
+            with self.assertNumQueries(0):
+                found = serializer.get_url()
+            self.assertEqual((found.pk, found.fullname), (url.pk, url.fullname))
+
+            resp = self.client.get("/inactive")
+            self.assertEqual(resp.status_code, 404)
+
+            # deactivated after the table was loaded
+            url.active = False
+            url.save()
+            resp = self.client.get("/shortcode")
+            self.assertEqual(resp.status_code, 404)
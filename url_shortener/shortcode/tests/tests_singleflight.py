@@ -0,0 +1,151 @@
+import threading
+from datetime import datetime, timedelta
+
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase
+
+from shortcode.models import URL
+from shortcode.serializers import RecoverURLSerializer
+from shortcode.singleflight import (
+    Call,
+    LeaderFailed,
+    SingleFlight,
+    get_single_flight,
+)
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def stampede(self, single_flight, function, threads=10):
+        results, errors = [], []
+
+        def run():
+            try:
+                results.append(single_flight.do("key", function))
+            except BaseException as exception:
+                errors.append(exception)
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        return workers, results, errors
+
+    def test_threads_share_a_call(self):
+        single_flight, release, calls = SingleFlight(timeout=5), threading.Event(), []
+
+        def lookup():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        workers, results, _ = self.stampede(single_flight, lookup)
+        while single_flight.stats()["followers"] < 9:
+            threading.Event().wait(0.001)
+        release.set()
+        for worker in workers:
+            worker.join()
+        self.assertEqual((len(calls), results), (1, ["result"] * 10))
+        self.assertEqual(single_flight.stats()["in_flight"], 0)
+
+    def test_threads_share_an_exception(self):
+        single_flight, release = SingleFlight(timeout=5), threading.Event()
+
+        def lookup():
+            release.wait(5)
+            raise Http404
+
+        workers, _, errors = self.stampede(single_flight, lookup)
+        while single_flight.stats()["followers"] < 9:
+            threading.Event().wait(0.001)
+        release.set()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(errors), 10)
+        self.assertTrue(all(isinstance(error, Http404) for error in errors))
+        # every follower raises its own copy, chained from the leader's exception
+        leaders = [error for error in errors if error.__cause__ is None]
+        self.assertEqual(len(leaders), 1)
+        self.assertEqual(len({id(error) for error in errors}), 10)
+        self.assertTrue(all(error.__cause__ in (None, leaders[0]) for error in errors))
+
+    def test_exception_not_copyable(self):
+        class LookupFailed(Exception):
+            def __init__(self, shortcode, reason):
+                super().__init__(f"{shortcode}: {reason}")
+
+        call = Call()
+        call.exception = LookupFailed("shortcode", "database down")
+        with self.assertRaises(LeaderFailed) as raised:
+            call.get()
+        self.assertIs(raised.exception.__cause__, call.exception)
+
+    def test_slow_leader(self):
+        single_flight, release = SingleFlight(timeout=0.01), threading.Event()
+        workers, results, _ = self.stampede(
+            single_flight, lambda: release.wait(5) and "leader", threads=1
+        )
+        while not single_flight.stats()["in_flight"]:
+            threading.Event().wait(0.001)
+        self.assertEqual(single_flight.do("key", lambda: "follower"), "follower")
+        self.assertEqual(single_flight.stats()["timeouts"], 1)
+        release.set()
+        workers[0].join()
+        self.assertEqual(results, ["leader"])
+
+    def test_followers_get_copies(self):
+        single_flight, release = SingleFlight(timeout=5), threading.Event()
+
+        def lookup():
+            release.wait(5)
+            return {"shortcode": "shortcode"}
+
+        workers, results, _ = self.stampede(single_flight, lookup)
+        while single_flight.stats()["followers"] < 9:
+            threading.Event().wait(0.001)
+        release.set()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(results, [{"shortcode": "shortcode"}] * 10)
+        self.assertEqual(len({id(result) for result in results}), 10)
+
+    def test_leader_interrupted(self):
+        single_flight, release = SingleFlight(timeout=5), threading.Event()
+
+        def lookup():
+            release.wait(5)
+            raise SystemExit
+
+        workers, results, errors = self.stampede(single_flight, lookup)
+        while single_flight.stats()["followers"] < 9:
+            threading.Event().wait(0.001)
+        release.set()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(results, [])
+        self.assertEqual(
+            sorted(type(error).__name__ for error in errors),
+            ["LeaderFailed"] * 9 + ["SystemExit"],
+        )
+
+
+class RecoverSingleFlightTestCase(TestCase):
+    def setUp(self):
+        URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+            expiration=(datetime.today() + timedelta(days=10)).date(),
+        )
+
+    def recover(self, shortcode):
+        serializer = RecoverURLSerializer(data={"shortcode": shortcode})
+        serializer.is_valid(raise_exception=True)
+        return serializer.get_url()
+
+    def test_lookups(self):
+        with self.assertNumQueries(1):
+            url = self.recover("shortcode")
+        self.assertEqual(url.fullname, "http://test.com")
+
+        with self.assertNumQueries(1), self.assertRaises(Http404):
+            self.recover("notfound")
+        self.assertEqual(get_single_flight().stats()["in_flight"], 0)
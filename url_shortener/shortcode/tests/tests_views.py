@@ -1,16 +1,22 @@
 import json
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from datetime import datetime, timedelta
-from shortcode.models import URL
+from shortcode.dedup import get_dedup_cache
+from shortcode.models import URL, Tracking
+from shortcode.querylog import QueryBudgetExceeded, query_shapes
+from shortcode.tests.helpers import QueryBudgetTestMixin
+from shortcode.visitors import flush_visits, get_visit_buffer
 
 
-class ShortenerViewTestCase(TestCase):
+class ShortenerViewTestCase(QueryBudgetTestMixin, TestCase):
     def setUp(self):
         self.description = "description"
         self.shortcode = "shortcode"
         self.url = "https://test.com?abc2=123asd&aaa=11212"
         self.content_type = "application/json"
+        get_visit_buffer().clear()
 
     def test_valid_POST(self):
         resp = self.client.post(
@@ -25,6 +31,26 @@ class ShortenerViewTestCase(TestCase):
         )
         self.assertEqual(resp.status_code, 201)
 
+    def test_POST_deactivated_url_is_new(self):
+        get_dedup_cache().clear()
+        data = json.dumps({"description": self.description, "url": self.url})
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(
+                reverse("create"), data, content_type=self.content_type
+            ).json()["url"]
+        URL.objects.filter(shortcode=first["shortcode"]).update(active=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                reverse("create"), data, content_type=self.content_type
+            )
+
+        self.assertTrue(resp.json()["is_new"])
+        second = resp.json()["url"]["shortcode"]
+        self.assertNotEqual(second, first["shortcode"])
+        self.assertEqual(self.client.get(f"/{first['shortcode']}").status_code, 404)
+        self.assertEqual(self.client.get(f"/{second}").status_code, 200)
+
     def test_valid_POST_with_shortcode(self):
         resp = self.client.post(
             reverse("create"),
@@ -83,6 +109,19 @@ class ShortenerViewTestCase(TestCase):
         )
         self.assertEqual(resp.status_code, 400)
 
+    def test_invalid_POST_url_control_characters(self):
+        resp = self.client.post(
+            reverse("create"),
+            json.dumps(
+                {
+                    "description": self.description,
+                    "url": 'https://test.com?a=";\n/pwned "http://evil.com";',
+                }
+            ),
+            content_type=self.content_type,
+        )
+        self.assertEqual(resp.status_code, 400)
+
     def test_invalid_POST_json(self):
         resp = self.client.post(
             reverse("create"),
@@ -105,3 +144,134 @@ class ShortenerViewTestCase(TestCase):
     def test_recover_GET_invalid(self):
         resp = self.client.get(f"/{self.shortcode}")
         self.assertEqual(resp.status_code, 404)
+
+    def test_visitors_GET_valid(self):
+        URL.objects.create(
+            description=self.description,
+            shortcode=self.shortcode,
+            fullname=self.url,
+            name="name",
+        )
+        self.client.get(f"/{self.shortcode}", REMOTE_ADDR="10.0.0.1")
+        self.client.get(f"/{self.shortcode}", REMOTE_ADDR="10.0.0.2")
+        self.client.get(f"/{self.shortcode}", REMOTE_ADDR="10.0.0.1")
+        flush_visits()
+
+        resp = self.client.get(reverse("visitors", args=[self.shortcode]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["unique_visitors"], 2)
+
+    def test_visitors_GET_invalid_range(self):
+        URL.objects.create(
+            description=self.description,
+            shortcode=self.shortcode,
+            fullname=self.url,
+            name="name",
+        )
+
+        resp = self.client.get(
+            reverse("visitors", args=[self.shortcode]),
+            {"start": "03/06/2022", "end": "03/05/2022"},
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_visitors_GET_not_found(self):
+        resp = self.client.get(reverse("visitors", args=[self.shortcode]))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_visitors_GET_shortcode_param_ignored(self):
+        URL.objects.create(
+            description=self.description,
+            shortcode="BBBBBB",
+            fullname=self.url,
+            name="name",
+        )
+
+        resp = self.client.get(
+            reverse("visitors", args=[self.shortcode]), {"shortcode": "BBBBBB"}
+        )
+        self.assertEqual(resp.status_code, 404)
+
+    def test_create_query_budget(self):
+        data = json.dumps(
+            {"description": self.description, "url": self.url, "shortcode": "shortcode"}
+        )
+
+        with self.assertWithinQueryBudget("Create") as recorder:
+            resp = self.client.post(
+                reverse("create"), data, content_type=self.content_type
+            )
+        self.assertEqual(resp.status_code, 201)
+        self.assertGreater(recorder.count, 0)
+
+    def test_recover_query_budget(self):
+        URL.objects.create(
+            description=self.description,
+            shortcode=self.shortcode,
+            fullname=self.url,
+        )
+        self.client.get(f"/{self.shortcode}")
+
+        with self.assertWithinQueryBudget("Recover"):
+            resp = self.client.get(f"/{self.shortcode}")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_strict_budget_fails_before_the_query(self):
+        URL.objects.create(
+            description=self.description,
+            shortcode=self.shortcode,
+            fullname=self.url,
+        )
+        budgets = {"Recover": {"QUERIES": 0, "TIME_MS": 100}}
+
+        with override_settings(QUERY_BUDGETS=budgets):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(f"/{self.shortcode}")
+        self.assertFalse(Tracking.objects.exists())
+
+    def test_query_shapes_of_requests_over_budget(self):
+        URL.objects.create(
+            description=self.description,
+            shortcode=self.shortcode,
+            fullname=self.url,
+        )
+        query_shapes.clear()
+
+        with override_settings(QUERY_BUDGET_STRICT=False, SLOW_QUERY_MS=10000):
+            self.client.get(f"/{self.shortcode}")
+            self.assertEqual(query_shapes.slowest(), [])
+            budgets = {"Recover": {"QUERIES": 0, "TIME_MS": 100}}
+            with override_settings(QUERY_BUDGETS=budgets):
+                with self.assertLogs("shortcode.querylog", "WARNING"):
+                    self.client.get(f"/{self.shortcode}")
+        self.assertTrue(query_shapes.slowest())
+        self.assertTrue(all("?" in sql for sql, _ in query_shapes.slowest()))
+        query_shapes.clear()
+
+
+class RecoverQueryBudgetTestCase(QueryBudgetTestMixin, TransactionTestCase):
+    """
+    Outside of a test transaction, as in production: BEGIN and COMMIT of the
+    request's transactions aren't counted
+    """
+
+    def test_recover_query_budget(self):
+        URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="https://test.com",
+        )
+        for _ in range(2):
+            with self.assertWithinQueryBudget("Recover"):
+                resp = self.client.get("/shortcode", REMOTE_ADDR="10.0.0.1")
+            self.assertEqual(resp.status_code, 200)
+
+
+class OperationalViewsTestCase(TestCase):
+    def test_slowest_queries_for_staff(self):
+        self.assertEqual(self.client.get(reverse("slowest-queries")).status_code, 403)
+
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(staff)
+        resp = self.client.get(reverse("slowest-queries"))
+        self.assertEqual(resp.status_code, 200)
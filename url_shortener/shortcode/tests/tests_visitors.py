@@ -0,0 +1,113 @@
+import random
+import time
+from datetime import date
+from unittest import mock
+
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from shortcode.hll import HASH_BITS, HyperLogLog
+from shortcode.models import URL, Tracking, VisitorSketch
+from shortcode.tracking import get_client_fingerprint, record_request
+from shortcode.visitors import (
+    VisitBuffer,
+    add_visits,
+    flush_visits,
+    get_visit_buffer,
+    unique_visitors,
+)
+
+
+class HyperLogLogTestCase(TestCase):
+    def setUp(self):
+        self.random = random.Random(7)
+
+    def random_hashes(self, length):
+        return [self.random.getrandbits(HASH_BITS) for _ in range(length)]
+
+    def test_count_small(self):
+        hll = HyperLogLog()
+        for value in self.random_hashes(100) * 3:
+            hll.add(value)
+        self.assertAlmostEqual(hll.count(), 100, delta=3)
+
+    def test_count_large(self):
+        hll = HyperLogLog()
+        for value in self.random_hashes(50000):
+            hll.add(value)
+        self.assertAlmostEqual(hll.count(), 50000, delta=50000 * 0.05)
+
+    def test_merge(self):
+        hashes = self.random_hashes(2000)
+        first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for value in hashes[:1500]:
+            first.add(value)
+        for value in hashes[500:]:
+            second.add(value)
+        for value in hashes:
+            both.add(value)
+
+        first.merge(second.to_bytes())
+        self.assertEqual(first.to_bytes(), both.to_bytes())
+
+
+class VisitorsTestCase(TestCase):
+    def setUp(self):
+        self.url = URL.objects.create(
+            description="description",
+            shortcode="shortcode",
+            fullname="http://test.com",
+            name="http://test.com",
+        )
+        get_visit_buffer().clear()
+
+    def test_fingerprint_is_keyed_hash(self):
+        factory = RequestFactory()
+        request = factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_USER_AGENT="agent")
+        other = factory.get("/", REMOTE_ADDR="10.0.0.2", HTTP_USER_AGENT="agent")
+
+        fingerprint = get_client_fingerprint(request)
+        self.assertEqual(fingerprint, get_client_fingerprint(request))
+        self.assertNotEqual(fingerprint, get_client_fingerprint(other))
+        self.assertLess(fingerprint, 1 << HASH_BITS)
+
+    def test_record_request_buffers_visit(self):
+        first, second = random.Random(7).getrandbits(HASH_BITS), 1 << 62
+        with self.assertNumQueries(1):
+            record_request(self.url, fingerprint=first)
+        record_request(self.url, fingerprint=first)
+        record_request(self.url, fingerprint=second)
+
+        self.assertEqual(Tracking.objects.filter(fingerprint=first).count(), 2)
+        self.assertFalse(VisitorSketch.objects.exists())
+        self.assertEqual(flush_visits(), 1)
+        self.assertEqual(
+            unique_visitors(self.url, timezone.now().date(), timezone.now().date()),
+            2,
+        )
+        self.assertEqual(flush_visits(), 0)
+
+    def test_flush_thread(self):
+        buffer = VisitBuffer(flush_interval=60, max_pending=2)
+        with mock.patch("shortcode.visitors.add_visits") as add_visits_mock:
+            buffer.add(self.url.pk, date(2022, 3, 5), 1)
+            buffer.add(self.url.pk, date(2022, 3, 5), 2)
+            for _ in range(200):
+                if add_visits_mock.called:
+                    break
+                time.sleep(0.01)
+        add_visits_mock.assert_called_once_with(
+            self.url.pk, date(2022, 3, 5), {1, 2}, using="default"
+        )
+        buffer.pid = None
+        buffer.wakeup.set()
+
+    def test_unique_visitors_by_range(self):
+        rand = random.Random(7)
+        fingerprints = [rand.getrandbits(HASH_BITS) for _ in range(2500)]
+        add_visits(self.url.pk, date(2022, 3, 5), fingerprints[:1000])
+        add_visits(self.url.pk, date(2022, 3, 6), fingerprints[500:1500])
+        add_visits(self.url.pk, date(2022, 3, 7), fingerprints[1500:])
+
+        visitors = unique_visitors(self.url, date(2022, 3, 5), date(2022, 3, 6))
+        self.assertAlmostEqual(visitors, 1500, delta=1500 * 0.05)
@@ -0,0 +1,79 @@
+import hashlib
+
+from django.conf import settings
+from django.utils import timezone
+
+from shortcode.geoip import BATCH, INLINE, get_geoip_database
+from shortcode.models import Tracking
+from shortcode.segments import SegmentWriter
+from shortcode.visitors import get_visit_buffer
+
+"""Sinks allowed for TRACKING_SINK"""
+DATABASE_SINK = "database"
+SEGMENTS_SINK = "segments"
+
+_segment_writer = None
+
+
+def get_segment_writer():
+    """
+    Returns the segment writer of this process
+    """
+    global _segment_writer
+    if _segment_writer is None:
+        _segment_writer = SegmentWriter(
+            settings.TRACKING_SEGMENT_DIR,
+            max_records=settings.TRACKING_SEGMENT_MAX_RECORDS,
+            max_age=settings.TRACKING_SEGMENT_MAX_AGE,
+        )
+    return _segment_writer
+
+
+def get_client_fingerprint(request):
+    """
+    Returns a keyed hash (63 bits) of the client IP and user agent, so the
+    raw values are never stored. None if the request has neither
+    """
+    ip = request.META.get("REMOTE_ADDR", "")
+    user_agent = request.META.get("HTTP_USER_AGENT", "")
+    if not ip and not user_agent:
+        return None
+    digest = hashlib.blake2b(
+        f"{ip}\n{user_agent}".encode(),
+        digest_size=8,
+        key=settings.FINGERPRINT_KEY.encode()[:64],
+    ).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+def get_client_ip(request):
+    """
+    Returns the client IP, only used to locate it (GEOIP_ENRICHMENT)
+    """
+    return request.META.get("REMOTE_ADDR") or None
+
+
+def record_request(url, fingerprint=None, ip=None):
+    """
+    Saves a request of an URL in the configured sink:
+        database: a Tracking row, and the fingerprint buffered for the sketch of the day
+        segments: a record in a segment file, folded later by compact_tracking_segments
+    The client IP is located now (GEOIP_ENRICHMENT inline) or saved to be located
+    by enrich_tracking (batch). Segment records aren't located
+    """
+    requested = timezone.now()
+    if settings.TRACKING_SINK == SEGMENTS_SINK:
+        get_segment_writer().append(url.pk, requested, fingerprint)
+        return None
+    tracking = Tracking(url=url, requested=requested, fingerprint=fingerprint)
+    if ip and settings.GEOIP_ENRICHMENT == INLINE:
+        database = get_geoip_database()
+        location = database.lookup(ip) if database is not None else None
+        if location is not None:
+            tracking.country, tracking.region = location
+    elif ip and settings.GEOIP_ENRICHMENT == BATCH:
+        tracking.ip = ip
+    tracking.save()
+    if fingerprint is not None:
+        get_visit_buffer().add(url.pk, requested.date(), fingerprint)
+    return tracking
@@ -3,5 +3,13 @@ from shortcode import views
 
 urlpatterns = [
     path("create", views.Create.as_view(), name="create"),
+    path("admission/stats", views.AdmissionStats.as_view(), name="admission-stats"),
+    path(
+        "invalidation/stats",
+        views.InvalidationStats.as_view(),
+        name="invalidation-stats",
+    ),
+    path("queries/slowest", views.SlowestQueries.as_view(), name="slowest-queries"),
     path("<slug:shortcode>", views.Recover.as_view(), name="shortcode"),
+    path("<slug:shortcode>/visitors", views.Visitors.as_view(), name="visitors"),
 ]
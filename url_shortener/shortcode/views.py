@@ -2,10 +2,22 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
-from shortcode.serializers import CreateURLSerializer, RecoverURLSerializer
+from shortcode.admission import CREATE, RESOLVE, AdmissionControlMixin, get_controller
+from shortcode.invalidation import get_bus
+from shortcode.permissions import IsStaffOrDebug
+from shortcode.querylog import QueryBudgetMixin, query_shapes
+from shortcode.renderers import resolve_response
+from shortcode.serializers import (
+    CreateURLSerializer,
+    RecoverURLSerializer,
+    VisitorsSerializer,
+)
+from shortcode.tracking import get_client_fingerprint, get_client_ip
 
 
-class Create(APIView):
+class Create(QueryBudgetMixin, AdmissionControlMixin, APIView):
+    admission_kind = CREATE
+
     def post(self, request):
         serializer = CreateURLSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -18,10 +30,48 @@ class Create(APIView):
         )
 
 
-class Recover(APIView):
+class Recover(QueryBudgetMixin, AdmissionControlMixin, APIView):
+    admission_kind = RESOLVE
+
     def get(self, request, shortcode):
         serializer = RecoverURLSerializer(data={"shortcode": shortcode})
         serializer.is_valid(raise_exception=True)
         url = serializer.get_url()
-        serializer.create_tracking(url)
-        return Response(data={"url": url.fullname}, status=status.HTTP_200_OK)
+        serializer.create_tracking(
+            url, get_client_fingerprint(request), get_client_ip(request)
+        )
+        return resolve_response(request, url.fullname)
+
+
+class Visitors(QueryBudgetMixin, APIView):
+    def get(self, request, shortcode):
+        params = request.query_params
+        data = {key: params[key] for key in ("start", "end") if key in params}
+        serializer = VisitorsSerializer(data={**data, "shortcode": shortcode})
+        serializer.is_valid(raise_exception=True)
+        visitors = serializer.get_unique_visitors()
+        return Response(data=visitors, status=status.HTTP_200_OK)
+
+
+class AdmissionStats(APIView):
+    permission_classes = [IsStaffOrDebug]
+
+    def get(self, request):
+        return Response(data=get_controller().stats(), status=status.HTTP_200_OK)
+
+
+class InvalidationStats(APIView):
+    permission_classes = [IsStaffOrDebug]
+
+    def get(self, request):
+        bus = get_bus()
+        data = bus.stats() if bus is not None else {"healthy": False}
+        return Response(data=data, status=status.HTTP_200_OK)
+
+
+class SlowestQueries(APIView):
+    permission_classes = [IsStaffOrDebug]
+
+    def get(self, request):
+        shapes = [{"sql": sql, **stats} for sql, stats in query_shapes.slowest()]
+        return Response(data=shapes, status=status.HTTP_200_OK)
@@ -0,0 +1,178 @@
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from shortcode.hll import HyperLogLog
+from shortcode.models import VisitorSketch
+
+logger = logging.getLogger(__name__)
+
+
+def add_visits(url_id, day, fingerprints, using=DEFAULT_DB_ALIAS):
+    """
+    Adds client fingerprints to the sketch of an URL and a day (in the database
+    `using`).
+    The row is only written when a register changes, which becomes rare
+    once a sketch has seen a few thousand clients
+    """
+    fingerprints = list(fingerprints)
+
+    def new_registers():
+        hll = HyperLogLog()
+        for fingerprint in fingerprints:
+            hll.add(fingerprint)
+        return hll.to_bytes()
+
+    with transaction.atomic(using=using):
+        sketches = VisitorSketch.objects.using(using).select_for_update()
+        sketch, created = sketches.get_or_create(
+            url_id=url_id, day=day, defaults={"registers": new_registers}
+        )
+        if created:
+            return
+        hll = HyperLogLog(bytes(sketch.registers))
+        changed = False
+        for fingerprint in fingerprints:
+            changed = hll.add(fingerprint) or changed
+        if changed:
+            sketch.registers = hll.to_bytes()
+            sketch.save(using=using, update_fields=["registers"])
+
+
+class VisitBuffer:
+    """
+    Fingerprints of this process by (url id, day), folded into the sketches
+    by a thread every `flush_interval` seconds or once `max_pending` are
+    buffered. Requests don't touch (nor lock) the sketch rows. Without a
+    `flush_interval` there's no thread, flush() folds them. The sketches are
+    written through the connection `using`.
+    Folding is idempotent, a forked process flushing the parent's buffered
+    fingerprints again doesn't change the counts
+    """
+
+    def __init__(self, flush_interval=5, max_pending=10000, using=DEFAULT_DB_ALIAS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = defaultdict(set)
+        self.count = 0
+        self.wakeup = threading.Event()
+        self.pid = None
+        self.using = using
+
+    def add(self, url_id, day, fingerprint):
+        with self.lock:
+            self.pending[(url_id, day)].add(fingerprint)
+            self.count += 1
+            full = self.count >= self.max_pending
+            if self.flush_interval and self.pid != os.getpid():
+                self.pid = os.getpid()
+                threading.Thread(target=self.run, daemon=True).start()
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """
+        Folds the buffered fingerprints into the sketches, one transaction by
+        sketch. Returns the number of sketches
+        """
+        pending = self.clear()
+        for (url_id, day), fingerprints in pending.items():
+            add_visits(url_id, day, fingerprints, using=self.using)
+        return len(pending)
+
+    def clear(self):
+        """
+        Drops the buffered fingerprints and returns them
+        """
+        with self.lock:
+            pending, self.pending, self.count = self.pending, defaultdict(set), 0
+        return pending
+
+    def run(self):
+        while self.pid == os.getpid():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Buffered visits couldn't be flushed")
+            finally:
+                connections.close_all()
+
+    def after_fork_in_child(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+
+_visit_buffer = None
+
+
+def get_visit_buffer():
+    """
+    Returns the visit buffer of this process (VISITOR_SKETCHES)
+    """
+    global _visit_buffer
+    if _visit_buffer is None:
+        config = settings.VISITOR_SKETCHES
+        _visit_buffer = VisitBuffer(config["FLUSH_INTERVAL"], config["MAX_PENDING"])
+    return _visit_buffer
+
+
+def flush_visits():
+    """
+    Folds the visits buffered by this process. Returns the number of sketches
+    """
+    return get_visit_buffer().flush()
+
+
+def reset_visit_buffer(setting, **kwargs):
+    """
+    Drops the buffer when VISITOR_SKETCHES changes (tests)
+    """
+    global _visit_buffer
+    if setting == "VISITOR_SKETCHES":
+        _visit_buffer = None
+
+
+def flush_at_exit():
+    """
+    Flushes the buffer of a process that flushes in a thread (not the tests)
+    """
+    if _visit_buffer is not None and _visit_buffer.pid == os.getpid():
+        try:
+            _visit_buffer.flush()
+        except Exception:
+            logger.exception("Buffered visits couldn't be flushed at exit")
+
+
+def visit_buffer_after_fork():
+    if _visit_buffer is not None:
+        _visit_buffer.after_fork_in_child()
+
+
+setting_changed.connect(reset_visit_buffer)
+atexit.register(flush_at_exit)
+os.register_at_fork(after_in_child=visit_buffer_after_fork)
+
+
+def unique_visitors(url, start, end):
+    """
+    Returns the approximate number of distinct clients of an URL between two
+    days (both included), merging one sketch per day
+    """
+    hll = HyperLogLog()
+    registers = (
+        VisitorSketch.objects.filter(url=url, day__range=(start, end))
+        .values_list("registers", flat=True)
+        .iterator()
+    )
+    for day_registers in registers:
+        hll.merge(bytes(day_registers))
+    return hll.count()
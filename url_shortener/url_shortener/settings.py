@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 from pathlib import Path
-import environ
+import environ, tempfile
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -79,10 +79,7 @@ WSGI_APPLICATION = "url_shortener.wsgi.application"
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": env.db("DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
 }
 
 
@@ -127,4 +124,156 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-REST_FRAMEWORK = {"DATE_INPUT_FORMATS": ["%m/%d/%Y"]}
+REST_FRAMEWORK = {
+    "DATE_INPUT_FORMATS": ["%m/%d/%Y"],
+    "DEFAULT_RENDERER_CLASSES": [
+        "shortcode.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "shortcode.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    "DEFAULT_CONTENT_NEGOTIATION_CLASS": "shortcode.renderers.FastJSONNegotiation",
+}
+
+# Tracking partitions (native partitioning on Postgres)
+# granularity: "day" or "month"
+# ahead: periods created in advance after the current one
+# retention: periods kept (counting the current one), 0 keeps everything
+
+TRACKING_PARTITION_GRANULARITY = env.str(
+    "TRACKING_PARTITION_GRANULARITY", default="month"
+)
+TRACKING_PARTITIONS_AHEAD = env.int("TRACKING_PARTITIONS_AHEAD", default=2)
+TRACKING_PARTITION_RETENTION = env.int("TRACKING_PARTITION_RETENTION", default=0)
+
+# Tracking sink
+# "database": a Tracking row per request
+# "segments": binary records appended to segment files in TRACKING_SEGMENT_DIR,
+#   folded into Tracking by `python manage.py compact_tracking_segments`
+
+TRACKING_SINK = env.str("TRACKING_SINK", default="database")
+TRACKING_SEGMENT_DIR = env.str(
+    "TRACKING_SEGMENT_DIR", default=str(BASE_DIR / "segments")
+)
+TRACKING_SEGMENT_MAX_RECORDS = env.int("TRACKING_SEGMENT_MAX_RECORDS", default=65536)
+TRACKING_SEGMENT_MAX_AGE = env.int("TRACKING_SEGMENT_MAX_AGE", default=60)
+
+# Key of the client fingerprints (hash of IP and user agent) used to count unique visitors
+
+FINGERPRINT_KEY = env.str("FINGERPRINT_KEY", default=SECRET_KEY)
+
+# Visitor sketches: each process buffers the fingerprints of its requests and folds them into
+# the sketches every FLUSH_INTERVAL seconds (None: only when flushed explicitly) or once
+# MAX_PENDING are buffered, so requests don't lock the sketch of a popular link.
+
+VISITOR_SKETCHES = {
+    "FLUSH_INTERVAL": env.float("VISITOR_FLUSH_INTERVAL", default=5),
+    "MAX_PENDING": env.int("VISITOR_MAX_PENDING", default=10000),
+}
+
+# URL storage
+# intern hosts: save the scheme and host of the URLs once in the Host table
+# compress query min length: queryparams this long are compressed (0 disables it)
+
+URL_INTERN_HOSTS = env.bool("URL_INTERN_HOSTS", default=True)
+URL_COMPRESS_QUERY_MIN_LENGTH = env.int("URL_COMPRESS_QUERY_MIN_LENGTH", default=256)
+
+# Admission control for /create and /:shortcode (per process)
+# token buckets by client and global (rate per second and burst) for each kind of request,
+# then at most MAX_IN_FLIGHT requests doing DB work, MAX_QUEUE waiting up to QUEUE_TIMEOUT
+# seconds (resolves first). Creates can't use the last RESERVED_FOR_RESOLVES slots.
+# Off by default: clients are keyed by REMOTE_ADDR, so users behind a NAT share a bucket
+# and behind a reverse proxy every client does; raise the client rates to fit before enabling.
+
+ADMISSION_CONTROL = {
+    "ENABLED": env.bool("ADMISSION_CONTROL_ENABLED", default=False),
+    "RESOLVE": {
+        "CLIENT_RATE": 50,
+        "CLIENT_BURST": 200,
+        "GLOBAL_RATE": 2000,
+        "GLOBAL_BURST": 5000,
+    },
+    "CREATE": {
+        "CLIENT_RATE": 5,
+        "CLIENT_BURST": 50,
+        "GLOBAL_RATE": 200,
+        "GLOBAL_BURST": 500,
+    },
+    "MAX_CLIENTS": 100000,
+    "MAX_IN_FLIGHT": env.int("ADMISSION_MAX_IN_FLIGHT", default=8),
+    "MAX_QUEUE": env.int("ADMISSION_MAX_QUEUE", default=64),
+    "QUEUE_TIMEOUT": 0.5,
+    "RESERVED_FOR_RESOLVES": 2,
+}
+
+# Query budgets by view: queries and time in the database for a request.
+# Exceeding one logs a warning. With QUERY_BUDGET_STRICT (set by test_settings) the first
+# query over the budget fails the request before it runs, the time is always a warning (it
+# depends on the machine). Queries slower than SLOW_QUERY_MS are logged with their EXPLAIN.
+
+QUERY_BUDGETS = {
+    "Create": {"QUERIES": 5, "TIME_MS": 250},
+    "Recover": {"QUERIES": 4, "TIME_MS": 100},
+    "Visitors": {"QUERIES": 2, "TIME_MS": 250},
+}
+QUERY_BUDGET_STRICT = env.bool("QUERY_BUDGET_STRICT", default=False)
+SLOW_QUERY_MS = env.int("SLOW_QUERY_MS", default=100)
+
+# Dedup cache for /create: hash of the canonical URL -> (shortcode, expiration), checked
+# before the database. MAX_SIZE entries per process (least recently used are dropped), and
+# optionally a tier shared by the processes: SHARED_CACHE alias of CACHES, TIMEOUT seconds.
+
+DEDUP_CACHE = {
+    "ENABLED": env.bool("DEDUP_CACHE_ENABLED", default=True),
+    "MAX_SIZE": env.int("DEDUP_CACHE_MAX_SIZE", default=10000),
+    "SHARED_CACHE": env.str("DEDUP_SHARED_CACHE", default=None),
+    "TIMEOUT": 3600,
+}
+
+# Shortcode table: file with the resolvable URLs written by load_shortcode_table and
+# memory-mapped by every worker (put it in /dev/shm to keep it in memory), checked before
+# the database by /:shortcode. Workers map a new generation within CHECK_INTERVAL seconds.
+
+SHORTCODE_TABLE = env.str("SHORTCODE_TABLE", default=None)
+SHORTCODE_TABLE_CHECK_INTERVAL = env.float("SHORTCODE_TABLE_CHECK_INTERVAL", default=1)
+
+# Invalidation bus: URL changes (post_save, post_delete and bulk operations) are sent to
+# every process through Unix datagram sockets in DIRECTORY, batched every FLUSH_INTERVAL
+# seconds, and evicted from their dedup cache and shortcode table. While a process has no
+# bus (it's off by default), cached entries live FALLBACK_TTL seconds, with it MAX_TTL at
+# most in case an event was lost. DIRECTORY should be
+# a runtime directory shared by the workers of a host (e.g. /run/url_shortener).
+# URL.objects.update() locks, reads and updates the URLs by batches of UPDATE_BATCH_SIZE.
+
+INVALIDATION_BUS = {
+    "ENABLED": env.bool("INVALIDATION_BUS_ENABLED", default=False),
+    "DIRECTORY": env.str(
+        "INVALIDATION_BUS_DIRECTORY",
+        default=str(Path(tempfile.gettempdir()) / "url_shortener-invalidation"),
+    ),
+    "FLUSH_INTERVAL": 0.005,
+    "UPDATE_BATCH_SIZE": 1000,
+    "MAX_DATAGRAM": 32768,
+    "FALLBACK_TTL": env.int("INVALIDATION_FALLBACK_TTL", default=60),
+    "MAX_TTL": env.int("INVALIDATION_MAX_TTL", default=3600),
+}
+
+# IP geolocation of Tracking, from a database compiled by compile_geoip (no network).
+# "off": not located
+# "inline": located when the request is recorded, the IP isn't saved
+# "batch": the IP is saved and enrich_tracking locates it later and clears it
+
+GEOIP_DATABASE = env.str("GEOIP_DATABASE", default=None)
+GEOIP_ENRICHMENT = env.str("GEOIP_ENRICHMENT", default="off")
+
+# Single flight: concurrent database lookups of the same shortcode in a process (threads or
+# asyncio tasks) wait for the first one and share its URL or 404. A lookup waits at most
+# TIMEOUT seconds, then queries the database itself.
+
+SINGLE_FLIGHT = {
+    "ENABLED": env.bool("SINGLE_FLIGHT_ENABLED", default=True),
+    "TIMEOUT": env.float("SINGLE_FLIGHT_TIMEOUT", default=2),
+}
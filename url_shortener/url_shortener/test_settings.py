@@ -0,0 +1,13 @@
+"""
+Settings of the test suite: python manage.py test --settings=url_shortener.test_settings
+"""
+from url_shortener.settings import *  # noqa: F401,F403
+
+# a view running more queries than its budget fails the test
+QUERY_BUDGET_STRICT = True
+
+# visits are folded by flush_visits(), no thread writes to the test database
+VISITOR_SKETCHES = {**VISITOR_SKETCHES, "FLUSH_INTERVAL": None}  # noqa: F405
+
+# tests start their own buses in temporary directories, never the one of a server
+INVALIDATION_BUS = {**INVALIDATION_BUS, "ENABLED": False}  # noqa: F405